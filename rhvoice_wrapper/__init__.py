@@ -1,4 +1,4 @@
+from .rhvoice_wrapper import TTS, Event, WorkerCrashError
+from .async_tts import AsyncTTS
 
-from .rhvoice_wrapper import TTS
-
-__all__ = ['TTS']
+__all__ = ['TTS', 'AsyncTTS', 'Event', 'WorkerCrashError']
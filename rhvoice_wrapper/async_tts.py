@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+import asyncio
+import os
+import time
+
+from rhvoice_wrapper.rhvoice_wrapper import (
+    TTS, DEFAULT_CHUNK_SIZE, DEFAULT_FORMAT, _Cancel, _Rechunker, _with_sample_rate
+)
+
+
+class _Reader:
+    def __init__(self, worker, loop):
+        self._worker = worker
+        self._loop = loop
+
+    async def request(self, text, voice, format_, chunk_size, sets):
+        raise NotImplementedError
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        raise NotImplementedError
+
+
+class _FdReader(_Reader):
+    # Stream with descriptor, waiting in the event loop
+    def __init__(self, worker, loop):
+        super().__init__(worker, loop)
+        # noinspection PyProtectedMember
+        self._stream = worker._worker
+        self._fd = self._stream.fileno()
+
+    async def request(self, text, voice, format_, chunk_size, sets):
+        # noinspection PyProtectedMember
+        self._worker._send_request(text, voice, format_, chunk_size, sets)
+        while not self._worker.request_started():
+            await self._readable()
+        self._worker.check_crash()
+        # noinspection PyProtectedMember
+        if self._worker._sent is not None:
+            self._worker.observe_started()
+
+    async def __anext__(self) -> bytes:
+        while True:
+            chunk = self._stream.get_nowait()
+            if chunk is None:
+                await self._readable()
+            elif chunk:
+                # noinspection PyProtectedMember
+                if self._worker._sent is not None:
+                    self._worker.observe_chunk()
+                return chunk
+            else:
+                self._worker.check_crash()
+                raise StopAsyncIteration
+
+    async def _readable(self):
+        ready = self._loop.create_future()
+        self._loop.add_reader(self._fd, ready.set_result, None)
+        try:
+            await ready
+        finally:
+            self._loop.remove_reader(self._fd)
+        # Remove wakeups, state will be checked again
+        os.read(self._fd, 65536)
+
+
+class _ExecutorReader(_Reader):
+    # Stream without descriptor (queues), blocking calls in a default executor
+    def __init__(self, worker, loop):
+        super().__init__(worker, loop)
+        # noinspection PyProtectedMember
+        self._gen = worker._iter_me()
+
+    async def request(self, text, voice, format_, chunk_size, sets):
+        # noinspection PyProtectedMember
+        await self._loop.run_in_executor(
+            None, self._worker._client_request, text, voice, format_, chunk_size, sets
+        )
+
+    async def __anext__(self) -> bytes:
+        chunk = await self._loop.run_in_executor(None, next, self._gen, None)
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+
+class _Splitter:
+    # Split to chunks by chunk_size and flush after max_latency, as TTS.say
+    def __init__(self, reader, chunk_size, max_latency):
+        self._reader = reader
+        self._rechunker = _Rechunker(chunk_size)
+        self._max_latency = max_latency
+        self._chunks = []
+        # Reading isn't cancelled by latency timeout, it continues in next call
+        self._next = None
+        self._deadline = None
+        self._end = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        while not self._chunks and not self._end:
+            if self._next is None:
+                self._next = asyncio.ensure_future(self._reader.__anext__())
+            timeout = None if self._deadline is None else max(0.0, self._deadline - time.monotonic())
+            done, _ = await asyncio.wait({self._next}, timeout=timeout)
+            if not done:
+                self._deadline = None
+                return self._rechunker.flush()
+            task, self._next = self._next, None
+            try:
+                chunks = self._rechunker.feed(task.result())
+            except StopAsyncIteration:
+                self._end = True
+                break
+            if self._max_latency and self._rechunker.pending and (chunks or self._deadline is None):
+                self._deadline = time.monotonic() + self._max_latency
+            elif not self._rechunker.pending:
+                self._deadline = None
+            self._chunks.extend(chunks)
+        if self._chunks:
+            return self._chunks.pop(0)
+        tail = self._rechunker.flush()
+        if not tail:
+            raise StopAsyncIteration
+        return tail
+
+    async def aclose(self):
+        if self._next is not None:
+            self._next.cancel()
+            self._next = None
+
+
+class _Cached:
+    # Cache hit, chunks without worker
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Store:
+    # Cache miss, save audio if it was read to the end
+    def __init__(self, gen, cache, key, cancel):
+        self._gen = gen
+        self._cache = cache
+        self._key = key
+        self._cancel = cancel
+        self._chunks = []
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            chunk = await self._gen.__anext__()
+        except StopAsyncIteration:
+            if self._chunks and not self._cancel.cancelled:
+                self._cache.put(self._key, b''.join(self._chunks))
+                self._chunks = []
+            raise
+        self._chunks.append(chunk)
+        return chunk
+
+
+class _Cancellable:
+    # Iteration stops after cancel
+    def __init__(self, gen, cancel):
+        self._gen = gen
+        self._cancel = cancel
+        self.done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        if not self._cancel.cancelled:
+            try:
+                chunk = await self._gen.__anext__()
+            except StopAsyncIteration:
+                self.done = True
+                raise
+            if not self._cancel.cancelled:
+                return chunk
+        raise StopAsyncIteration
+
+
+class _Say:
+    """Context manager of AsyncTTS.say, cancel() stops generation. Exit before the end cancels it too."""
+    def __init__(self, owner, text, voice, format_, buff, sets, max_latency=None):
+        self._owner = owner
+        self._args = text, voice, format_ or DEFAULT_FORMAT, buff, sets
+        self._max_latency = max_latency
+        self._worker = None
+        self._splitter = None
+        self._cancel = _Cancel()
+        self._gen = None
+
+    async def __aenter__(self):
+        text, voice, format_, buff, sets = self._args
+        # noinspection PyProtectedMember
+        key = self._owner._cache_key(text, voice, format_, sets)
+        if key is not None:
+            data = self._owner.cache.get(key)
+            if data is not None:
+                # noinspection PyProtectedMember
+                return _Cached(self._owner._split_cached(data, buff))
+        # noinspection PyProtectedMember
+        self._worker = await self._owner._acquire()
+        self._cancel.add(self._worker.cancel)
+        try:
+            # noinspection PyProtectedMember
+            is_stream = self._worker._is_stream
+            loop = asyncio.get_event_loop()
+            # noinspection PyProtectedMember
+            reader = _FdReader if self._worker._worker.fileno() is not None else _ExecutorReader
+            reader = reader(self._worker, loop)
+            await reader.request(text, voice, format_, buff if is_stream else None, sets)
+        except BaseException:
+            await self.__aexit__()
+            raise
+        gen = reader
+        if buff:
+            gen = self._splitter = _Splitter(reader, buff, self._max_latency)
+        gen = gen if key is None else _Store(gen, self._owner.cache, key, self._cancel)
+        self._gen = _Cancellable(gen, self._cancel)
+        return self._gen
+
+    async def __aexit__(self, *_):
+        if self._gen is not None and not self._gen.done:
+            self._cancel.cancel()
+        if self._splitter is not None:
+            await self._splitter.aclose()
+            self._splitter = None
+        if self._worker is not None:
+            self._cancel.remove(self._worker.cancel)
+            self._worker.client_left()
+            self._worker = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.cancelled
+
+    def cancel(self):
+        """Stop generation, audio not read is dropped. Worker is released at exit."""
+        self._cancel.cancel()
+
+
+class AsyncTTS:
+    """
+    asyncio front-end for TTS. Arguments are the same as TTS, other TTS attributes are available as is.
+    In multiprocessing stream mode audio is read by the event loop, without threads.
+    """
+    def __init__(self, *args, **kwargs):
+        self._tts = TTS(*args, **kwargs)
+
+    def __getattr__(self, item):
+        return getattr(self._tts, item)
+
+    def say(self, text, voice=None, format_=None, buff=DEFAULT_CHUNK_SIZE, sets=None, sample_rate=None,
+            max_latency=None):
+        """
+        Starting audio generation and returned it chunk by chunk
+        async with tts.say(*args, **kwargs) as gen:
+            async for chunk in gen:
+                print('new chunk, len: ', len(chunk))
+        """
+        return _Say(self, text, voice, format_, buff, _with_sample_rate(sets, sample_rate), max_latency)
+
+    async def get(self, text, voice=None, format_=None, sets=None, sample_rate=None) -> bytes:
+        """Generate and returned audio as bytes"""
+        async with self.say(text, voice, format_, None, sets, sample_rate) as gen:
+            return b''.join([chunk async for chunk in gen])
+
+    async def to_file(self, filename, text, voice=None, format_=None, sets=None, sample_rate=None):
+        """Generate and save audio in a file"""
+        with open(filename, 'wb') as fp:
+            async with self.say(text, voice, format_, None, sets, sample_rate) as gen:
+                async for chunk in gen:
+                    fp.write(chunk)
+
+    async def wait_ready(self, timeout=None) -> bool:
+        """Wait until started engines are initialized, False after timeout."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self._tts.ready_future)), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+    async def _acquire(self):
+        # Same FIFO as blocking calls, waiting without threads
+        # noinspection PyProtectedMember
+        queued = time.monotonic() if self._tts._metrics is not None else None
+        # noinspection PyProtectedMember
+        future = self._tts._dispatcher.get_async(asyncio.get_event_loop())
+        try:
+            index = await asyncio.wait_for(future, self._tts.TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError('Still busy')
+        # noinspection PyProtectedMember
+        worker = self._tts._workers[index]
+        worker.client_here(queued)
+        return worker
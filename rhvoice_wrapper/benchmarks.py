@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite. Sweeps engines count, threads or processes, stream mode, formats, text length and buff.
+Closed loop: clients repeat requests for duration, results are printed and may be saved as JSON.
+    python3 -m rhvoice_wrapper.benchmarks --threads 1,4 --formats wav,mp3 --json result.json
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import struct
+import threading
+import time
+
+from rhvoice_wrapper import TTS
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# PPS - Phrases Per Second, short phrase in wav
+########################
+# CPU            # PPS #
+# i7-8700k       #  82 #
+# i7-4770k       #  64 #
+# RaspberryPi 4B #  13 #
+# OrangePi Prime # 4.4 #
+# OrangePi Zero  # 3.5 #
+########################
+SHORT = 'Так себе, вызовы сэй будут блокировать выполнение.'
+TEXTS = {
+    'short': SHORT,
+    'medium': ' '.join([SHORT] * 5),
+    'long': ' '.join([SHORT] * 20),
+}
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values: list, p) -> float or None:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    return values[max(0, min(len(values) - 1, -(-len(values) * p // 100) - 1))]
+
+
+def _usage(pid) -> tuple:
+    # CPU seconds and RSS bytes of process, or None if unknown
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            cpu = process.cpu_times()
+            return cpu.user + cpu.system, process.memory_info().rss
+        except psutil.Error:
+            return None, None
+    try:
+        with open('/proc/{}/stat'.format(pid)) as fp:
+            # After command name, it may contain spaces
+            stat = fp.read().rsplit(')', 1)[1].split()
+        with open('/proc/{}/statm'.format(pid)) as fp:
+            rss = int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None, None
+    return (int(stat[11]) + int(stat[12])) / os.sysconf('SC_CLK_TCK'), rss
+
+
+def _pids(tts) -> dict:
+    if not tts.process:
+        # All engines in this process
+        return {'process': os.getpid()}
+    # noinspection PyProtectedMember
+    return {worker.index: worker.pid for worker in tts._workers if worker is not None}
+
+
+def audio_seconds(tts, text, voice=None) -> float:
+    """Duration of phrase, from wav header."""
+    data = tts.get(text, voice=voice, format_='wav')
+    rate = struct.unpack_from('<I', data, 24)[0]
+    return (len(data) - 44) / 2 / rate
+
+
+class _Client(threading.Thread):
+    def __init__(self, tts, text, voice, format_, buff, deadline):
+        super().__init__()
+        self._args = tts, text, voice, format_, buff
+        self._deadline = deadline
+        self.first_chunk = []
+        self.sizes = []
+        self.errors = 0
+        self.start()
+
+    def run(self):
+        tts, text, voice, format_, buff = self._args
+        while time.perf_counter() < self._deadline:
+            started, size = time.perf_counter(), 0
+            try:
+                with tts.say(text, voice=voice, format_=format_, buff=buff) as gen:
+                    for chunk in gen:
+                        if not size:
+                            self.first_chunk.append(time.perf_counter() - started)
+                        size += len(chunk)
+            except RuntimeError:
+                self.errors += 1
+                continue
+            self.sizes.append(size)
+
+
+def run_case(tts, text, format_, buff, clients, duration, voice=None, phrase_seconds=None) -> dict:
+    """One closed-loop run. Returned PPS, realtime factor, time to first chunk and usage of engines."""
+    pids = _pids(tts)
+    before = {key: _usage(pid)[0] for key, pid in pids.items()}
+    started = time.perf_counter()
+    workers = [_Client(tts, text, voice, format_, buff, started + duration) for _ in range(clients)]
+    [worker.join() for worker in workers]
+    elapsed = time.perf_counter() - started
+    first_chunk = sorted(itertools.chain.from_iterable(worker.first_chunk for worker in workers))
+    sizes = list(itertools.chain.from_iterable(worker.sizes for worker in workers))
+    usage = {}
+    for key, pid in pids.items():
+        cpu, rss = _usage(pid)
+        usage[key] = {
+            'cpu_percent': None if cpu is None or before[key] is None else (cpu - before[key]) / elapsed * 100,
+            'rss': rss,
+        }
+    phrases = len(sizes)
+    result = {
+        'phrases': phrases,
+        'errors': sum(worker.errors for worker in workers),
+        'elapsed': elapsed,
+        'pps': phrases / elapsed,
+        'realtime_factor': phrases * phrase_seconds / elapsed if phrase_seconds else None,
+        'bytes_avg': sum(sizes) / phrases if phrases else 0,
+        # Same request must produce same size
+        'sizes_stable': len(set(sizes)) <= 1,
+        'workers': usage,
+    }
+    result.update({'first_chunk_p{}'.format(p): percentile(first_chunk, p) for p in PERCENTILES})
+    return result
+
+
+def sweep(threads=(1,), modes=('thread', 'process'), streams=(True, False), formats=None, lengths=tuple(TEXTS),
+          buffs=(4096,), load=1.5, duration=10.0, voice=None, report=print, **kwargs):
+    """
+    Run all combinations, yield results.
+    :param formats: List of formats, None - all supported.
+    :param float load: Clients per engine.
+    :param report: Callable for progress lines, or None.
+    :param kwargs: Other TTS arguments, lib_path='stub' for wrapper overhead without synthesis.
+    """
+    for count, mode, stream in itertools.product(threads, modes, streams):
+        tts = TTS(threads=count, force_process=mode == 'process', stream=stream, quiet=True, **kwargs)
+        try:
+            durations = {length: audio_seconds(tts, TEXTS[length], voice) for length in lengths}
+            clients = max(1, int(count * load))
+            case_buffs = buffs if stream else (None,)
+            for format_, length, buff in itertools.product(formats or sorted(tts.formats), lengths, case_buffs):
+                case = {
+                    'threads': count, 'mode': mode, 'stream': stream, 'format': format_,
+                    'length': length, 'buff': buff, 'clients': clients,
+                }
+                if format_ not in tts.formats:
+                    case['error'] = 'Unsupported format'
+                else:
+                    case.update(run_case(tts, TEXTS[length], format_, buff, clients, duration, voice,
+                                         durations[length]))
+                if report:
+                    report(_format_case(case))
+                yield case
+        finally:
+            tts.join()
+
+
+def _format_case(case) -> str:
+    name = '{threads} {mode:7} {:3} {format:4} {length:6} {buff!s:5}'.format(
+        'yes' if case['stream'] else 'no', **case
+    )
+    if 'error' in case:
+        return '{}: {}'.format(name, case['error'])
+    first_chunk = ' '.join(
+        '{:.1f}'.format(case['first_chunk_p{}'.format(p)] * 1000) if case['first_chunk_p{}'.format(p)] else '-'
+        for p in PERCENTILES
+    )
+    return '{}: PPS {:8.3f}, RTF {:7.2f}, first chunk p50/p95/p99 {} ms'.format(
+        name, case['pps'], case['realtime_factor'] or 0, first_chunk
+    )
+
+
+def _list(type_):
+    def parse(value):
+        return [type_(x) for x in value.split(',') if x]
+    return parse
+
+
+def _bool(value) -> bool:
+    if value.lower() in ('yes', 'true', '1'):
+        return True
+    if value.lower() in ('no', 'false', '0'):
+        return False
+    raise argparse.ArgumentTypeError('Must be yes or no: {}'.format(value))
+
+
+def _system_info(tts_version) -> dict:
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'lib_version': tts_version,
+        'psutil': psutil is not None,
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='RHVoice wrapper benchmarks')
+    parser.add_argument('--threads', type=_list(int), default=[1, multiprocessing.cpu_count()],
+                        help='Engines count, comma separated. Default 1,cpu_count')
+    parser.add_argument('--modes', type=_list(str), default=['thread', 'process'], help='thread, process')
+    parser.add_argument('--stream', type=_list(_bool), default=[True, False], help='yes, no')
+    parser.add_argument('--formats', type=_list(str), default=None, help='Default all supported')
+    parser.add_argument('--lengths', type=_list(str), default=list(TEXTS), help=', '.join(TEXTS))
+    parser.add_argument('--buffs', type=_list(int), default=[4096], help='Chunk sizes for stream mode')
+    parser.add_argument('--load', type=float, default=1.5, help='Clients per engine. Default 1.5')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per case. Default 10')
+    parser.add_argument('--voice', default=None)
+    parser.add_argument('--lib-path', default=None, help='RHVoice library, stub - without synthesis')
+    parser.add_argument('--json', default=None, help='Save results to file, - for stdout')
+    args = parser.parse_args(args)
+    for length in args.lengths:
+        if length not in TEXTS:
+            parser.error('Unknown length: {}'.format(length))
+    for mode in args.modes:
+        if mode not in ('thread', 'process'):
+            parser.error('Unknown mode: {}'.format(mode))
+
+    kwargs = {'lib_path': args.lib_path} if args.lib_path else {}
+    test = TTS(threads=1, quiet=True, **kwargs)
+    system = _system_info(test.lib_version)
+    test.join()
+    report = None if args.json == '-' else print
+    if report:
+        report('Lib version: {lib_version}, CPU: {cpu_count}, {platform}'.format(**system))
+    results = list(sweep(
+        args.threads, args.modes, args.stream, args.formats, args.lengths, args.buffs, args.load, args.duration,
+        args.voice, report, **kwargs
+    ))
+    if args.json:
+        data = json.dumps({'system': system, 'results': results}, indent=2)
+        if args.json == '-':
+            print(data)
+        else:
+            with open(args.json, 'w') as fp:
+                fp.write(data)
+
+
+if __name__ == '__main__':
+    main()
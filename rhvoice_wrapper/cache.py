@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class AudioCache:
+    """
+    Two-level cache of synthesized audio: in-memory LRU limited by bytes and optional on-disk store.
+    Key is text, format, stream or blocked mode, synthesis parameters and library version, see make_key.
+    On disk audio saved once by content hash (objects), keys only refer to it (keys).
+    Disk store evicts least recently used objects when exceeding its size.
+    """
+    MEMORY_SIZE = 32 * 1024 * 1024
+    DISK_SIZE = 512 * 1024 * 1024
+    # Disk store evicts to this part of size, walking over store is not cheap
+    DISK_LOW = 0.9
+
+    def __init__(self, memory_size=MEMORY_SIZE, path=None, disk_size=DISK_SIZE):
+        """
+        :param int memory_size: Limit of memory cache in bytes, 0 - disable.
+        :param str or None path: Folder for disk store, None - disable.
+        :param int disk_size: Limit of disk store in bytes.
+        """
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_size = memory_size
+        self._memory_used = 0
+        self._path = path
+        self._disk_size = disk_size
+        self._disk_used = 0
+        self._counters = dict.fromkeys(
+            ('memory_hits', 'disk_hits', 'misses', 'stores', 'memory_evictions', 'disk_evictions'), 0
+        )
+        if self._path:
+            for folder in ('keys', 'objects'):
+                os.makedirs(os.path.join(self._path, folder), exist_ok=True)
+            self._disk_used = sum(size for _, size, _ in self._objects())
+
+    @staticmethod
+    def make_key(text: str, format_: str, params: dict, lib_version: str) -> str:
+        """
+        params - effective synthesis parameters including voice_profile, and 'stream' - True for stream mode,
+        output of stream and blocked modes differs (wav header, encoders).
+        """
+        text = ' '.join(text.split())
+        data = [text, format_, sorted(params.items()), lib_version]
+        return hashlib.sha256(json.dumps(data, ensure_ascii=False).encode()).hexdigest()
+
+    def get(self, key: str) -> bytes or None:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._counters['memory_hits'] += 1
+                return data
+        data = self._disk_get(key)
+        with self._lock:
+            if data is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['disk_hits'] += 1
+            self._memory_put(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self._counters['stores'] += 1
+            self._memory_put(key, data)
+        self._disk_put(key, data)
+
+    @property
+    def info(self) -> dict:
+        with self._lock:
+            result = self._counters.copy()
+            result.update(
+                memory_used=self._memory_used, memory_items=len(self._memory), disk_used=self._disk_used
+            )
+            return result
+
+    def _memory_put(self, key, data):
+        if len(data) > self._memory_size:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= len(old)
+        self._memory[key] = data
+        self._memory_used += len(data)
+        while self._memory_used > self._memory_size:
+            _, old = self._memory.popitem(last=False)
+            self._memory_used -= len(old)
+            self._counters['memory_evictions'] += 1
+
+    def _key_path(self, key):
+        return os.path.join(self._path, 'keys', key)
+
+    def _object_path(self, digest):
+        return os.path.join(self._path, 'objects', digest)
+
+    def _objects(self):
+        folder = os.path.join(self._path, 'objects')
+        for name in os.listdir(folder):
+            if name.startswith('.'):
+                # Not finished writing
+                continue
+            try:
+                stat = os.stat(os.path.join(folder, name))
+            except OSError:
+                continue
+            yield name, stat.st_size, stat.st_mtime
+
+    def _disk_get(self, key):
+        if not self._path:
+            return None
+        try:
+            with open(self._key_path(key)) as fp:
+                digest = fp.read()
+            with open(self._object_path(digest), 'rb') as fp:
+                data = fp.read()
+        except OSError:
+            return None
+        if hashlib.sha256(data).hexdigest() != digest:
+            # Broken object, will rewrite
+            return None
+        try:
+            # mtime as last access, for eviction
+            os.utime(self._object_path(digest))
+        except OSError:
+            pass
+        return data
+
+    def _disk_put(self, key, data):
+        if not self._path or len(data) > self._disk_size:
+            return
+        digest = hashlib.sha256(data).hexdigest()
+        try:
+            if not os.path.isfile(self._object_path(digest)):
+                self._atomic_write(self._object_path(digest), data)
+                with self._lock:
+                    self._disk_used += len(data)
+            else:
+                os.utime(self._object_path(digest))
+            self._atomic_write(self._key_path(key), digest.encode())
+        except OSError as e:
+            print('cache write error: {}'.format(e))
+            return
+        if self._disk_used > self._disk_size:
+            self._disk_evict()
+
+    @staticmethod
+    def _atomic_write(path, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            os.unlink(tmp)
+            raise
+
+    def _disk_evict(self):
+        with self._lock:
+            objects = sorted(self._objects(), key=lambda x: x[2])
+            # Store may be shared with other processes, recount
+            self._disk_used = sum(size for _, size, _ in objects)
+            for digest, size, _ in objects:
+                if self._disk_used <= self._disk_size * self.DISK_LOW:
+                    break
+                try:
+                    os.unlink(self._object_path(digest))
+                except OSError:
+                    continue
+                self._disk_used -= size
+                self._counters['disk_evictions'] += 1
+            # Keys without objects just miss, remove it too
+            folder = os.path.join(self._path, 'keys')
+            for key in os.listdir(folder):
+                if key.startswith('.'):
+                    continue
+                try:
+                    with open(os.path.join(folder, key)) as fp:
+                        exists = os.path.isfile(self._object_path(fp.read()))
+                    if not exists:
+                        os.unlink(os.path.join(folder, key))
+                except OSError:
+                    pass
+
+
+class MetadataCache:
+    """
+    Voices, profiles and versions of RHVoice on disk, so TTS don't load library to get it.
+    Key is real path of library file, data and config paths with their modification times.
+    """
+    FOLDER = 'rhvoice-wrapper'
+
+    def __init__(self, path=None):
+        """:param str or None path: Folder, None - user cache folder."""
+        if path is None:
+            base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+            path = os.path.join(base, self.FOLDER)
+        self._path = path
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except (OSError, TypeError, ValueError):
+            return None
+
+    @classmethod
+    def make_key(cls, lib_path: str, data_path: str, resources: list, config_path: str) -> str:
+        paths = [lib_path, data_path, os.path.join(data_path, 'voices'), os.path.join(data_path, 'languages')]
+        paths += resources
+        paths += [config_path, os.path.join(config_path, 'RHVoice.conf'), os.path.join(config_path, 'RHVoice.ini')]
+        data = [[path, cls._mtime(path)] for path in paths]
+        return hashlib.sha256(json.dumps(data, ensure_ascii=False).encode()).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self._path, key + '.json')
+
+    def get(self, key: str) -> dict or None:
+        try:
+            with open(self._file(key), encoding='utf-8') as fp:
+                info = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(info, dict) or not {'voices', 'voice_profiles', 'api', 'version'} <= info.keys():
+            return None
+        info['voice_profiles'] = tuple(info['voice_profiles'])
+        return info
+
+    def put(self, key: str, info: dict):
+        try:
+            os.makedirs(self._path, exist_ok=True)
+            AudioCache._atomic_write(self._file(key), json.dumps(info, ensure_ascii=False).encode())
+        except (OSError, TypeError, ValueError) as e:
+            print('metadata cache write error: {}'.format(e))
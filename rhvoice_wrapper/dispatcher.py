@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import struct
+import threading
+import time
+from collections import deque
+
+
+class _Waiter:
+    def __init__(self):
+        self.index = None
+        self.created = time.monotonic()
+        self._event = threading.Event()
+
+    def wake(self, index) -> bool:
+        self.index = index
+        self._event.set()
+        return True
+
+    def wait(self, timeout) -> bool:
+        return self._event.wait(timeout)
+
+
+class _AsyncWaiter(_Waiter):
+    def __init__(self, dispatcher, loop):
+        super().__init__()
+        self._dispatcher = dispatcher
+        self._loop = loop
+        self.future = loop.create_future()
+        self.future.add_done_callback(self._done)
+
+    def wake(self, index) -> bool:
+        if self.future.done():
+            return False
+        self.index = index
+        self._loop.call_soon_threadsafe(self._set_result, index)
+        return True
+
+    def _set_result(self, index):
+        if self.future.cancelled():
+            # Caller gone while worker was on the way, give it to next
+            self._dispatcher.put(index)
+        else:
+            self.future.set_result(index)
+
+    def _done(self, future):
+        if future.cancelled():
+            self._dispatcher.discard(self)
+
+
+class IdleQueue:
+    """
+    Indexes from worker processes, without shared lock: a process killed while writing don't block others.
+    Messages are small, pipe writes are atomic.
+    """
+    _INDEX = struct.Struct('<i')
+
+    def __init__(self):
+        self._reader, self._writer = multiprocessing.Pipe(False)
+
+    def put(self, index):
+        self._writer.send_bytes(self._INDEX.pack(-1 if index is None else index))
+
+    def get(self):
+        index = self._INDEX.unpack(self._reader.recv_bytes())[0]
+        return None if index < 0 else index
+
+
+class Dispatcher:
+    """
+    Assign idle workers to callers in order of arrival.
+    Workers put own index when become idle, callers wait in FIFO without polling workers.
+    In multiprocessing mode workers put indexes to idle queue, thread move them to dispatcher.
+    Last idle worker is taken first, so extra workers stay idle and may be reaped.
+    """
+    def __init__(self, idle=None, on_wait=None):
+        """
+        :param idle: Queue from worker processes.
+        :param on_wait: Callable, called when caller has to wait for worker.
+        """
+        self._lock = threading.Lock()
+        # (index, idle since)
+        self._workers = deque()
+        self._waiters = deque()
+        self._on_wait = on_wait
+        self._dispatched = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._idle = idle
+        if idle is not None:
+            self._pump = threading.Thread(target=self._pump_idle, daemon=True)
+            self._pump.start()
+
+    def _pump_idle(self):
+        while True:
+            index = self._idle.get()
+            if index is None:
+                break
+            self.put(index)
+
+    def put(self, index):
+        """Worker with index became idle."""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if waiter.wake(index):
+                    self._account(time.monotonic() - waiter.created)
+                    return
+            self._workers.append((index, time.monotonic()))
+
+    def _account(self, wait):
+        self._dispatched += 1
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+
+    def _enqueue(self, waiter):
+        # Return True if waiter got idle worker immediately
+        with self._lock:
+            if self._workers:
+                waiter.wake(self._workers.pop()[0])
+                self._account(0.0)
+                return True
+            self._waiters.append(waiter)
+        if self._on_wait is not None:
+            self._on_wait()
+        return False
+
+    def discard(self, waiter):
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def get(self, timeout=None) -> int:
+        """Wait idle worker index, raise RuntimeError after timeout."""
+        waiter = _Waiter()
+        if self._enqueue(waiter) or waiter.wait(timeout):
+            return waiter.index
+        with self._lock:
+            if waiter.index is not None:
+                return waiter.index
+            self._waiters.remove(waiter)
+            self._timeouts += 1
+        raise RuntimeError('Still busy')
+
+    def get_async(self, loop):
+        """Future with idle worker index, for event loops."""
+        waiter = _AsyncWaiter(self, loop)
+        self._enqueue(waiter)
+        return waiter.future
+
+    def oldest_wait(self) -> float:
+        """How long the first caller is waiting, 0 if nobody."""
+        with self._lock:
+            return time.monotonic() - self._waiters[0].created if self._waiters else 0.0
+
+    def reap(self, timeout):
+        """Take worker that was idle longer than timeout, it will not be given to callers. Returned index or None."""
+        with self._lock:
+            if self._workers and time.monotonic() - self._workers[0][1] >= timeout:
+                return self._workers.popleft()[0]
+        return None
+
+    def remove(self, index):
+        """Worker with index is gone, don't give it to callers."""
+        with self._lock:
+            for entry in self._workers:
+                if entry[0] == index:
+                    self._workers.remove(entry)
+                    break
+
+    def stop(self):
+        if self._idle is not None:
+            self._idle.put(None)
+            self._pump.join()
+
+    @property
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                'pending': len(self._waiters),
+                'idle': len(self._workers),
+                'dispatched': self._dispatched,
+                'timeouts': self._timeouts,
+                'wait_avg': self._wait_total / self._dispatched if self._dispatched else 0.0,
+                'wait_max': self._wait_max,
+            }
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+import copy
+import ctypes.util
+import functools
+import shutil
+import struct
+import sys
+from array import array
+from ctypes import CDLL, POINTER, c_char, c_int, c_short, c_void_p, cast, string_at
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# lame.h
+_MPEG_MONO = 3
+_VBR_DEFAULT = 4
+
+
+# find_library don't look at LD_LIBRARY_PATH on some systems, try usual names too
+_LAME_NAMES = ('libmp3lame.so.0', 'libmp3lame.dylib', 'libmp3lame.dll')
+
+
+def _load_lame():
+    lib = None
+    for name in (ctypes.util.find_library('mp3lame'),) + _LAME_NAMES:
+        if not name:
+            continue
+        try:
+            lib = CDLL(name)
+        except OSError:
+            continue
+        break
+    if lib is None:
+        return None
+    lib.lame_init.restype = c_void_p
+    lib.lame_init.argtypes = ()
+    for func in ('lame_set_in_samplerate', 'lame_set_num_channels', 'lame_set_mode', 'lame_set_VBR',
+                 'lame_set_quality', 'lame_set_bWriteVbrTag'):
+        getattr(lib, func).argtypes = (c_void_p, c_int)
+        getattr(lib, func).restype = c_int
+    for func in ('lame_init_params', 'lame_close'):
+        getattr(lib, func).argtypes = (c_void_p,)
+        getattr(lib, func).restype = c_int
+    lib.lame_encode_buffer.argtypes = (c_void_p, POINTER(c_short), POINTER(c_short), c_int, POINTER(c_char), c_int)
+    lib.lame_encode_buffer.restype = c_int
+    lib.lame_encode_flush.argtypes = (c_void_p, POINTER(c_char), c_int)
+    lib.lame_encode_flush.restype = c_int
+    return lib
+
+
+_lame = None
+_lame_loaded = False
+
+
+def lame():
+    """libmp3lame or None if it not found."""
+    global _lame, _lame_loaded
+    if not _lame_loaded:
+        _lame, _lame_loaded = _load_lame(), True
+    return _lame
+
+
+class Encoder:
+    """
+    In-process streaming encoder, created for each request by Format.encoder(rate).
+    Gets raw 16-bit mono samples and returns encoded data with own header, if format has it.
+    """
+    def encode(self, samples, count) -> bytes:
+        """samples - ctypes pointer or bytes-like of count 16-bit samples."""
+        raise NotImplementedError
+
+    def flush(self) -> bytes:
+        return b''
+
+    def finish(self, data: bytes) -> bytes:
+        """Whole output, when it known - blocked mode. Returned data with exact lengths in header."""
+        return data
+
+    def close(self):
+        pass
+
+
+class LameEncoder(Encoder):
+    """
+    In-process mp3 encoder, same as lame -t -hv: VBR, quality 2, without VBR tag.
+    Takes 16-bit mono samples, returns mp3 frames as soon as lame produces it.
+    """
+    QUALITY = 2
+
+    def __init__(self, rate):
+        self._lib = lame()
+        if self._lib is None:
+            raise RuntimeError('libmp3lame not found')
+        self._gf = self._lib.lame_init()
+        if not self._gf:
+            raise RuntimeError('lame_init failed')
+        self._lib.lame_set_in_samplerate(self._gf, rate)
+        self._lib.lame_set_num_channels(self._gf, 1)
+        self._lib.lame_set_mode(self._gf, _MPEG_MONO)
+        self._lib.lame_set_VBR(self._gf, _VBR_DEFAULT)
+        self._lib.lame_set_quality(self._gf, self.QUALITY)
+        self._lib.lame_set_bWriteVbrTag(self._gf, 0)
+        if self._lib.lame_init_params(self._gf) < 0:
+            self.close()
+            raise RuntimeError('lame_init_params failed')
+        self._buffer = (c_char * 0)()
+
+    def _out(self, size):
+        if len(self._buffer) < size:
+            self._buffer = (c_char * size)()
+        return self._buffer
+
+    def encode(self, samples, count) -> bytes:
+        # Worst case from lame.h
+        out = self._out(count * 5 // 4 + 7200)
+        size = self._lib.lame_encode_buffer(self._gf, cast(samples, POINTER(c_short)), None, count, out, len(out))
+        if size < 0:
+            raise RuntimeError('lame_encode_buffer error: {}'.format(size))
+        return string_at(out, size)
+
+    def flush(self) -> bytes:
+        out = self._out(7200)
+        size = self._lib.lame_encode_flush(self._gf, out, len(out))
+        return string_at(out, size) if size > 0 else b''
+
+    def close(self):
+        if self._gf:
+            self._lib.lame_close(self._gf)
+            self._gf = None
+
+
+def _ulaw_table():
+    # G.711 mu-law of every 16-bit sample as in g711.c, index is sample as uint16
+    samples = numpy.arange(-32768, 32768, dtype=numpy.int32) >> 2
+    mask = numpy.where(samples < 0, 0x7F, 0xFF)
+    value = numpy.minimum(numpy.abs(samples), 8159) + 0x21
+    # Segment ends 0x3F, 0x7F, ... 0x1FFF
+    segment = numpy.maximum(numpy.ceil(numpy.log2(value + 1)).astype(numpy.int32) - 6, 0)
+    table = ((segment << 4) | ((value >> (segment + 1)) & 0x0F)) ^ mask
+    table = numpy.where(segment >= 8, 0x7F ^ mask, table).astype(numpy.uint8)
+    return numpy.roll(table, -32768)
+
+
+def _alaw_table():
+    samples = numpy.arange(-32768, 32768, dtype=numpy.int32) >> 3
+    mask = numpy.where(samples >= 0, 0xD5, 0x55)
+    value = numpy.where(samples >= 0, samples, -samples - 1)
+    # Segment ends 0x1F, 0x3F, ... 0xFFF
+    segment = numpy.maximum(numpy.ceil(numpy.log2(value + 1)).astype(numpy.int32) - 5, 0)
+    shift = numpy.where(segment < 2, 1, segment)
+    table = ((segment << 4) | ((value >> shift) & 0x0F)) ^ mask
+    table = numpy.where(segment >= 8, 0x7F ^ mask, table).astype(numpy.uint8)
+    return numpy.roll(table, -32768)
+
+
+_tables = {}
+
+
+def _table(law):
+    if law not in _tables:
+        _tables[law] = _ulaw_table() if law == 'ulaw' else _alaw_table()
+    return _tables[law]
+
+
+class G711Encoder(Encoder):
+    """
+    G.711 mu-law or A-law by lookup table over numpy view of samples, raw or in wav.
+    Wav header is written before first data with 'infinite' length, finish set exact lengths.
+    """
+    WAVE_FORMATS = {'ulaw': 7, 'alaw': 6}
+    HEADER_SIZE = 58
+    STREAM_LENGTH = 0xFFFFFFF
+
+    def __init__(self, rate, law, wav=False):
+        self._rate = rate
+        self._table = _table(law)
+        self._format = self.WAVE_FORMATS[law]
+        self._header = self._make_header(self.STREAM_LENGTH) if wav else b''
+
+    def _make_header(self, length) -> bytes:
+        # fmt with cbSize and fact are required for non-PCM wav
+        return b''.join((
+            b'RIFF', struct.pack('<I', self.HEADER_SIZE - 8 + length), b'WAVE',
+            b'fmt ', struct.pack('<IHHIIHHH', 18, self._format, 1, self._rate, self._rate, 1, 8, 0),
+            b'fact', struct.pack('<II', 4, length),
+            b'data', struct.pack('<I', length),
+        ))
+
+    def encode(self, samples, count) -> bytes:
+        view = numpy.ctypeslib.as_array(cast(samples, POINTER(c_short)), (count,)).view(numpy.uint16)
+        data = self._table[view].tobytes()
+        if self._header:
+            data, self._header = self._header + data, b''
+        return data
+
+    def flush(self) -> bytes:
+        data, self._header = self._header, b''
+        return data
+
+    def finish(self, data: bytes) -> bytes:
+        if data[:4] != b'RIFF':
+            return data
+        return self._make_header(len(data) - self.HEADER_SIZE) + data[self.HEADER_SIZE:]
+
+
+class S16BEEncoder(Encoder):
+    """Raw 16-bit big-endian samples, byteswap without numpy."""
+    def __init__(self, _):
+        self._swap = sys.byteorder == 'little'
+
+    def encode(self, samples, count) -> bytes:
+        data = string_at(samples, count * 2)
+        if not self._swap:
+            return data
+        result = array('h', data)
+        result.byteswap()
+        return result.tobytes()
+
+
+def _has_numpy() -> bool:
+    return numpy is not None
+
+
+class Format:
+    """
+    Output format for requests. Audio is encoded by in-process encoder or by external command,
+    without both samples are sent as is.
+    :param str name: Format name in requests.
+    :param str mime: MIME type of output.
+    :param list or None command: Encoder reading stdin and writing stdout, executable first.
+    :param list stream_options: Added to command after executable only in stream mode.
+    :param callable or None encoder: encoder(rate) returns Encoder, it used if check passed. Encoder has priority
+    over command, command is fallback if check failed.
+    :param str or None header: 'wav' - samples are wrapped in wav before command or output, None - raw samples.
+    Encoders always get raw samples and write own header.
+    :param bool stream: False if output can't be generated before all audio known,
+    it's encoded after synthesis even in stream mode.
+    :param int or None default_rate: Audio is resampled to it if sample_rate not set, None - engine rate.
+    :param callable or None check: Returns False if encoder not available.
+    :param str or None package: Package with command or encoder dependency, for message if it not found.
+    """
+    HEADERS = (None, 'wav')
+
+    def __init__(self, name, mime, command=None, stream_options=(), encoder=None, header=None, stream=True,
+                 default_rate=None, check=None, package=None):
+        if header not in self.HEADERS:
+            raise RuntimeError('Format header must be one of {}: {}'.format(self.HEADERS, header))
+        self.name = name
+        self.mime = mime
+        self.command = list(command) if command else None
+        self.stream_options = list(stream_options)
+        self.encoder = encoder
+        self.header = header
+        self.stream = stream
+        self.default_rate = default_rate
+        self.check = check
+        self.package = package
+
+    def __repr__(self):
+        return '<Format {} {}>'.format(self.name, self.mime)
+
+    def resolve(self, stream=True, path=None):
+        """Copy with only encoder or only command as it will be used, None if format not available."""
+        result = copy.copy(self)
+        result.check, result.stream_options = None, []
+        if self.encoder is not None and (self.check is None or self.check()):
+            result.command, result.header = None, None
+            return result
+        result.encoder = None
+        if self.command is None:
+            return result if self.encoder is None else None
+        executable = path or self.command[0]
+        if not shutil.which(executable):
+            return None
+        options = self.stream_options if stream and self.stream else []
+        result.command = [executable] + options + self.command[1:]
+        return result
+
+
+_REGISTRY = {}
+
+
+def register(format_: Format, replace=False):
+    """Add format for all TTS created after it. Raise RuntimeError if format exists and replace is False."""
+    if format_.name in _REGISTRY and not replace:
+        raise RuntimeError('Format already registered: {}'.format(format_.name))
+    _REGISTRY[format_.name] = format_
+
+
+def unregister(name):
+    _REGISTRY.pop(name, None)
+
+
+def get_format(name) -> Format or None:
+    return _REGISTRY.get(name)
+
+
+def registered() -> dict:
+    """Copy of registry, format name: Format."""
+    return _REGISTRY.copy()
+
+
+def resolve(stream=True, paths=None, quiet=True) -> dict:
+    """
+    Available formats as name: resolved Format, see Format.resolve.
+    paths - format name: path to command executable, it replaces default executable.
+    """
+    paths = paths or {}
+    result = {}
+    for name, format_ in _REGISTRY.items():
+        resolved = format_.resolve(stream, paths.get(name))
+        if resolved is not None:
+            result[name] = resolved
+        elif not quiet and format_.command is None:
+            # Only in-process encoder, its check failed
+            print('Disable {} support - requires {}.'.format(name, format_.package or 'encoder'))
+        elif not quiet:
+            executable = paths.get(name) or format_.command[0]
+            print('Disable {} support - {} not found. Use apt install {}'.format(
+                name, executable, format_.package or executable))
+    return result
+
+
+for _format in (
+        Format('pcm', 'audio/x-raw'),
+        Format('wav', 'audio/wav', header='wav'),
+        Format(
+            'mp3', 'audio/mpeg', ['lame', '-hv', '--silent', '-', '-'], ['-t'],
+            encoder=LameEncoder, header='wav', check=lame, package='lame',
+        ),
+        Format(
+            'opus', 'audio/ogg', ['opusenc', '--quiet', '--discard-comments', '-', '-'], ['--ignorelength'],
+            header='wav', package='opus-tools',
+        ),
+        Format(
+            'flac', 'audio/flac', ['flac', '--totally-silent', '--best', '--stdout', '-'], ['--ignore-chunk-sizes'],
+            header='wav', package='flac',
+        ),
+        Format('ulaw', 'audio/PCMU', encoder=functools.partial(G711Encoder, law='ulaw'), default_rate=8000,
+               check=_has_numpy, package='numpy'),
+        Format('alaw', 'audio/PCMA', encoder=functools.partial(G711Encoder, law='alaw'), default_rate=8000,
+               check=_has_numpy, package='numpy'),
+        Format('ulaw_wav', 'audio/wav', encoder=functools.partial(G711Encoder, law='ulaw', wav=True),
+               default_rate=8000, check=_has_numpy, package='numpy'),
+        Format('alaw_wav', 'audio/wav', encoder=functools.partial(G711Encoder, law='alaw', wav=True),
+               default_rate=8000, check=_has_numpy, package='numpy'),
+        Format('s16be', 'audio/L16', encoder=S16BEEncoder),
+):
+    register(_format)
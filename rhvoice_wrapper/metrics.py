@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import bisect
+import threading
+import time
+
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+RTF_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100)
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    'queue_wait_seconds': ('Waiting for a free engine', TIME_BUCKETS),
+    'start_latency_seconds': ('From request to start of synthesis', TIME_BUCKETS),
+    'first_chunk_seconds': ('From request to first chunk received by client', TIME_BUCKETS),
+    'realtime_factor': ('Audio seconds per wall second of synthesis', RTF_BUCKETS),
+    'encoder_seconds': ('Finishing encoder after synthesis', TIME_BUCKETS),
+    'drain_seconds': ('From end of synthesis until client read all data', TIME_BUCKETS),
+}
+COUNTERS = {
+    'requests_total': 'Requests to engines',
+    'audio_seconds_total': 'Generated audio',
+    'crashes_total': 'Requests failed by died engine',
+    'cancelled_total': 'Requests cancelled by client',
+}
+# Worker stats in shared array: sequence, audio seconds, synthesis, encoder, drain, total busy seconds
+STATS_SIZE = 6
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        cumulative, buckets = 0, {}
+        for bucket, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            buckets[bucket] = cumulative
+        return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+
+class Metrics:
+    """
+    Histograms and counters by (voice, format), worker stats.
+    Client side of requests observed directly, engine side collected from workers stats arrays.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {name: {} for name in HISTOGRAMS}
+        self._counters = {name: {} for name in COUNTERS}
+        self._busy = {}
+        # Busy time of previous workers in same slot
+        self._busy_base = {}
+        self._seen = {}
+        self._started = time.monotonic()
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            histogram = self._histograms[name].get(labels)
+            if histogram is None:
+                histogram = self._histograms[name][labels] = Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._counters[name][labels] = self._counters[name].get(labels, 0) + value
+
+    def reset(self, index):
+        """New worker in slot, its stats starts from zero."""
+        with self._lock:
+            self._seen.pop(index, None)
+            self._busy_base[index] = self._busy_base.get(index, 0) + self._busy.pop(index, 0)
+
+    def collect(self, index, stats, labels):
+        """Take last request stats from worker, if it is new."""
+        while True:
+            seq = stats[0]
+            values = stats[1:STATS_SIZE]
+            if stats[0] == seq:
+                break
+        with self._lock:
+            if not seq or self._seen.get(index) == seq:
+                return
+            self._seen[index] = seq
+            self._busy[index] = values[4]
+        audio, synthesis, encoder, drain = values[:4]
+        if synthesis > 0:
+            self.observe('realtime_factor', labels, audio / synthesis)
+        self.observe('encoder_seconds', labels, encoder)
+        self.observe('drain_seconds', labels, drain)
+        self.inc('audio_seconds_total', labels, audio)
+
+    def snapshot(self, gauges: dict) -> dict:
+        with self._lock:
+            uptime = max(time.monotonic() - self._started, 1e-9)
+            return {
+                'histograms': {
+                    name: {labels: value.to_dict() for labels, value in data.items()}
+                    for name, data in self._histograms.items()
+                },
+                'counters': {name: data.copy() for name, data in self._counters.items()},
+                'gauges': gauges,
+                'workers': {
+                    index: {'busy_seconds': busy, 'utilization': min(busy / uptime, 1.0)}
+                    for index, busy in self._busy_total().items()
+                },
+            }
+
+    def _busy_total(self):
+        return {index: base + self._busy.get(index, 0) for index, base in self._busy_base.items()}
+
+
+def _labels(voice_format):
+    return 'voice="{}",format="{}"'.format(*[str(x).replace('\\', '\\\\').replace('"', '\\"') for x in voice_format])
+
+
+def to_prometheus(snapshot: dict, prefix='rhvoice_') -> str:
+    """Prometheus text exposition format from Metrics.snapshot."""
+    lines = []
+    for name, data in snapshot['histograms'].items():
+        name = prefix + name
+        lines.append('# HELP {} {}'.format(name, HISTOGRAMS[name[len(prefix):]][0]))
+        lines.append('# TYPE {} histogram'.format(name))
+        for labels, value in sorted(data.items()):
+            labels = _labels(labels)
+            for bucket, count in value['buckets'].items():
+                le = '+Inf' if bucket == float('inf') else repr(float(bucket))
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, le, count))
+            lines.append('{}_sum{{{}}} {}'.format(name, labels, value['sum']))
+            lines.append('{}_count{{{}}} {}'.format(name, labels, value['count']))
+    for name, data in snapshot['counters'].items():
+        name = prefix + name
+        lines.append('# HELP {} {}'.format(name, COUNTERS[name[len(prefix):]]))
+        lines.append('# TYPE {} counter'.format(name))
+        for labels, value in sorted(data.items()):
+            lines.append('{}{{{}}} {}'.format(name, _labels(labels), value))
+    for name, value in snapshot['gauges'].items():
+        lines.append('# TYPE {}{} gauge'.format(prefix, name))
+        lines.append('{}{} {}'.format(prefix, name, value))
+    if snapshot['workers']:
+        for name, kind in (('busy_seconds', 'counter'), ('utilization', 'gauge')):
+            lines.append('# TYPE {}worker_{} {}'.format(prefix, name, kind))
+            for index, value in sorted(snapshot['workers'].items()):
+                lines.append('{}worker_{}{{worker="{}"}} {}'.format(prefix, name, index, value[name]))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Streaming post-processing of 16-bit mono samples between engine and wav header or encoder.
+Stages are set by string 'trim;normalize:mode=rms,target=-20;gain:db=3' or a list of stages:
+    trim - leading and trailing silence: threshold (dBFS, default -45), padding (seconds of silence kept, 0.05),
+    lookahead (seconds of silence held to find trailing, 1.0), longer pauses inside are shortened to it;
+    normalize - peak or RMS level of first lookahead seconds: mode (peak or rms), target (dBFS, default -1 for peak
+    and -20 for rms), max_gain (dB, 20), lookahead (seconds, 1.0). Gain is lowered if audio after it clips;
+    gain - db (default 0).
+All calculations are vectorized, audio is delayed not more than the largest lookahead.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SUPPORTED = numpy is not None
+MAX_SAMPLE = 32767
+
+
+def _db(value) -> float:
+    return 10 ** (value / 20)
+
+
+def _empty():
+    return numpy.empty(0, dtype=numpy.float32)
+
+
+class _Stage:
+    # name: (type, default)
+    OPTIONS = {}
+
+    def __init__(self, rate, **options):
+        self._rate = rate
+
+    def process(self, samples):
+        raise NotImplementedError
+
+    def flush(self):
+        return _empty()
+
+
+class Trim(_Stage):
+    OPTIONS = {'threshold': (float, -45.0), 'padding': (float, 0.05), 'lookahead': (float, 1.0)}
+
+    def __init__(self, rate, threshold, padding, lookahead):
+        super().__init__(rate)
+        self._limit = MAX_SAMPLE * _db(threshold)
+        self._padding = int(padding * rate)
+        # Pauses inside longer than it are shortened, memory is bounded
+        self._lookahead = max(int(lookahead * rate), self._padding)
+        self._started = False
+        # Silence after last loud sample
+        self._pending = _empty()
+
+    def process(self, samples):
+        loud = numpy.flatnonzero(numpy.abs(samples) > self._limit)
+        if not self._started:
+            if not len(loud):
+                if self._padding:
+                    self._pending = numpy.concatenate((self._pending, samples))[-self._padding:]
+                return _empty()
+            self._started = True
+            start = len(self._pending) + loud[0] - self._padding
+            samples = numpy.concatenate((self._pending, samples))[max(0, start):]
+            self._pending = _empty()
+            loud = numpy.flatnonzero(numpy.abs(samples) > self._limit)
+        if len(loud):
+            pause = numpy.concatenate((self._pending, samples[:loud[0]]))[:self._lookahead]
+            result = numpy.concatenate((pause, samples[loud[0]:loud[-1] + 1]))
+            self._pending = samples[loud[-1] + 1:]
+        else:
+            result = _empty()
+            self._pending = numpy.concatenate((self._pending, samples))
+        if len(self._pending) > self._lookahead:
+            self._pending = self._pending[:self._lookahead]
+        return result
+
+    def flush(self):
+        return self._pending[:self._padding] if self._started else _empty()
+
+
+class Normalize(_Stage):
+    OPTIONS = {'mode': (str, 'peak'), 'target': (float, None), 'max_gain': (float, 20.0), 'lookahead': (float, 1.0)}
+    MODES = ('peak', 'rms')
+    TARGETS = {'peak': -1.0, 'rms': -20.0}
+
+    def __init__(self, rate, mode, target, max_gain, lookahead):
+        super().__init__(rate)
+        self._rms = mode == 'rms'
+        self._target = MAX_SAMPLE * _db(self.TARGETS[mode] if target is None else target)
+        self._max_gain = _db(max_gain)
+        self._lookahead = int(lookahead * rate)
+        self._held, self._held_size = [], 0
+        self._gain = None
+
+    def process(self, samples):
+        if self._gain is None:
+            self._held.append(samples)
+            self._held_size += len(samples)
+            if self._held_size < self._lookahead:
+                return _empty()
+            samples = self._release()
+        return self._apply(samples)
+
+    def flush(self):
+        return self._apply(self._release()) if self._gain is None and self._held_size else _empty()
+
+    def _release(self):
+        samples = numpy.concatenate(self._held)
+        self._held, self._held_size = [], 0
+        level = numpy.sqrt(numpy.mean(samples * samples)) if self._rms else numpy.abs(samples).max()
+        self._gain = min(self._target / level, self._max_gain) if level > 0 else 1.0
+        return samples
+
+    def _apply(self, samples):
+        if len(samples):
+            # Limiter, gain only goes down
+            peak = numpy.abs(samples).max() * self._gain
+            if peak > MAX_SAMPLE:
+                self._gain *= MAX_SAMPLE / peak
+        return samples * self._gain
+
+
+class Gain(_Stage):
+    OPTIONS = {'db': (float, 0.0)}
+
+    def __init__(self, rate, db):
+        super().__init__(rate)
+        self._gain = _db(db)
+
+    def process(self, samples):
+        return samples * self._gain
+
+
+STAGES = {'trim': Trim, 'normalize': Normalize, 'gain': Gain}
+
+
+def _parse_stage(stage) -> tuple:
+    if isinstance(stage, (list, tuple)):
+        # Already parsed
+        if len(stage) != 2 or not isinstance(stage[1], dict):
+            raise RuntimeError('Wrong postprocess stage: {}'.format(stage))
+        name, options = stage
+    else:
+        name, _, text = str(stage).strip().partition(':')
+        options = {}
+        for option in text.split(','):
+            if option:
+                key, _, value = option.partition('=')
+                options[key.strip()] = value.strip()
+    if not isinstance(name, str) or name not in STAGES:
+        raise RuntimeError('Unknown postprocess stage: {}'.format(name))
+    result = {}
+    for key, (type_, default) in STAGES[name].OPTIONS.items():
+        value = options.get(key, default)
+        try:
+            result[key] = value if value is None else type_(value)
+        except (TypeError, ValueError):
+            raise RuntimeError('Wrong postprocess option {}.{}: {}'.format(name, key, value))
+    unknown = set(options) - set(result)
+    if unknown:
+        raise RuntimeError('Unknown postprocess options {}: {}'.format(name, ', '.join(sorted(unknown))))
+    if name == 'normalize' and result['mode'] not in Normalize.MODES:
+        raise RuntimeError('Normalize mode must be one of {}: {}'.format(Normalize.MODES, result['mode']))
+    for key in ('padding', 'lookahead', 'max_gain'):
+        if result.get(key, 0) < 0:
+            raise RuntimeError('Postprocess option {}.{} must be positive'.format(name, key))
+    return name, result
+
+
+def parse(stages) -> tuple:
+    """
+    Stages from string or list as tuple of (name, options), empty tuple if nothing to do.
+    Raise RuntimeError if stages are wrong or numpy not found.
+    """
+    if not stages:
+        return ()
+    if isinstance(stages, str):
+        stages = [stage for stage in stages.split(';') if stage.strip()]
+    elif not isinstance(stages, (list, tuple)):
+        raise RuntimeError('Postprocess must be str or list of stages: {}'.format(stages))
+    result = tuple(_parse_stage(stage) for stage in stages)
+    if result and not SUPPORTED:
+        raise RuntimeError('postprocess requires numpy')
+    return result
+
+
+class Pipeline:
+    """Parsed stages for one request, bytes in and bytes out."""
+    def __init__(self, stages: tuple, rate: int):
+        self._stages = [STAGES[name](rate, **options) for name, options in stages]
+
+    def process(self, data) -> bytes:
+        samples = numpy.frombuffer(data, dtype=numpy.int16).astype(numpy.float32)
+        for stage in self._stages:
+            if not len(samples):
+                break
+            samples = stage.process(samples)
+        return self._to_bytes(samples)
+
+    def flush(self) -> bytes:
+        samples = _empty()
+        for stage in self._stages:
+            if len(samples):
+                samples = stage.process(samples)
+            samples = numpy.concatenate((samples, stage.flush()))
+        return self._to_bytes(samples)
+
+    @staticmethod
+    def _to_bytes(samples) -> bytes:
+        return numpy.clip(numpy.rint(samples), -MAX_SAMPLE - 1, MAX_SAMPLE).astype(numpy.int16).tobytes()
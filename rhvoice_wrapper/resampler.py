@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SUPPORTED = numpy is not None
+MIN_RATE = 4000
+MAX_RATE = 192000
+
+
+def check_rate(sample_rate):
+    """Raise RuntimeError if sample_rate can't be a target rate."""
+    if not isinstance(sample_rate, int) or isinstance(sample_rate, bool):
+        raise RuntimeError('sample_rate must be int, get {}'.format(type(sample_rate)))
+    if not MIN_RATE <= sample_rate <= MAX_RATE:
+        raise RuntimeError('sample_rate must be from {} to {}: {}'.format(MIN_RATE, MAX_RATE, sample_rate))
+    if not SUPPORTED:
+        raise RuntimeError('sample_rate requires numpy')
+
+
+class Resampler:
+    """
+    Streaming polyphase resampler for 16-bit mono samples, windowed sinc filter.
+    Filter state is kept between calls, so audio may be fed by any chunks. Filter delay is compensated,
+    output has ceil(input * dst_rate / src_rate) samples after flush.
+    """
+    # Filter taps per phase, for upsampling. Downsampling uses more for a same transition band
+    TAPS = 16
+    KAISER_BETA = 8.0
+    # Cutoff relative to the lowest Nyquist frequency
+    ROLLOFF = 0.9
+
+    def __init__(self, src_rate: int, dst_rate: int):
+        self.rates = src_rate, dst_rate
+        gcd = math.gcd(src_rate, dst_rate)
+        self._up, self._down = dst_rate // gcd, src_rate // gcd
+        self._taps = self.TAPS * max(1, -(-self._down // self._up))
+        # Odd length, so filter delay is a whole sample
+        size = self._up * self._taps - 1 + self._up * self._taps % 2
+        cutoff = self.ROLLOFF * 0.5 / max(self._up, self._down)
+        x = numpy.arange(size) - (size - 1) // 2
+        h = 2 * cutoff * numpy.sinc(2 * cutoff * x) * numpy.kaiser(size, self.KAISER_BETA) * self._up
+        h = numpy.concatenate((h, numpy.zeros(self._up * self._taps - size)))
+        # h[phase + k * up] as phases[phase][k]
+        self._phases = h.reshape(self._taps, self._up).T.copy()
+        self._delay = (size - 1) // 2
+        # Input since absolute index self._start, zeros before first sample
+        self._buffer = numpy.zeros(self._taps, dtype=numpy.float64)
+        self._start = -self._taps
+        self._received = 0
+        self._produced = 0
+
+    def process(self, data) -> bytes:
+        """Resampled samples from bytes-like 16-bit samples, as bytes."""
+        samples = numpy.frombuffer(data, dtype=numpy.int16)
+        self._buffer = numpy.concatenate((self._buffer, samples))
+        self._received += len(samples)
+        # Last output with all input samples known
+        end = (self._received * self._up - 1 - self._delay) // self._down + 1
+        return self._convolve(end)
+
+    def flush(self) -> bytes:
+        """Tail of audio, resampler is reset after it."""
+        end = -(-self._received * self._up // self._down)
+        last = ((end - 1) * self._down + self._delay) // self._up if end else 0
+        padding = max(0, last + 1 - self._start - len(self._buffer))
+        self._buffer = numpy.concatenate((self._buffer, numpy.zeros(padding)))
+        result = self._convolve(end)
+        self.__init__(*self.rates)
+        return result
+
+    def _convolve(self, end) -> bytes:
+        if end <= self._produced:
+            return b''
+        positions = numpy.arange(self._produced, end, dtype=numpy.int64) * self._down + self._delay
+        last = positions // self._up
+        indexes = last[:, None] - numpy.arange(self._taps)[None, :] - self._start
+        result = numpy.einsum('ij,ij->i', self._buffer[indexes], self._phases[positions % self._up])
+        self._produced = end
+        # Samples for next outputs
+        keep = (end * self._down + self._delay) // self._up - self._taps + 1
+        if keep > self._start:
+            self._buffer = self._buffer[keep - self._start:]
+            self._start = keep
+        return numpy.clip(numpy.rint(result), -32768, 32767).astype(numpy.int16).tobytes()
@@ -21,9 +21,13 @@
 
 __author__ = "Olga Yakovleva <yakovleva.o.v@gmail.com>"
 
+import ctypes
+import ctypes.util
 import os
 import platform
-from ctypes import CDLL, CFUNCTYPE, POINTER, Structure, c_char_p, c_double, c_int, c_uint, c_short, c_void_p
+from ctypes import (
+    CDLL, CFUNCTYPE, POINTER, Structure, byref, c_char_p, c_double, c_int, c_uint, c_short, c_void_p, cast
+)
 
 ADAPTED = ((0, 7, 2), (1, 0, 0), (1, 2, 0))
 
@@ -201,7 +205,47 @@ def _lib_selector(lib_path):
     return lib_path if os.name == 'nt' else lib_path.encode()
 
 
+class _DlInfo(Structure):
+    _fields_ = [('dli_fname', c_char_p), ('dli_fbase', c_void_p), ('dli_sname', c_char_p), ('dli_saddr', c_void_p)]
+
+
+def _loaded_file(lib) -> str or None:
+    # Real file of library that loader selected by name
+    if os.name == 'nt':
+        buff = ctypes.create_unicode_buffer(32768)
+        if not ctypes.windll.kernel32.GetModuleFileNameW(c_void_p(lib._handle), buff, len(buff)):
+            return None
+        return buff.value
+    for name in (None, ctypes.util.find_library('dl')):
+        try:
+            dladdr = CDLL(name).dladdr
+        except (AttributeError, OSError):
+            continue
+        info = _DlInfo()
+        if not dladdr(cast(lib.RHVoice_get_version, c_void_p), byref(info)) or not info.dli_fname:
+            return None
+        return os.fsdecode(info.dli_fname)
+    return None
+
+
+def library_location(lib_path=None) -> str or None:
+    """Real path of library file for lib_path, stub returns lib_path. None if library not found."""
+    from rhvoice_wrapper import stub_engine
+    if stub_engine.is_stub(lib_path):
+        return lib_path
+    try:
+        path = _loaded_file(CDLL(_lib_selector(lib_path)))
+    except (AttributeError, OSError, ValueError):
+        return None
+    return os.path.realpath(path) if path and os.path.isfile(path) else None
+
+
 def load_tts_library(lib_path=None, api=None):
+    from rhvoice_wrapper import stub_engine
+    if stub_engine.is_stub(lib_path):
+        lib = stub_engine.StubLibrary(lib_path)
+        lib.api = api or _get_compatible_api(lib)
+        return lib, lib.api
     lib = CDLL(_lib_selector(lib_path))
     lib.RHVoice_get_version.restype = c_char_p
     api = api or _get_compatible_api(lib)
@@ -132,6 +132,33 @@ class SynthesisParams(_SynthesisCheck):
             result.update_from_dict(params)
         return result
 
+    @classmethod
+    def make_key(cls, params: dict) -> tuple:
+        """
+        Checked values of params as sorted tuple of (key, value), unknown keys are skipped.
+        Key is hashable and small for pickling, see copy_with_key. Raise RuntimeError if value is wrong.
+        """
+        result = []
+        for key in sorted(params):
+            if key not in cls.CHECKS:
+                continue
+            try:
+                result.append((key, cls.CHECKS[key][1](params[key])))
+            except Exception as e:
+                raise RuntimeError('Wrong value from {}: {}'.format(key, e))
+        return tuple(result)
+
+    def copy_with_key(self, key: tuple):
+        """Copy with values from make_key, without checks. Fields missing in this API are skipped."""
+        result = SynthesisParams(self.api)
+        synth_params = result.synth_params
+        for name in self._synth_params_keys():
+            setattr(synth_params, name, getattr(self.synth_params, name))
+        for name, value in key:
+            if hasattr(synth_params, name):
+                setattr(synth_params, name, value)
+        return result
+
     def _set_default(self):
         for key in self._synth_params_keys():
             setattr(self.synth_params, key, self.CHECKS[key][0])
@@ -147,6 +174,7 @@ class SynthesisParams(_SynthesisCheck):
 
 
 class Engine:
+    EVENTS = ('word_starts', 'sentence_starts', 'sentence_ends', 'process_mark', 'done')
     DEFAULT_DATA_PATH = '/usr/local/share/RHVoice'
     DEFAULT_CONFIG_PATH = '/usr/local/etc/RHVoice'
     GENDERS = {0: 'unknown', 1: 'male', 2: 'female'}
@@ -164,8 +192,13 @@ class Engine:
     def api(self):
         return '.'.join(str(k) for k in self._api)
 
-    def init(self, play_speech_cb, set_sample_rate_cb, resources=None, data_path=_DATA_PATH, config_path=None):
-        """initialize speech engine - load language data and set callbacks."""
+    def init(self, play_speech_cb, set_sample_rate_cb, resources=None, data_path=_DATA_PATH, config_path=None,
+             event_cb=None):
+        """
+        initialize speech engine - load language data and set callbacks.
+        event_cb(kind, position, length, mark) called on boundaries, kind is one of EVENTS.
+        position and length are place of word or sentence in text, mark - name for process_mark.
+        """
         resources = resources or []
         if isinstance(resources, str):
             resources = [resources]
@@ -173,7 +206,8 @@ class Engine:
 
         callbacks = RHVoice_callbacks(self._api)(
             play_speech=RHVoice_callback_types.play_speech(play_speech_cb),
-            set_sample_rate=RHVoice_callback_types.set_sample_rate(set_sample_rate_cb)
+            set_sample_rate=RHVoice_callback_types.set_sample_rate(set_sample_rate_cb),
+            **self._event_callbacks(event_cb)
         )
         # noinspection PyTypeChecker
         params = RHVoice_init_params(self._api)(
@@ -188,6 +222,25 @@ class Engine:
         # link for params must be present in memory while engine works
         self.__save_me = params
 
+    def _event_callbacks(self, event_cb) -> dict:
+        if event_cb is None:
+            return {}
+        types = RHVoice_callback_types
+
+        def boundary(kind):
+            return getattr(types, kind)(lambda position, length, _: event_cb(kind, position, length, None))
+
+        def done(_):
+            event_cb('done', 0, 0, None)
+
+        result = {kind: boundary(kind) for kind in ('word_starts', 'sentence_starts', 'sentence_ends')}
+        result['process_mark'] = types.process_mark(
+            lambda mark, _: event_cb('process_mark', 0, 0, (mark or b'').decode(errors='replace'))
+        )
+        if self._api >= (1, 0, 0):
+            result['done'] = types.done(done)
+        return result
+
     @property
     def voices(self) -> dict:
         """
@@ -1,18 +1,27 @@
 #!/usr/bin/env python3
 
+import json
 import multiprocessing
 import os
 import queue
+import re
 import shutil
+import struct
 import subprocess
 import threading
+import time
 import wave
+from collections import OrderedDict, deque, namedtuple
 from collections.abc import Iterable
-from contextlib import contextmanager
-from ctypes import string_at
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+from ctypes import c_char, c_double, c_longlong, memmove, string_at
 from io import BytesIO
+from multiprocessing.connection import wait as wait_objects
 
-from rhvoice_wrapper import rhvoice_proxy
+from rhvoice_wrapper import encoders, metrics, postprocess, resampler, rhvoice_bindings, rhvoice_proxy, shm_pipe
+from rhvoice_wrapper.cache import MetadataCache
+from rhvoice_wrapper.dispatcher import Dispatcher, IdleQueue
 
 try:
     multiprocessing.Queue().qsize()
@@ -24,6 +33,104 @@ else:
 _unset = object()
 DEFAULT_CHUNK_SIZE = 1024 * 4
 DEFAULT_FORMAT = 'wav'
+# Keys of sets for audio worker, not for engine
+_REQUEST_OPTIONS = ('sample_rate', 'postprocess', 'events')
+
+
+class WorkerCrashError(RuntimeError):
+    """Engine process died while request was processing."""
+    pass
+
+
+# kind - one of rhvoice_proxy.Engine.EVENTS, offset - in samples of output audio from start.
+# position and length - place of word or sentence in text as from library, mark - name of process_mark.
+Event = namedtuple('Event', ('kind', 'offset', 'position', 'length', 'mark'))
+
+
+_SENTENCE_END = re.compile(r'(?<=[.!?…;])\s+')
+
+
+def _split_sentences(text: str, min_size: int) -> list:
+    # Short sentences are joined, each segment costs a request to worker
+    result = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        if result and len(result[-1]) < min_size:
+            result[-1] += ' ' + sentence
+        elif sentence:
+            result.append(sentence)
+    return result
+
+
+def _with_sample_rate(sets, sample_rate):
+    # Target rate passed to worker with sets, it also a part of cache key
+    if not sample_rate:
+        return sets
+    sets = dict(sets or {})
+    sets['sample_rate'] = sample_rate
+    return sets
+
+
+class _Rechunker:
+    # Exact size chunks from chunks of any size. Full chunks are sliced from input as is,
+    # only a tail shorter than chunk_size is buffered - every byte is copied once or twice.
+    def __init__(self, chunk_size):
+        self._size = chunk_size
+        self._buffer = bytearray()
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def feed(self, data) -> list:
+        result = []
+        with memoryview(data) as view:
+            start = 0
+            if self._buffer:
+                start = min(len(view), self._size - len(self._buffer))
+                self._buffer += view[:start]
+                if len(self._buffer) < self._size:
+                    return result
+                result.append(bytes(self._buffer))
+                self._buffer.clear()
+            end = start + (len(view) - start) // self._size * self._size
+            result.extend(bytes(view[pos:pos + self._size]) for pos in range(start, end, self._size))
+            self._buffer += view[end:]
+        return result
+
+    def flush(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _iter_splitting(get_view, chunk_size, max_latency=None):
+    """
+    Chunks exactly by chunk_size, the last may be shorter. If max_latency is set, data waiting
+    for a full chunk longer than max_latency seconds is returned as a shorter chunk.
+    """
+    rechunker = _Rechunker(chunk_size)
+    deadline = None
+    while True:
+        if deadline is None:
+            chunk = get_view()
+        else:
+            chunk = get_view(timeout=max(0.0, deadline - time.monotonic()))
+            if chunk is None:
+                deadline = None
+                yield rechunker.flush()
+                continue
+        if not chunk:
+            break
+        chunks = rechunker.feed(chunk)
+        if max_latency and rechunker.pending and (chunks or deadline is None):
+            # Tail came now
+            deadline = time.monotonic() + max_latency
+        elif not rechunker.pending:
+            deadline = None
+        yield from chunks
+    tail = rechunker.flush()
+    if tail:
+        yield tail
 
 
 class _WaveWrite(wave.Wave_write):
@@ -36,6 +143,10 @@ class _WaveWrite(wave.Wave_write):
     def write_header(self, init_length=0xFFFFFFF):   # Задаем 'бесконечную' длину файла
         self._write_header(init_length)
 
+    def detach(self):
+        # Target is closed, nothing to flush
+        self._file = None
+
 
 class _InOut(threading.Thread):
     def __init__(self, in_, out_, chunk_size):
@@ -61,6 +172,7 @@ class _Pipe:
     # Queue fasted for Thread (i don't know why)
     def __init__(self, is_multiprocessing=False):
         self._pipe = multiprocessing.Pipe(False) if is_multiprocessing else queue.Queue()
+        self._is_multiprocessing = is_multiprocessing
         if is_multiprocessing:
             self.get = self._pipe[0].recv
             self.put = self._pipe[1].send
@@ -68,27 +180,162 @@ class _Pipe:
             self.get = self._pipe.get
             self.put = self._pipe.put_nowait
 
+    def get_all(self) -> list:
+        """All objects in pipe now, without waiting."""
+        result = []
+        if self._is_multiprocessing:
+            while self._pipe[0].poll():
+                result.append(self._pipe[0].recv())
+            return result
+        while True:
+            try:
+                result.append(self._pipe.get_nowait())
+            except queue.Empty:
+                return result
 
-class _StreamPipe:
+
+class _Probe:
+    # Engine info from first worker, once
     def __init__(self, is_multiprocessing=False):
+        self._is_multiprocessing = is_multiprocessing
+        if is_multiprocessing:
+            self._reader, self._writer = multiprocessing.Pipe(False)
+        else:
+            self._queue = queue.Queue()
+
+    def put(self, info: dict):
+        if self._is_multiprocessing:
+            self._writer.send(info)
+        else:
+            self._queue.put_nowait(info)
+
+    def get(self, timeout) -> dict or None:
+        if self._is_multiprocessing:
+            return self._reader.recv() if self._reader.poll(timeout) else None
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _Abort:
+    # Worker side check that client left or cancelled request, picklable for processes
+    def __init__(self, *events):
+        self._events = events
+
+    def __call__(self) -> bool:
+        return any(event.is_set() for event in self._events)
+
+
+class _Cancel:
+    # Cancellation of one say, cancel callbacks of workers in use
+    def __init__(self):
+        self.cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add(self, callback):
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self):
+        # Under lock - worker removed its callback is not cancelled, it may have other client
+        with self._lock:
+            self.cancelled = True
+            for callback in self._callbacks:
+                callback()
+            self._callbacks = []
+
+
+class _StreamPipe:
+    def __init__(self, is_multiprocessing=False, abort=None, high=None, low=None):
+        """
+        :param abort: Callable, if it return True producer drop data instead waiting consumer.
+        Slow consumer never cost data, producer waits until it reads or abort.
+        :param int or None high: High watermark in bytes, producer waits when unread data reaches it. None - unbounded.
+        :param int or None low: Low watermark, waiting producer continues when unread data is not more. Default - high.
+        """
         self._pipe = multiprocessing.Queue() if is_multiprocessing else queue.Queue()
-        self.get = self._pipe.get
-        self.put = self._pipe.put_nowait
         self.write = self.put
+        self.abort = abort
+        self._high = high
+        self._low = high if low is None else low
+        # Bytes put by producer and got by consumer since clear
+        self._counters = multiprocessing.RawArray(c_longlong, 2) if is_multiprocessing else [0, 0]
+        # Bytes put by producer since clear
+        self.written = 0
         if is_multiprocessing and OSX_FIX:
             self.qsize = self._osx_qsize
         else:
             self.qsize = self._pipe.qsize
 
+    def put(self, data):
+        size = len(data)
+        if size and self._high is not None and not self._wait_space():
+            return
+        self.written += size
+        self._counters[0] += size
+        self._pipe.put_nowait(data)
+
+    def put_samples(self, samples, size):
+        # Queue keeps objects - samples must be copied to new bytes
+        self.put(string_at(samples, size))
+
+    def _unread(self) -> int:
+        return self._counters[0] - self._counters[1]
+
+    def _wait_space(self) -> bool:
+        if self._unread() < self._high:
+            return True
+        sleep = 0.0005
+        while True:
+            if self.abort is not None and self.abort():
+                return False
+            time.sleep(sleep)
+            sleep = min(sleep * 2, 0.02)
+            if self._unread() <= self._low:
+                return True
+
+    def _got(self, data):
+        if data:
+            self._counters[1] += len(data)
+        return data
+
     def _osx_qsize(self) -> int:
         return int(not self._pipe.empty())
 
+    def get(self, block=True, timeout=None):
+        return self._got(self._pipe.get(block, timeout))
+
+    def get_nowait(self):
+        try:
+            return self._got(self._pipe.get_nowait())
+        except queue.Empty:
+            return None
+
+    def get_view(self, copy=False, block=True, timeout=None):
+        # Queue returns own objects, copy is not needed
+        try:
+            return self._got(self._pipe.get(block, timeout))
+        except queue.Empty:
+            return None
+
     def clear(self):
+        self.written = 0
         while self.qsize():
             try:
                 self._pipe.get_nowait()
             except queue.Empty:
                 pass
+        self._counters[0] = self._counters[1] = 0
 
     def close(self):
         pass
@@ -100,26 +347,131 @@ class _StreamPipe:
     def tell():
         return 0
 
+    @staticmethod
+    def fileno():
+        return None
+
+    def notify(self):
+        pass
+
+    def destroy(self):
+        pass
+
+
+def _stream_pipe(is_multiprocessing, is_stream, abort, watermarks=None):
+    # Shared memory ring for processes, queue as fallback.
+    # Blocked mode send all data by one chunk, it may be more than ring.
+    high, low = watermarks or (None, None)
+    if is_multiprocessing and is_stream and shm_pipe.SUPPORTED:
+        return shm_pipe.SharedMemoryPipe(capacity=high or shm_pipe.SharedMemoryPipe.CAPACITY, abort=abort, low=low)
+    return _StreamPipe(is_multiprocessing=is_multiprocessing, abort=abort, high=high, low=low)
+
+
+class _SampleBuffer:
+    # One preallocated buffer reused by all callbacks, RHVoice sends a few hundred samples per callback.
+    # Only for synchronous consumers, data is overwritten by next copy.
+    SIZE = 1024 * 8
+
+    def __init__(self):
+        # Created in worker at first copy, ctypes arrays can't be pickled
+        self._buffer, self._view = None, None
+
+    def copy(self, samples, size) -> memoryview:
+        """Copy samples to the buffer, view is valid until next copy."""
+        if self._buffer is None or size > len(self._buffer):
+            self._buffer = (c_char * max(size, self.SIZE))()
+            self._view = memoryview(self._buffer).cast('B')
+        memmove(self._buffer, samples, size)
+        return self._view[:size]
+
 
 class _AudioWorker:
     SAMPLE_WIDTH = 2
 
-    def __init__(self, cmd: dict, pipe: _StreamPipe):
-        self._cmd = cmd
+    def __init__(self, formats: dict, pipe: _StreamPipe, stages=()):
+        # Resolved formats, see encoders.resolve
+        self._formats = formats
         self._stream = pipe
+        # Default postprocess stages
+        self._stages = stages
         self._wave = None
         self._starting = False
+        self._scratch = _SampleBuffer()
+        self._encoder = None
+        self._resampler = None
+        self._pipeline = None
+        # Output sample rate of current request
+        self.rate = 0
 
         self.get = self._stream.get
+        self.get_view = self._stream.get_view
+        self.get_nowait = self._stream.get_nowait
         self.qsize = self._stream.qsize
+        self.fileno = self._stream.fileno
+        self.notify = self._stream.notify
+        self.destroy = self._stream.destroy
 
-    def start_processing(self, format_, chunk_size, rate=24000):
-        raise NotImplementedError
+    def end_stream(self):
+        # Producer is dead, finishing stream instead of it
+        self._stream.put(b'')
+
+    def start_processing(self, format_, chunk_size, rate=24000, sample_rate=None, stages=None):
+        """
+        Output in sample_rate if it set or defined by format, samples from engine are resampled before header
+        and encoders. Then postprocess stages, None - default stages of worker.
+        """
+        self._resampler = None
+        sample_rate = sample_rate or self._formats[format_].default_rate
+        if sample_rate and sample_rate != rate:
+            self._resampler = resampler.Resampler(rate, sample_rate)
+            rate = sample_rate
+        self.rate = rate
+        stages = self._stages if stages is None else stages
+        self._pipeline = postprocess.Pipeline(stages, rate) if stages else None
+        self._start_processing(format_, chunk_size, rate)
 
     def processing(self, samples, count):
+        if self._resampler is None and self._pipeline is None:
+            self._processing(samples, count)
+            return
+        data = self._scratch.copy(samples, count * self.SAMPLE_WIDTH)
+        if self._resampler is not None:
+            data = self._resampler.process(data)
+        if self._pipeline is not None and data:
+            data = self._pipeline.process(data)
+        if data:
+            self._processing(data, len(data) // self.SAMPLE_WIDTH)
+
+    def end_processing(self, cancelled=False):
+        """If cancelled, tails and queued audio are dropped and encoders stopped at once."""
+        if cancelled:
+            self._resampler, self._pipeline = None, None
+            return self._end_processing(True)
+        data = b''
+        if self._resampler is not None:
+            data, self._resampler = self._resampler.flush(), None
+        if self._pipeline is not None:
+            data = (self._pipeline.process(data) if data else b'') + self._pipeline.flush()
+            self._pipeline = None
+        if data:
+            self._processing(data, len(data) // self.SAMPLE_WIDTH)
+        return self._end_processing(False)
+
+    def sync(self):
+        """Send already encoded data, at sentence end."""
+        pass
+
+    def written(self) -> int:
+        """Bytes sent to client by current request."""
+        return self._stream.written
+
+    def _start_processing(self, format_, chunk_size, rate):
         raise NotImplementedError
 
-    def end_processing(self):
+    def _processing(self, samples, count):
+        raise NotImplementedError
+
+    def _end_processing(self, cancelled):
         raise NotImplementedError
 
 
@@ -127,42 +479,98 @@ class _AudioWorkerStream(_AudioWorker):
     POPEN_TIMEOUT = 10
     JOIN_TIMEOUT = 10
 
-    def __init__(self, cmd: dict, pipe: _StreamPipe):
-        super().__init__(cmd, pipe)
+    def __init__(self, formats: dict, pipe: _StreamPipe, stages=()):
+        super().__init__(formats, pipe, stages)
         self._in_out, self._popen = None, None
+        self._write_samples = None
+        self._encoded, self._chunk_size = None, None
+        # For formats that can't be streamed
+        self._blocked, self._blocked_worker = False, None
 
-    def start_processing(self, format_, chunk_size, rate=24000):
+    def _start_processing(self, format_, chunk_size, rate):
         self._stream.clear()
 
         self._wave, self._in_out, self._popen = None, None, None
+        info = self._formats[format_]
+        self._starting = True
 
-        if format_ != 'pcm':
-            self._wave = _WaveWrite(self._select_target(format_, chunk_size))
+        if not info.stream:
+            # Encoding after synthesis, as in blocked mode
+            if self._blocked_worker is None:
+                self._blocked_worker = _AudioWorkerBlocked(self._formats, self._stream)
+            self._blocked_worker._start_processing(format_, chunk_size, rate)
+            self._blocked = True
+            self._write_samples = self._write_blocked
+            return
+        if info.encoder:
+            # Encoding in this process, encoder writes own header
+            self._encoder = info.encoder(rate)
+            self._encoded, self._chunk_size = bytearray(), chunk_size or DEFAULT_CHUNK_SIZE
+            self._write_samples = self._write_encoded
+            return
+        target = self._select_target(info, chunk_size)
+        if info.header == 'wav':
+            self._wave = _WaveWrite(target)
             self._wave.setnchannels(1)
             self._wave.setsampwidth(self.SAMPLE_WIDTH)
             self._wave.setframerate(rate)
             self._wave.write_header()
-        self._starting = True
+        # Header has 'infinite' length and never patched, so frames are written directly to target.
+        self._write_samples = self._stream.put_samples if target is self._stream else self._write_pooled
 
-    def processing(self, samples, count):
-        data = string_at(samples, count * self.SAMPLE_WIDTH)
-        if self._wave:
-            self._wave.writeframesraw(data)
-        else:
-            self._stream.put(data)
+    def _processing(self, samples, count):
+        self._write_samples(samples, count * self.SAMPLE_WIDTH)
+
+    def _write_pooled(self, samples, size):
+        self._popen.stdin.write(self._scratch.copy(samples, size))
+
+    def _write_encoded(self, samples, size):
+        # Chunks by chunk_size, as from popen
+        self._encoded += self._encoder.encode(samples, size // self.SAMPLE_WIDTH)
+        while len(self._encoded) >= self._chunk_size:
+            self._stream.put(bytes(self._encoded[:self._chunk_size]))
+            del self._encoded[:self._chunk_size]
 
-    def end_processing(self):
+    def sync(self):
+        if self._encoder and self._encoded:
+            self._stream.put(bytes(self._encoded))
+            self._encoded.clear()
+
+    def _write_blocked(self, samples, size):
+        self._blocked_worker._processing(samples, size // self.SAMPLE_WIDTH)
+
+    def _end_processing(self, cancelled):
         if not self._starting:
             # Генерации не было, надо отпустить клиента
             self._stream.put(b'')
             return False
+        if self._blocked:
+            self._blocked, self._starting = False, False
+            return self._blocked_worker._end_processing(cancelled)
+        if cancelled:
+            # Client don't need queued audio
+            self._stream.clear()
+        if self._encoder:
+            if cancelled:
+                self._encoded.clear()
+            else:
+                self._encoded += self._encoder.flush()
+            self._encoder.close()
+            self._encoder = None
+            while self._encoded:
+                self._stream.put(bytes(self._encoded[:self._chunk_size]))
+                del self._encoded[:self._chunk_size]
+        if self._popen and cancelled:
+            self._popen.kill()
+            if self._wave:
+                self._wave.detach()
         if self._wave:
             self._wave.close()
         if self._popen:
-            self._popen.stdin.close()
             try:
+                self._popen.stdin.close()
                 self._popen.wait(self.POPEN_TIMEOUT)
-            except subprocess.TimeoutExpired:
+            except (OSError, subprocess.TimeoutExpired):
                 pass
         if self._in_out:
             self._in_out.join(timeout=self.JOIN_TIMEOUT)
@@ -173,16 +581,16 @@ class _AudioWorkerStream(_AudioWorker):
         self._starting = False
         return True
 
-    def _create_popen(self, format_):
+    def _create_popen(self, info):
         self._popen = subprocess.Popen(
-            self._cmd.get(format_),
+            info.command,
             stdout=subprocess.PIPE,
             stdin=subprocess.PIPE
         )
 
-    def _select_target(self, format_, chunk_size):
-        if format_ in self._cmd:
-            self._create_popen(format_)
+    def _select_target(self, info, chunk_size):
+        if info.command:
+            self._create_popen(info)
             self._in_out = _InOut(self._popen.stdout, self._stream, chunk_size)
             return self._popen.stdin
         else:
@@ -190,41 +598,53 @@ class _AudioWorkerStream(_AudioWorker):
 
 
 class _AudioWorkerBlocked(_AudioWorker):
-    def __init__(self, cmd: dict, pipe: _StreamPipe):
-        super().__init__(cmd, pipe)
-        self._file, self._format = None, None
+    def __init__(self, formats: dict, pipe: _StreamPipe, stages=()):
+        super().__init__(formats, pipe, stages)
+        self._file, self._info = None, None
 
-    def start_processing(self, format_, chunk_size, rate=24000):
+    def _start_processing(self, format_, chunk_size, rate):
         self._stream.clear()
 
-        self._wave, self._format, self._file = None, format_, BytesIO()
+        self._wave, self._info, self._file = None, self._formats[format_], BytesIO()
 
-        if self._format != 'pcm':
+        if self._info.encoder:
+            self._encoder = self._info.encoder(rate)
+        elif self._info.header == 'wav':
             self._wave = wave.Wave_write(self._file)
             self._wave.setnchannels(1)
             self._wave.setsampwidth(self.SAMPLE_WIDTH)
             self._wave.setframerate(rate)
         self._starting = True
 
-    def processing(self, samples, count):
-        data = string_at(samples, count * self.SAMPLE_WIDTH)
+    def _processing(self, samples, count):
+        if self._encoder:
+            self._file.write(self._encoder.encode(samples, count))
+            return
+        data = self._scratch.copy(samples, count * self.SAMPLE_WIDTH)
         if self._wave:
             self._wave.writeframesraw(data)
         else:
             self._file.write(data)
 
-    def end_processing(self):
+    def _end_processing(self, cancelled):
         if not self._starting:
             # Генерации не было, надо отпустить клиента
             self._stream.put(b'')
             return False
         if self._wave:
             self._wave.close()
-        else:
-            self._file.close()
-        if self._format in self._cmd:
+        if cancelled:
+            if self._encoder:
+                self._encoder.close()
+                self._encoder = None
+        elif self._encoder:
+            self._file.write(self._encoder.flush())
+            self._stream.put(self._encoder.finish(self._file.getvalue()))
+            self._encoder.close()
+            self._encoder = None
+        elif self._info.command:
             try:
-                self._stream.put(subprocess.check_output(self._cmd[self._format], input=self._file.getvalue()))
+                self._stream.put(subprocess.check_output(self._info.command, input=self._file.getvalue()))
             except subprocess.CalledProcessError:
                 pass
         else:
@@ -237,54 +657,128 @@ class _AudioWorkerBlocked(_AudioWorker):
 
 class _BaseTTS:
     RELEASE_TIMEOUT = 3
+    # Ready synthesis params for different sets, per worker
+    PARAMS_CACHE_SIZE = 32
 
-    def __init__(self, is_multiprocessing: bool, free, cmd: dict, allow_formats: frozenset, **kwargs):
+    def __init__(self, is_multiprocessing: bool, index: int, idle, formats: dict,
+                 stats=False, probe=None, postprocess_=(), watermarks=None, **kwargs):
         _event = multiprocessing.Event if is_multiprocessing else threading.Event
-        self._free = free
-        self._allow_formats = allow_formats
+        self._index = index
+        self._idle = idle
+        self._allow_formats = formats
         self._kwargs = kwargs.copy()
         self._is_stream = self._kwargs.pop('stream')
         self._lib_path = {} if 'lib_path' not in self._kwargs else {'lib_path': self._kwargs.pop('lib_path')}
         self._wait = _event()
         self._pipe = _Pipe(is_multiprocessing=is_multiprocessing)
+        # Boundary events of requests with events, worker to client
+        self._events = _Pipe(is_multiprocessing=is_multiprocessing)
+        self._send_events = False
         self._format = DEFAULT_FORMAT
         self._chunk_size = DEFAULT_CHUNK_SIZE
+        self._sample_rate = None
+        self._stages = None
         self._engine = None
-        _worker = _AudioWorkerStream if self._is_stream else _AudioWorkerBlocked
-        self._worker = _worker(cmd=cmd, pipe=_StreamPipe(is_multiprocessing=is_multiprocessing))
+        self._params_cache = OrderedDict()
         self._work = True
         self._client_here = _event()
         self._client_here.set()
+        # Set by client to stop current request, worker waits until client leaves
+        self._cancel = _event()
+        self._abort = _Abort(self._client_here, self._cancel)
+        _worker = _AudioWorkerStream if self._is_stream else _AudioWorkerBlocked
+        self._worker = _worker(
+            formats=formats, pipe=_stream_pipe(is_multiprocessing, self._is_stream, self._abort, watermarks),
+            stages=postprocess_,
+        )
         self._generator_work = _event()
         self._generator_work.set()
         self._still_processing = False
+        self._ready = _event()
+        # First worker send engine info to client, instead of separate test engine
+        self._probe = probe
+        # Set by supervisor in client process
+        self._crashed = _event()
+        # Engine side timings of last request, read by client process
+        self._stats = None
+        if stats:
+            size = metrics.STATS_SIZE
+            self._stats = multiprocessing.RawArray(c_double, size) if is_multiprocessing else (c_double * size)()
+        self._samples = 0
+        self._rate = 0
+        # Client side, only in client process
+        self._metrics = None
+        self._labels = None
+        self._queue_wait = None
+        self._sent = None
 
     def _engine_init(self):
         self._engine = rhvoice_proxy.Engine(**self._lib_path)
-        self._engine.init(self._speech_callback, self._sr_callback, **self._kwargs)
+        self._engine.init(self._speech_callback, self._sr_callback, event_cb=self._event_callback, **self._kwargs)
 
     def _engine_destroy(self):
         self._engine.exterminate()
         self._engine = None
 
     def _speech_callback(self, samples, count, *_):
+        self._samples += count
         self._worker.processing(samples, count)
-        return not self._client_here.is_set() and self._work
+        return self._work and not self._abort()
+
+    def _event_callback(self, kind, position, length, mark):
+        if self._send_events and not self._abort():
+            offset, written = 0, 0
+            if self._still_processing:
+                if kind == 'sentence_ends':
+                    self._worker.sync()
+                offset = self._samples * self._worker.rate // self._rate
+                # Tails of resampler and encoder are before done
+                written = self._worker.written() if kind != 'done' else float('inf')
+            # Client returns event after written bytes of audio
+            self._events.put((written, Event(kind, offset, position, length, mark)))
+        return self._work and not self._abort()
 
     def _sr_callback(self, rate, *_):
         if not self._still_processing:
             self._still_processing = True
-            self._worker.start_processing(self._format, self._chunk_size, rate)
-            self._wait.set()
+            self._rate = rate
+            self._worker.start_processing(self._format, self._chunk_size, rate, self._sample_rate, self._stages)
+            self._notify_started()
         return True
 
-    def client_here(self):
+    def _notify_started(self):
+        self._wait.set()
+        # Wake up the client waiting on the stream descriptor
+        self._worker.notify()
+
+    def client_here(self, queued=None):
+        if self._metrics is not None:
+            # Previous request is finished
+            self.collect_metrics()
+            self._queue_wait = None if queued is None else time.monotonic() - queued
+        self._cancel.clear()
         self._client_here.clear()
 
+    def client_left(self):
+        self._client_here.set()
+        # Worker may wait for space in events pipe
+        self._events.get_all()
+
+    def cancel(self):
+        """
+        Stop current request from any thread: engine stops on next samples, queued audio and encoders are dropped.
+        Worker is released when client leaves, reading client gets end of stream at once.
+        """
+        if self._client_here.is_set() or self._cancel.is_set():
+            return
+        self._cancel.set()
+        if self._metrics is not None and self._labels is not None:
+            self._metrics.inc('cancelled_total', self._labels)
+
     def busy(self):
         return not (self._client_here.is_set() and self._generator_work.is_set())
 
-    def _release_busy(self):
+    def _wait_client(self):
         # Wait while client reading data
         while not self._client_here.is_set():
             current_size = self._worker.qsize()
@@ -292,31 +786,130 @@ class _BaseTTS:
             if current_size == self._worker.qsize():
                 # Don't reading data? Client disconnected - set process as free
                 break
+
+    def _set_free(self):
         self._client_here.set()
         self._generator_work.set()
-        self._free.set()
+        self._idle.put(self._index)
 
-    def _client_request(self, text, voice, format_, chunk_size, sets):
+    def _send_request(self, text, voice, format_, chunk_size, sets):
+        try:
+            request = self._prepare_request(text, voice, format_, chunk_size, sets)
+        except Exception:
+            # Worker don't get request and don't release itself
+            self._set_free()
+            raise
+        self._pipe.put(request)
+
+    def _prepare_request(self, text, voice, format_, chunk_size, sets) -> tuple:
         if format_ not in self._allow_formats:
             raise RuntimeError('Unsupported format: {}'.format(format_))
         sets = sets or {}
         if not isinstance(sets, dict):
-            RuntimeError('Sets must be dict or None')
+            raise RuntimeError('Sets must be dict or None')
+        if sets.get('sample_rate'):
+            resampler.check_rate(sets['sample_rate'])
+        if 'postprocess' in sets:
+            sets['postprocess'] = postprocess.parse(sets['postprocess'])
         if voice:
             sets['voice_profile'] = voice
-        self._pipe.put((text, format_, chunk_size, sets))
+        if self._metrics is not None:
+            self._observe_request(format_, sets)
+        options = {key: sets[key] for key in _REQUEST_OPTIONS if key in sets}
+        try:
+            # Checked once here, worker keeps ready params by the key
+            params = rhvoice_proxy.SynthesisParams.make_key(sets)
+        except RuntimeError as e:
+            print('sets error: {}'.format(e))
+            params = ()
+        return text, format_, chunk_size, options, params
+
+    def _client_request(self, text, voice, format_, chunk_size, sets):
+        self._send_request(text, voice, format_, chunk_size, sets)
         self._wait.wait(3600)
         self._wait.clear()
+        self.check_crash()
+        if self._sent is not None:
+            self.observe_started()
+
+    def attach_metrics(self, metrics_):
+        """Client side metrics, set after worker started."""
+        self._metrics = metrics_
+        if metrics_ is not None:
+            metrics_.reset(self._index)
+
+    def collect_metrics(self):
+        if self._metrics is not None and self._labels is not None:
+            self._metrics.collect(self._index, self._stats, self._labels)
+
+    def _observe_request(self, format_, sets):
+        self._labels = (sets.get('voice_profile') or 'default', format_)
+        self._metrics.inc('requests_total', self._labels)
+        if self._queue_wait is not None:
+            self._metrics.observe('queue_wait_seconds', self._labels, self._queue_wait)
+            self._queue_wait = None
+        self._sent = time.monotonic()
+
+    def observe_started(self):
+        self._metrics.observe('start_latency_seconds', self._labels, time.monotonic() - self._sent)
+
+    def observe_chunk(self):
+        """First chunk of request received by client."""
+        self._metrics.observe('first_chunk_seconds', self._labels, time.monotonic() - self._sent)
+        self._sent = None
+
+    def check_crash(self):
+        if self._crashed.is_set():
+            if self._metrics is not None and self._labels is not None:
+                self._metrics.inc('crashes_total', self._labels)
+                # Once per request, worker is dead and has no stats
+                self._labels = None
+            raise WorkerCrashError('Engine process {} died'.format(self._index))
+
+    def crash(self):
+        """Called by supervisor when the worker process died, release a waiting client."""
+        self._crashed.set()
+        self._worker.end_stream()
+        self._wait.set()
+        self._worker.notify()
+
+    def stopped(self) -> bool:
+        return not self._work
+
+    def has_client(self) -> bool:
+        return not self._client_here.is_set()
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    def request_started(self) -> bool:
+        """Non-blocking check that the requested generation was started, for event loops."""
+        if self._wait.is_set():
+            self._wait.clear()
+            return True
+        return False
 
     @contextmanager
-    def say(self, text, voice, format_, buff, sets):
+    def say(self, text, voice, format_, buff, sets, max_latency=None, cancel=None):
+        if cancel is not None:
+            cancel.add(self.cancel)
         try:
             format_ = format_ or DEFAULT_FORMAT
-            buff = buff if self._is_stream else None
-            self._client_request(text, voice, format_, buff, sets)
-            yield self._iter_me_splitting(buff) if format_ in ['pcm', 'wav'] and buff else self._iter_me()
+            events = bool(sets and sets.get('events'))
+            if events:
+                # Left from an abandoned request
+                self._events.get_all()
+            # Blocked worker send all audio as one chunk, it split by client
+            self._client_request(text, voice, format_, buff if self._is_stream else None, sets)
+            if events:
+                yield self._iter_me_events(buff)
+            else:
+                yield self._iter_me_splitting(buff, max_latency) if buff else self._iter_me()
         finally:
-            self._client_here.set()
+            if cancel is not None:
+                cancel.remove(self.cancel)
+            self.client_left()
 
     def get(self, text, voice, format_, sets) -> bytes:
         format_ = format_ or DEFAULT_FORMAT
@@ -324,7 +917,7 @@ class _BaseTTS:
             self._client_request(text, voice, format_, DEFAULT_CHUNK_SIZE, sets)
             return b''.join(self._iter_me())
         finally:
-            self._client_here.set()
+            self.client_left()
 
     def to_file(self, filename, text, voice, format_, sets):
         try:
@@ -334,7 +927,7 @@ class _BaseTTS:
                 for chunk in self._iter_me():
                     fp.write(chunk)
         finally:
-            self._client_here.set()
+            self.client_left()
 
     def set_params(self, **kwargs):
         self._pipe.put(kwargs)
@@ -344,50 +937,130 @@ class _BaseTTS:
             chunk = self._worker.get()
             if not chunk:
                 break
+            if self._sent is not None:
+                self.observe_chunk()
+            yield chunk
+        self.check_crash()
+
+    def _iter_me_splitting(self, chunk_size, max_latency=None):
+        for chunk in _iter_splitting(self._worker.get_view, chunk_size, max_latency):
+            if self._sent is not None:
+                self.observe_chunk()
             yield chunk
+        self.check_crash()
 
-    def _iter_me_splitting(self, chunk_size):
-        buffer = b''
+    def _iter_me_events(self, chunk_size):
+        # Events came with audio size before them, chunks are cut at events
+        rechunker = _Rechunker(chunk_size) if chunk_size else None
+        pending = deque()
+        received = 0
         while True:
             chunk = self._worker.get()
+            if chunk and self._sent is not None:
+                self.observe_chunk()
+            pending.extend(self._events.get_all())
+            start = 0
+            while pending and (not chunk or pending[0][0] <= received + len(chunk)):
+                written, event = pending.popleft()
+                end = min(max(start, written - received), len(chunk))
+                yield from self._cut(rechunker, chunk[start:end])
+                start = end
+                if rechunker and rechunker.pending and (event.kind == 'sentence_ends' or not chunk):
+                    yield rechunker.flush()
+                yield event
             if not chunk:
                 break
-            buffer += chunk
-            size = len(buffer)
-            while size >= chunk_size:
-                yield buffer[:chunk_size]
-                buffer = buffer[chunk_size:]
-                size -= chunk_size
-        if buffer:
-            yield buffer
-
-    def _get_temporary_params(self, sets):
-        try:
-            return self._engine.params.copy_with(sets)
-        except Exception as e:
-            print('sets error: {}'.format(e))
-        return None
+            yield from self._cut(rechunker, chunk[start:])
+            received += len(chunk)
+        if rechunker and rechunker.pending:
+            yield rechunker.flush()
+        self.check_crash()
 
-    def _generate(self, text, format_, chunk_size, sets):
+    @staticmethod
+    def _cut(rechunker, data):
+        if rechunker:
+            yield from rechunker.feed(data)
+        elif data:
+            yield data
+
+    def _get_temporary_params(self, key):
+        # LRU of ready params, repeated combinations don't build it again
+        params = self._params_cache.get(key)
+        if params is None:
+            params = self._engine.params.copy_with_key(key)
+            self._params_cache[key] = params
+            if len(self._params_cache) > self.PARAMS_CACHE_SIZE:
+                self._params_cache.popitem(last=False)
+        else:
+            self._params_cache.move_to_end(key)
+        return params
+
+    def _generate(self, text, format_, chunk_size, options, params_key):
         self._generator_work.clear()
+        started = time.monotonic() if self._stats is not None else None
+        self._samples = 0
         self._format = format_
         self._chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
-        params = self._get_temporary_params(sets) if sets else None
+        self._sample_rate = options.get('sample_rate')
+        self._stages = options.get('postprocess')
+        self._send_events = bool(options.get('events'))
+        self._rate = 0
+        params = self._get_temporary_params(params_key) if params_key else None
         try:
             if isinstance(text, str):
                 self._engine.generate(text=text, params=params)
             elif isinstance(text, Iterable):
                 for chunk in text:
+                    if self._abort():
+                        break
                     self._engine.generate(chunk, params=params)
         except RuntimeError:
             pass
         self._still_processing = False
-        if not self._worker.end_processing():
-            self._wait.set()
-        self._release_busy()
+        synthesized = time.monotonic() if started is not None else None
+        if not self._worker.end_processing(self._abort()):
+            self._notify_started()
+        encoded = time.monotonic() if started is not None else None
+        self._wait_client()
+        if started is not None:
+            self._write_stats(started, synthesized, encoded)
+        self._set_free()
+
+    def _write_stats(self, started, synthesized, encoded):
+        now = time.monotonic()
+        stats = self._stats
+        stats[1] = self._samples / self._rate if self._rate else 0
+        stats[2] = synthesized - started
+        stats[3] = encoded - synthesized
+        stats[4] = now - encoded
+        stats[5] += now - started
+        # Last, client take stats with new sequence
+        stats[0] += 1
+
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout) -> bool:
+        return self._ready.wait(timeout)
+
+    def _send_probe(self):
+        self._probe.put({
+            'voices': self._engine.voices,
+            'voice_profiles': self._engine.voice_profiles,
+        })
 
     def run(self):
-        self._engine_init()
+        try:
+            self._engine_init()
+            if self._probe is not None:
+                self._send_probe()
+        except Exception as e:
+            if self._probe is not None:
+                self._probe.put({'error': str(e)})
+            raise
+        self._ready.set()
+        # Engine is ready, from now worker get requests
+        self._idle.put(self._index)
         try:
             while self._work:
                 data = self._pipe.get()
@@ -395,6 +1068,8 @@ class _BaseTTS:
                     break
                 if isinstance(data, dict):
                     self._engine.set_params(**data)
+                    # Built from old defaults
+                    self._params_cache.clear()
                 else:
                     self._generate(*data)
         finally:
@@ -423,62 +1098,712 @@ class ProcessTTS(_BaseTTS, multiprocessing.Process):
         _BaseTTS.__init__(self, True, *args, **kwargs)
         self.start()
 
+    def run(self):
+        try:
+            super().run()
+        finally:
+            # Shared memory views of worker process, must be released before exit
+            self._worker.destroy()
+
     def join(self, timeout=None):
         self.stop()
         super().join()
+        self._worker.destroy()
+
+
+class _ParallelSay(threading.Thread):
+    """
+    First segment streaming from own worker, others are generated as pcm on free workers at the same time.
+    All audio passes through a local audio worker in segments order - one header, one encoder and postprocess.
+    """
+    WAV_HEADER = 44
+
+    def __init__(self, owner, worker, segments, voice, format_, buff, sets, stages):
+        super().__init__()
+        self._owner = owner
+        self._worker = worker
+        self._segment = segments[0]
+        self._voice, self._format, self._buff, self._sets = voice, format_, buff, sets
+        # noinspection PyProtectedMember
+        audio = _AudioWorkerStream if owner._is_stream else _AudioWorkerBlocked
+        # noinspection PyProtectedMember
+        high, low = owner._watermarks or (None, None)
+        self._audio = audio(
+            formats=owner._allow_formats, pipe=_StreamPipe(abort=lambda: not self._work, high=high, low=low), stages=stages
+        )
+        self._odd = b''
+        # Segment error, raised to client at end of stream
+        self._error = None
+        self._work = True
+        self._cancel = _Cancel()
+        # noinspection PyProtectedMember
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(owner._workers) - 1))
+        self._futures = [self._executor.submit(self._generate, segment) for segment in segments[1:]]
+        self.start()
+
+    def _generate(self, text) -> bytes:
+        if not self._work:
+            return b''
+        # noinspection PyProtectedMember
+        return self._owner._caller().get(text, self._voice, 'pcm', self._sets)
+
+    def _feed(self, data):
+        # Samples may be split between chunks
+        data = self._odd + data
+        size = len(data) - len(data) % _AudioWorker.SAMPLE_WIDTH
+        self._odd = data[size:]
+        if size:
+            self._audio.processing(data[:size], size // _AudioWorker.SAMPLE_WIDTH)
+
+    def run(self):
+        header = b''
+        try:
+            # wav for sample rate
+            with self._worker.say(self._segment, self._voice, 'wav', None, self._sets, cancel=self._cancel) as gen:
+                for chunk in gen:
+                    if not self._work:
+                        return
+                    if len(header) < self.WAV_HEADER:
+                        header += chunk
+                        if len(header) < self.WAV_HEADER:
+                            continue
+                        rate = struct.unpack_from('<I', header, 24)[0]
+                        self._audio.start_processing(self._format, self._buff or DEFAULT_CHUNK_SIZE, rate)
+                        chunk = header[self.WAV_HEADER:]
+                    self._feed(chunk)
+            for future in self._futures:
+                if not self._work:
+                    return
+                self._feed(future.result())
+        except Exception as e:
+            self._error = e
+        finally:
+            for future in self._futures:
+                future.cancel()
+            self._executor.shutdown(wait=False)
+            self._audio.end_processing(not self._work)
+
+    def stop(self):
+        self._work = False
+        self._cancel.cancel()
+
+    def _checked(self, chunk):
+        # Audio is not complete, request failed instead of end
+        if chunk is not None and not chunk and self._error is not None:
+            raise self._error
+        return chunk
+
+    def get(self, *args, **kwargs):
+        return self._checked(self._audio.get(*args, **kwargs))
+
+    def get_view(self, *args, **kwargs):
+        return self._checked(self._audio.get_view(*args, **kwargs))
+
+    def __iter__(self):
+        while True:
+            chunk = self.get()
+            if not chunk:
+                break
+            yield chunk
+
+
+class _PoolScaler(threading.Thread):
+    # Start workers if callers are waiting, stop workers idle for a long time
+    def __init__(self, owner, idle_timeout, spawn_wait):
+        super().__init__(daemon=True)
+        self._owner = owner
+        self._idle_timeout = idle_timeout
+        self._spawn_wait = spawn_wait
+        self._event = threading.Event()
+        self._work = True
+        self.start()
+
+    def wake(self):
+        self._event.set()
+
+    def run(self):
+        # noinspection PyProtectedMember
+        dispatcher = self._owner._dispatcher
+        while self._work:
+            self._event.wait(self._idle_timeout / 2)
+            self._event.clear()
+            # Callers are waiting, check them until they get workers
+            while self._work:
+                wait = dispatcher.oldest_wait()
+                if not wait:
+                    break
+                if wait >= self._spawn_wait:
+                    # noinspection PyProtectedMember
+                    self._owner._spawn_worker()
+                time.sleep(self._spawn_wait / 2)
+            while self._work:
+                index = dispatcher.reap(self._idle_timeout)
+                if index is None:
+                    break
+                # noinspection PyProtectedMember
+                self._owner._reap_worker(index)
+
+    def stop(self):
+        self._work = False
+        self._event.set()
+        self.join()
+
+
+class _Supervisor(threading.Thread):
+    # Watch worker processes, crashed workers are replaced
+    def __init__(self, owner):
+        super().__init__(daemon=True)
+        self._owner = owner
+        self._wake_in, self._wake_out = multiprocessing.Pipe(False)
+        self._dead = []
+        self._work = True
+        self.start()
+
+    def wake(self):
+        # Workers list was changed
+        self._wake_out.send(None)
+
+    def run(self):
+        while self._work:
+            # noinspection PyProtectedMember
+            workers = {worker.sentinel: worker for worker in self._owner._workers if worker is not None}
+            # Dead workers are waiting for clients to free resources
+            timeout = 0.5 if self._dead else None
+            for ready in wait_objects(list(workers) + [self._wake_in], timeout):
+                if ready is self._wake_in:
+                    self._wake_in.recv()
+                elif not workers[ready].stopped():
+                    self._crashed(workers[ready])
+            self._cleanup()
+
+    def _crashed(self, worker):
+        # Only wait status, worker already dead
+        multiprocessing.Process.join(worker, 1)
+        if not worker.ready():
+            # Engine initialization error, restart don't help
+            print('Engine process {} failed to start, exit code {}.'.format(worker.index, worker.exitcode))
+            # noinspection PyProtectedMember
+            self._owner._drop_worker(worker)
+            worker.join()
+            return
+        print('Engine process {} died, exit code {}. Restarting.'.format(worker.index, worker.exitcode))
+        worker.crash()
+        # noinspection PyProtectedMember
+        self._owner._respawn_worker(worker)
+        self._dead.append(worker)
+
+    def _cleanup(self):
+        for worker in self._dead[:]:
+            if not worker.has_client():
+                # Client left, ring may be freed
+                worker.join()
+                self._dead.remove(worker)
+
+    def stop(self):
+        self._work = False
+        self.wake()
+        self.join()
+        for worker in self._dead:
+            worker.join()
+
+
+class _Startup(threading.Thread):
+    # Engines are initialized in parallel, wait info from first worker and readiness of all started workers
+    POLL = 0.1
+
+    def __init__(self, owner, probe, workers):
+        super().__init__(daemon=True)
+        self._owner = owner
+        self._probe = probe
+        self._workers = workers
+        # Running future can't be cancelled by user
+        owner.ready_future.set_running_or_notify_cancel()
+        self.start()
+
+    def _get_info(self, first) -> dict:
+        while True:
+            info = self._probe.get(self.POLL)
+            if info is not None:
+                return info
+            if not first.is_alive():
+                # May be sent right before exit
+                return self._probe.get(0) or {'error': 'Engine {} died at start'.format(first.index)}
+
+    def run(self):
+        # noinspection PyProtectedMember
+        future = self._owner._ready_future
+        info = self._get_info(self._workers[0])
+        # noinspection PyProtectedMember
+        self._owner._set_engine_info(info)
+        if 'error' in info:
+            future.set_exception(RuntimeError(info['error']))
+            return
+        for worker in self._workers:
+            while not worker.wait_ready(self.POLL):
+                if not worker.is_alive():
+                    future.set_exception(RuntimeError('Engine {} failed to start'.format(worker.index)))
+                    return
+        future.set_result(True)
+
+
+class _SayHandle:
+    """
+    Result of TTS.say, context manager returns it as chunks iterator.
+    cancel() stops generation from any thread, exit before the end cancels it too.
+    """
+    def __init__(self, start):
+        # start(cancel) returns context manager of chunks
+        self._start = start
+        self._cancel = _Cancel()
+        self._manager, self._chunks = None, None
+        self._done = False
+
+    def __enter__(self):
+        self._manager = self._start(self._cancel)
+        self._chunks = self._manager.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        if not self._done:
+            self._cancel.cancel()
+        return self._close(*exc)
+
+    def _close(self, *exc):
+        manager, self._manager = self._manager, None
+        return manager.__exit__(*exc) if manager is not None else False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._cancel.cancelled:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self._done = True
+                raise
+            if not self._cancel.cancelled:
+                return chunk
+        # Worker is released now, not at exit
+        self._close(None, None, None)
+        raise StopIteration
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.cancelled
+
+    def cancel(self):
+        self._cancel.cancel()
 
 
 class MultiTTS:
     TIMEOUT = 30
+    # Minimal segment size in parallel mode, in chars
+    SEGMENT_SIZE = 100
 
-    def __init__(self, count, processes, *args, **kwargs):
+    def __init__(self, count, processes, formats, cache=None,
+                 min_count=None, idle_timeout=300, spawn_wait=0.1, metrics_=False, engine_info=None, postprocess_=(),
+                 watermarks=None, **kwargs):
+        """
+        count is maximum of workers. If min_count less count, starts min_count workers, adds a new worker
+        when caller waiting longer spawn_wait and stops workers idle for idle_timeout seconds.
+        formats - resolved formats, see rhvoice_wrapper.encoders.resolve.
+        If metrics_ is True, requests timings are collected.
+        engine_info - voices and profiles known before start, it will be updated by first worker.
+        postprocess_ - parsed default postprocess stages, see rhvoice_wrapper.postprocess.
+        watermarks - (high, low) bytes of unread audio per stream, engine waits a slow reader. None - only ring size.
+        """
         if processes:
             worker = ProcessTTS
-            self._free = multiprocessing.Event()
+            idle = IdleQueue()
         else:
             worker = ThreadTTS
-            self._free = threading.Event()
-        self._workers = tuple([worker(self._free, *args, **kwargs) for _ in range(count)])
-        self._lock = threading.Lock()
+            idle = None
+        min_count = count if min_count is None else max(1, min(min_count, count))
+        self._min_count = min_count
+        self._scaler = None
+        self._dispatcher = Dispatcher(idle, on_wait=self._on_wait if min_count < count else None)
+        idle = idle or self._dispatcher
+        self._create_worker = lambda index, probe=None: worker(
+            index, idle, formats, stats=metrics_, probe=probe, postprocess_=postprocess_, watermarks=watermarks,
+            **kwargs
+        )
+        self._postprocess = postprocess_
+        self._watermarks = watermarks
+        self._metrics = metrics.Metrics() if metrics_ else None
+        self._allow_formats = formats
+        self._cache = cache
+        self._is_stream = kwargs.get('stream', True)
+        self._params_update = {}
+        self._pool_lock = threading.Lock()
+        self._engine_info = engine_info
+        self._engine_info_ready = threading.Event()
+        if engine_info is not None:
+            self._engine_info_ready.set()
+        self._ready_future = Future()
+        probe = _Probe(processes)
+        # Engines initialized in own threads or processes at the same time
+        self._workers = [
+            self._new_worker(index, probe if index == 0 else None) if index < min_count else None
+            for index in range(count)
+        ]
+        self._startup = _Startup(self, probe, self._workers[:min_count])
         self._work = True
+        self._supervisor = _Supervisor(self) if processes else None
+        if min_count < count:
+            self._scaler = _PoolScaler(self, idle_timeout, spawn_wait)
+
+    def _wake_supervisor(self):
+        if self._supervisor:
+            self._supervisor.wake()
+
+    def _on_wait(self):
+        if self._scaler:
+            self._scaler.wake()
+
+    def _spawn_worker(self):
+        with self._pool_lock:
+            if not self._work or None not in self._workers:
+                return
+            if not all(worker.ready() for worker in self._workers if worker is not None):
+                # One at time, new worker may be enough
+                return
+            index = self._workers.index(None)
+            self._start_worker(index)
+        self._wake_supervisor()
+
+    def _new_worker(self, index, probe=None):
+        worker = self._create_worker(index, probe)
+        worker.attach_metrics(self._metrics)
+        return worker
+
+    def _start_worker(self, index):
+        worker = self._new_worker(index)
+        if self._params_update:
+            worker.set_params(**self._params_update)
+        self._workers[index] = worker
+
+    def _respawn_worker(self, worker):
+        # Crashed worker replaced by new in same slot, new worker will be idle when engine ready
+        with self._pool_lock:
+            if not self._work or self._workers[worker.index] is not worker:
+                return
+            self._dispatcher.remove(worker.index)
+            self._start_worker(worker.index)
+
+    def _drop_worker(self, worker):
+        # Worker failed before engine ready, it was never idle
+        with self._pool_lock:
+            if self._workers[worker.index] is worker:
+                self._workers[worker.index] = None
+
+    def _set_engine_info(self, info: dict):
+        self._engine_info = info
+        self._engine_info_ready.set()
+
+    def _get_engine_info(self, key):
+        self._engine_info_ready.wait()
+        if 'error' in self._engine_info:
+            raise RuntimeError(self._engine_info['error'])
+        return self._engine_info[key]
+
+    @property
+    def ready_future(self) -> Future:
+        """concurrent.futures.Future, done when started engines are initialized."""
+        return self._ready_future
+
+    def wait_ready(self, timeout=None) -> bool:
+        """
+        Wait until started engines are initialized, False after timeout.
+        Raise RuntimeError if engine initialization failed.
+        """
+        if not wait([self._ready_future], timeout).done:
+            return False
+        return self._ready_future.result()
+
+    def _reap_worker(self, index):
+        # Index was taken from dispatcher - worker is idle and don't get requests
+        with self._pool_lock:
+            if not self._work or self.pool_size <= self._min_count:
+                self._dispatcher.put(index)
+                return
+            worker, self._workers[index] = self._workers[index], None
+        worker.collect_metrics()
+        worker.join()
+        self._wake_supervisor()
+
+    @property
+    def pool_size(self) -> int:
+        """Number of running workers."""
+        return sum(worker is not None for worker in self._workers)
 
-    def to_file(self, filename: str, text: str, voice=None, format_=None, sets=None):
+    def to_file(self, filename: str, text: str, voice=None, format_=None, sets=None, parallel=False,
+                sample_rate=None):
         """Generate and save audio in a file"""
-        return self._caller().to_file(filename, text, voice, format_, sets)
+        sets = _with_sample_rate(sets, sample_rate)
+        key = self._cache_key(text, voice, format_, sets)
+        if key is None and not parallel:
+            return self._retry(text, lambda worker: worker.to_file(filename, text, voice, format_, sets))
+        with open(filename, 'wb') as fp:
+            with self._say(key, text, voice, format_, None, sets, parallel) as gen:
+                for chunk in gen:
+                    fp.write(chunk)
 
-    def say(self, text: str, voice=None, format_=None, buff=DEFAULT_CHUNK_SIZE, sets=None):
+    def say(self, text: str, voice=None, format_=None, buff=DEFAULT_CHUNK_SIZE, sets=None, parallel=False,
+            sample_rate=None, max_latency=None, events=False):
         """
         Starting audio generation and returned it chunk by chunk
         with tts.say(*args, **kwargs) as gen:
             print('chunks count: ', len([print('new chunk, len: ', len(chunk)) for chunk in gen]))
+        gen.cancel() stops generation from any thread, audio not read is dropped and worker is released at once.
+        Exit before the end cancels generation too.
+        Chunks are exactly buff bytes for all formats, except the last. If buff is None chunks returned as is.
+        If max_latency is set, data waiting longer than max_latency seconds returned as a shorter chunk.
+        If parallel is True, long text split by sentences and generated on some workers at the same time.
+        If sample_rate is set, audio is resampled in worker to it, requires numpy.
+        If events is True, rhvoice_wrapper.Event of words and sentences are returned between chunks, after audio
+        before them. In stream mode encoded data and chunk are sent at each sentence end, chunk may be shorter.
+        Requests with events are not cached and not parallel, max_latency is not used.
         """
-        return self._caller().say(text, voice, format_, buff, sets)
+        sets = _with_sample_rate(sets, sample_rate)
+        if events:
+            sets = dict(sets or {}, events=True)
+            return _SayHandle(lambda cancel: self._say_supervised(text, voice, format_, buff, sets, cancel=cancel))
+        key = self._cache_key(text, voice, format_, sets)
+        return _SayHandle(
+            lambda cancel: self._say(key, text, voice, format_, buff, sets, parallel, max_latency, cancel)
+        )
 
-    def get(self, text: str, voice=None, format_=None, sets=None) -> bytes:
+    def get(self, text: str, voice=None, format_=None, sets=None, parallel=False, sample_rate=None) -> bytes:
         """Generate and returned audio as bytes"""
-        return self._caller().get(text, voice, format_, sets)
+        sets = _with_sample_rate(sets, sample_rate)
+        key = self._cache_key(text, voice, format_, sets)
+        if key is None and not parallel:
+            return self._retry(text, lambda worker: worker.get(text, voice, format_, sets))
+        with self._say(key, text, voice, format_, None, sets, parallel) as gen:
+            return b''.join(gen)
+
+    def get_many(self, items, ordered=True, max_in_flight=None):
+        """
+        Generate audio for many items, spread over all workers. Returned (item, data).
+        :param items: Iterable of text or (text, voice, format_, sets), short tuples allowed.
+        :param bool ordered: Returned in items order, otherwise as soon as generated.
+        :param int or None max_in_flight: Limit of items taken from items and not returned yet.
+        Default 2 * thread count. Identical items among them are generated once.
+        """
+        return self._batch(items, self._batch_get, 0, ordered, max_in_flight, False)
 
-    def _caller(self):
-        with self._lock:
+    def to_files(self, items, ordered=True, max_in_flight=None):
+        """
+        Same as get_many for (filename, text, voice, format_, sets), returned filename when it saved.
+        Identical items are generated once for all batch, other files are copied.
+        """
+        for item, filename in self._batch(items, self._batch_to_file, 1, ordered, max_in_flight, True):
+            if filename != item[0]:
+                shutil.copyfile(filename, item[0])
+            yield item[0]
+
+    @staticmethod
+    def _batch_args(item, text_pos):
+        if isinstance(item, str):
+            item = (item,)
+        return tuple(item) + (None,) * (text_pos + 4 - len(item))
+
+    def _batch_get(self, item):
+        return self.get(*self._batch_args(item, 0))
+
+    def _batch_to_file(self, item):
+        self.to_file(*self._batch_args(item, 1))
+        return item[0]
+
+    def _batch_key(self, item, text_pos):
+        text, voice, format_, sets = self._batch_args(item, text_pos)[text_pos:]
+        if not isinstance(text, str):
+            # Iterable generated every time
+            return object()
+        return json.dumps([text, voice, format_ or DEFAULT_FORMAT, sets], sort_keys=True, default=str)
+
+    def _batch(self, items, job, text_pos, ordered, max_in_flight, keep):
+        limit = max_in_flight or len(self._workers) * 2
+        items = iter(items)
+        futures = {}
+        # (item, key) in items order, not returned yet
+        waiting = deque()
+        executor = ThreadPoolExecutor(max_workers=len(self._workers))
+        try:
             while True:
-                self._free.clear()
-                for worker in self._workers:
-                    if not worker.busy():
-                        worker.client_here()
-                        return worker
-                if not self._free.wait(self.TIMEOUT):
-                    raise RuntimeError('Still busy')
+                while len(waiting) < limit:
+                    item = next(items, _unset)
+                    if item is _unset:
+                        break
+                    key = self._batch_key(item, text_pos)
+                    if key not in futures:
+                        futures[key] = executor.submit(job, item)
+                    waiting.append((item, key))
+                if not waiting:
+                    break
+                if ordered:
+                    item, key = waiting.popleft()
+                else:
+                    done, _ = wait({futures[key] for _, key in waiting}, return_when=FIRST_COMPLETED)
+                    item, key = next(entry for entry in waiting if futures[entry[1]] in done)
+                    waiting.remove((item, key))
+                result = futures[key].result()
+                if not keep and all(key != other for _, other in waiting):
+                    del futures[key]
+                yield item, result
+        finally:
+            for future in futures.values():
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _say(self, key, text, voice, format_, buff, sets, parallel, max_latency=None, cancel=None):
+        if key is None:
+            return self._say_worker(text, voice, format_, buff, sets, parallel, max_latency, cancel)
+        return self._say_cached(key, text, voice, format_, buff, sets, parallel, max_latency, cancel)
+
+    def _say_worker(self, text, voice, format_, buff, sets, parallel, max_latency=None, cancel=None):
+        if parallel and len(self._workers) > 1 and isinstance(text, str):
+            segments = _split_sentences(text, self.SEGMENT_SIZE)
+            if len(segments) > 1:
+                return self._say_parallel(segments, voice, format_, buff, sets, max_latency, cancel)
+        return self._say_supervised(text, voice, format_, buff, sets, max_latency, cancel)
+
+    def _retry(self, text, call):
+        # Once on other worker if engine died, iterable text can't be repeated
+        try:
+            return call(self._caller())
+        except WorkerCrashError:
+            if not isinstance(text, str):
+                raise
+        return call(self._caller())
 
-    def set_params(self, **kwargs):
+    @contextmanager
+    def _say_supervised(self, text, voice, format_, buff, sets, max_latency=None, cancel=None):
+        args = text, voice, format_, buff, sets, max_latency, cancel
+        retry = isinstance(text, str)
+        with ExitStack() as stack:
+            try:
+                gen = stack.enter_context(self._caller().say(*args))
+            except WorkerCrashError:
+                if not retry:
+                    raise
+                retry = False
+                gen = stack.enter_context(self._caller().say(*args))
+            yield self._supervised_chunks(stack, gen, retry, args)
+
+    def _supervised_chunks(self, stack, gen, retry, args):
+        sent = False
+        try:
+            for chunk in gen:
+                sent = True
+                yield chunk
+        except WorkerCrashError:
+            # Client already got a part of audio, repeat is impossible
+            if sent or not retry:
+                raise
+            yield from stack.enter_context(self._caller().say(*args))
+
+    @contextmanager
+    def _say_parallel(self, segments, voice, format_, buff, sets, max_latency=None, cancel=None):
+        format_ = format_ or DEFAULT_FORMAT
+        if format_ not in self._allow_formats:
+            raise RuntimeError('Unsupported format: {}'.format(format_))
+        stages = postprocess.parse(sets['postprocess']) if sets and 'postprocess' in sets else self._postprocess
+        # Segments are raw, trimming and normalization are for whole audio
+        sets = dict(sets or {}, postprocess=())
+        producer = _ParallelSay(
+            self, self._caller(), segments, voice, format_, buff if self._is_stream else None, sets, stages
+        )
+        if cancel is not None:
+            cancel.add(producer.stop)
+        try:
+            yield _iter_splitting(producer.get_view, buff, max_latency) if buff else iter(producer)
+        finally:
+            if cancel is not None:
+                cancel.remove(producer.stop)
+            producer.stop()
+
+    def _cache_key(self, text, voice, format_, sets):
+        return None
+
+    @contextmanager
+    def _say_cached(self, key, text, voice, format_, buff, sets, parallel, max_latency=None, cancel=None):
+        data = self._cache.get(key)
+        if data is not None:
+            # Without worker, chunks as stream would return it
+            yield self._split_cached(data, buff)
+        else:
+            with self._say_worker(text, voice, format_, buff, sets, parallel, max_latency, cancel) as gen:
+                yield self._store_cached(key, gen, cancel)
+
+    def _split_cached(self, data, buff):
+        if not buff:
+            yield data
+            return
+        for start in range(0, len(data), buff):
+            yield data[start:start + buff]
+
+    def _store_cached(self, key, gen, cancel=None):
+        chunks = []
+        for chunk in gen:
+            chunks.append(chunk)
+            yield chunk
+        # Only full audio, client may stop reading anytime
+        if chunks and not (cancel is not None and cancel.cancelled):
+            self._cache.put(key, b''.join(chunks))
+
+    def _caller(self):
+        queued = time.monotonic() if self._metrics is not None else None
+        worker = self._workers[self._dispatcher.get(self.TIMEOUT)]
+        worker.client_here(queued)
+        return worker
+
+    @property
+    def queue_info(self) -> dict:
+        """Dispatcher state: pending requests, idle workers and waiting time in seconds."""
+        return self._dispatcher.info
+
+    def metrics(self) -> dict or None:
+        """
+        Requests histograms and counters by (voice, format), gauges and workers utilization.
+        None if metrics disabled.
+        """
+        if self._metrics is None:
+            return None
         for worker in self._workers:
-            worker.set_params(**kwargs)
+            if worker is not None:
+                worker.collect_metrics()
+        info = self._dispatcher.info
+        gauges = {'queue_pending': info['pending'], 'idle_workers': info['idle'], 'pool_size': self.pool_size}
+        return self._metrics.snapshot(gauges)
+
+    def metrics_text(self) -> str:
+        """Metrics in Prometheus text exposition format, empty if metrics disabled."""
+        snapshot = self.metrics()
+        return '' if snapshot is None else metrics.to_prometheus(snapshot)
+
+    def set_params(self, **kwargs):
+        with self._pool_lock:
+            # For workers that will be started later
+            self._params_update.update(kwargs)
+            for worker in self._workers:
+                if worker is not None:
+                    worker.set_params(**kwargs)
 
     def join(self, *_):
         if not self._work:
             return
         self._work = False
-        [x.stop() for x in self._workers]
-        [x.join() for x in self._workers]
+        if self._scaler:
+            self._scaler.stop()
+        if self._supervisor:
+            self._supervisor.stop()
+        with self._pool_lock:
+            workers = [x for x in self._workers if x is not None]
+        [x.stop() for x in workers]
+        [x.join() for x in workers]
+        self._dispatcher.stop()
 
 
 class TTS(MultiTTS):
@@ -494,12 +1819,24 @@ class TTS(MultiTTS):
         'quiet': 'QUIET',
         'config_path': 'RHVOICECONFIGPATH',
         'stream': 'RHVOICESTREAM',
+        'min_threads': 'MIN_THREADS',
+        'idle_timeout': 'IDLE_TIMEOUT',
+        'spawn_wait': 'SPAWN_WAIT',
+        'metrics': 'RHVOICEMETRICS',
+        'lazy': 'RHVOICELAZY',
+        'metadata_cache': 'RHVOICEMETADATACACHE',
+        'postprocess': 'RHVOICEPOSTPROCESS',
+        'high_watermark': 'RHVOICEHIGHWATERMARK',
+        'low_watermark': 'RHVOICELOWWATERMARK',
     }
+    MIN_WATERMARK = 4096
 
     def __init__(self, threads=_unset, force_process=_unset,
                  lib_path=_unset, data_path=_unset, resources=_unset,
                  lame_path=_unset, opus_path=_unset, flac_path=_unset,
-                 quiet=_unset, config_path=_unset, stream=_unset,
+                 quiet=_unset, config_path=_unset, stream=_unset, cache=None,
+                 min_threads=_unset, idle_timeout=_unset, spawn_wait=_unset, metrics=_unset, lazy=_unset,
+                 metadata_cache=_unset, postprocess=_unset, high_watermark=_unset, low_watermark=_unset,
                  ):
         """
         :param int or bool or None threads: If equal to 1, created one thread object,
@@ -520,7 +1857,25 @@ class TTS(MultiTTS):
         Default /usr/local/etc/RHVoice.
         :param bool stream: Processing and sending chunks soon as possible,
         otherwise processing and sending only full data including length:
-        say will return one big chunk, formats other than wav and pcm will be generated much slower. Default True.
+        say will return all data at the end, formats other than wav and pcm will be generated much slower. Default True.
+        :param rhvoice_wrapper.cache.AudioCache or None cache: Cache for synthesized audio,
+        hits returned without engines. Default None.
+        :param int or None min_threads: If less than threads, pool is elastic: starts min_threads engines,
+        adds engines up to threads under load and stops idle engines. Default threads.
+        :param float or None idle_timeout: Engine idle for this time in seconds is stopped, for elastic pool.
+        Default 300.
+        :param float or None spawn_wait: New engine is started when request waiting longer, in seconds,
+        for elastic pool. Default 0.1.
+        :param bool or None metrics: Collect requests latency and throughput, see metrics(). Default False.
+        :param bool or None lazy: Don't wait engines initialization, see wait_ready(). Requests wait engines as usual,
+        voices information waits the first engine. Default False.
+        :param bool or str or None metadata_cache: Save voices, profiles and versions on disk, next time TTS
+        don't load library to get it. True - in user cache folder, str - in this folder. Default False.
+        :param str or list or None postprocess: Default postprocess stages for all requests, as
+        'trim;normalize:mode=rms', requires numpy. See rhvoice_wrapper.postprocess. Default None.
+        :param int or None high_watermark: Unread audio of one stream in bytes, when reached the engine waits until
+        client reads it to low_watermark. Blocked mode still keeps all audio. Default 1048576.
+        :param int or None low_watermark: Engine continues when unread audio is not more. Default high_watermark / 2.
         """
         envs = {}
         for key in self.PARAMS:
@@ -529,37 +1884,82 @@ class TTS(MultiTTS):
 
         envs = self._get_environs(envs)
         quiet = self._prepare_bool(envs.pop('quiet', False))
+        lazy = self._prepare_bool(envs.pop('lazy', False))
+        self._metadata_cache, self._metadata_key = self._prepare_metadata_cache(envs.pop('metadata_cache', None)), None
         stream = self._prepare_bool(envs.pop('stream', True), True)
         self._threads = self._prepare_threads(envs.pop('threads', None))
+        min_threads = envs.pop('min_threads', None)
+        pool = {
+            'min_count': self._threads if min_threads is None else self._prepare_threads(min_threads),
+            'idle_timeout': self._prepare_float(envs.pop('idle_timeout', None), 300),
+            'spawn_wait': self._prepare_float(envs.pop('spawn_wait', None), 0.1),
+            'metrics_': self._prepare_bool(envs.pop('metrics', False)),
+            'postprocess_': self._prepare_postprocess(envs.pop('postprocess', None)),
+            'watermarks': self._prepare_watermarks(envs.pop('high_watermark', None), envs.pop('low_watermark', None)),
+        }
         self._process = self._prepare_process(envs.pop('force_process', None), self._threads)
-        self._cmd = self._get_cmd(
-            quiet, stream,
-            envs.pop('lame_path', None),
-            envs.pop('opus_path', None),
-            envs.pop('flac_path', None),
-        )
-        self._formats = frozenset(['pcm', 'wav'] + [key for key in self._cmd])
+        self._formats_info = encoders.resolve(stream, self._prepare_paths(envs), quiet)
+        self._formats = frozenset(self._formats_info)
 
-        self.__test_engine(envs.copy(), quiet)
+        info = self.__load_library(envs, quiet)
         envs.update(stream=stream)
-        super().__init__(self._threads, self._process, self._cmd, self._formats, **envs)
-
-    def __test_engine(self, envs: dict, quiet: bool):
-        lib_path = {} if 'lib_path' not in envs else {'lib_path': envs.pop('lib_path')}
-        test = rhvoice_proxy.Engine(**lib_path)
-        self._api = test.api
-        self._version = test.version
+        super().__init__(
+            self._threads, self._process, self._formats_info, cache=cache, engine_info=info, **pool, **envs
+        )
+        if not lazy:
+            try:
+                self.wait_ready()
+            except RuntimeError:
+                self.join()
+                raise
+
+    def __load_library(self, envs: dict, quiet: bool) -> dict or None:
+        # Only library, engine with voices is initialized by first worker. Returned cached engine info
+        info = None
+        if self._metadata_cache is not None:
+            self._metadata_key = self.__metadata_key(envs)
+            if self._metadata_key is not None:
+                info = self._metadata_cache.get(self._metadata_key)
+        if info is not None:
+            self._api = info['api']
+            self._version = info['version']
+            self._params = rhvoice_proxy.SynthesisParams(tuple(int(x) for x in self._api.split('.')))
+        else:
+            lib_path = {} if 'lib_path' not in envs else {'lib_path': envs['lib_path']}
+            test = rhvoice_proxy.Engine(**lib_path)
+            self._api = test.api
+            self._version = test.version
+            self._params = test.params
         if self._version not in rhvoice_proxy.SUPPORT and not quiet:
             print(
                 'Warning! Unsupported library version, use API {}. Supported: {}, library: {}.'.format(
                     self._api, rhvoice_proxy.SUPPORT, self._version
                 )
             )
-        test.init(play_speech_cb=lambda *_: True, set_sample_rate_cb=lambda *_: True, **envs)
-        self._voices = test.voices
-        self._params = test.params
-        self._voice_profiles = test.voice_profiles
-        test.exterminate()
+        return info
+
+    @staticmethod
+    def __metadata_key(envs: dict) -> str or None:
+        # noinspection PyProtectedMember
+        lib_path = rhvoice_bindings.library_location(envs.get('lib_path') or rhvoice_proxy._LIB_PATH)
+        if lib_path is None:
+            # Unknown library file, cached info may be wrong
+            return None
+        # noinspection PyProtectedMember
+        data_path = envs.get('data_path') or rhvoice_proxy._DATA_PATH or rhvoice_proxy.Engine.DEFAULT_DATA_PATH
+        resources = envs.get('resources') or []
+        resources = [resources] if isinstance(resources, str) else list(resources)
+        config_path = envs.get('config_path') or rhvoice_proxy.Engine.DEFAULT_CONFIG_PATH
+        return MetadataCache.make_key(lib_path, data_path, resources, config_path)
+
+    def _set_engine_info(self, info: dict):
+        old = self._engine_info
+        super()._set_engine_info(info)
+        if self._metadata_key is None or 'error' in info:
+            return
+        info = dict(info, api=self._api, version=self._version)
+        if info != old:
+            self._metadata_cache.put(self._metadata_key, info)
 
     @property
     def formats(self) -> frozenset:
@@ -575,11 +1975,11 @@ class TTS(MultiTTS):
 
     @property
     def voices(self) -> tuple:
-        return tuple([key for key in self._voices])
+        return tuple([key for key in self._get_engine_info('voices')])
 
     @property
     def voice_profiles(self) -> tuple:
-        return self._voice_profiles
+        return self._get_engine_info('voice_profiles')
 
     @property
     def api_version(self) -> str:
@@ -591,11 +1991,19 @@ class TTS(MultiTTS):
 
     @property
     def voices_info(self) -> dict:
-        return self._voices
+        return self._get_engine_info('voices')
+
+    @property
+    def formats_info(self) -> dict:
+        return self._formats_info.copy()
 
     @property
     def cmd(self) -> dict:
-        return self._cmd
+        return {key: val.command for key, val in self._formats_info.items() if val.command}
+
+    @property
+    def cache(self):
+        return self._cache
 
     def set_params(self, **kwargs) -> bool:
         result = False
@@ -607,6 +2015,29 @@ class TTS(MultiTTS):
             super().set_params(**kwargs)
         return result
 
+    def _cache_key(self, text, voice, format_, sets):
+        if self._cache is None or not isinstance(text, str) or not isinstance(sets, (dict, type(None))):
+            return None
+        sets = dict(sets or {})
+        if voice:
+            sets['voice_profile'] = voice
+        try:
+            params = self._params.copy_with(sets).to_dict()
+        except RuntimeError:
+            # Worker generate it with default params, don't cache
+            return None
+        if sets.get('sample_rate'):
+            params['sample_rate'] = sets['sample_rate']
+        try:
+            stages = postprocess.parse(sets['postprocess']) if 'postprocess' in sets else self._postprocess
+        except RuntimeError:
+            return None
+        if stages:
+            params['postprocess'] = stages
+        # Stream and blocked wav have different headers
+        params['stream'] = bool(self._is_stream)
+        return self._cache.make_key(text, format_ or DEFAULT_FORMAT, params, self._version)
+
     def get_params(self, param=None):
         if param is None:
             return self._params.to_dict()
@@ -633,6 +2064,37 @@ class TTS(MultiTTS):
             return val
         return def_
 
+    @classmethod
+    def _prepare_metadata_cache(cls, val) -> MetadataCache or None:
+        if isinstance(val, str) and val.lower() not in ['true', 'yes', 'enable', 'false', 'no', 'disable', '']:
+            return MetadataCache(val)
+        return MetadataCache() if cls._prepare_bool(val) else None
+
+    @staticmethod
+    def _prepare_postprocess(val) -> tuple:
+        return postprocess.parse(val)
+
+    @classmethod
+    def _prepare_watermarks(cls, high, low) -> tuple:
+        try:
+            high = shm_pipe.SharedMemoryPipe.CAPACITY if high is None else int(high)
+            low = high // 2 if low is None else int(low)
+        except (TypeError, ValueError):
+            raise RuntimeError('Watermarks must be int: {}, {}'.format(high, low))
+        if high < cls.MIN_WATERMARK:
+            raise RuntimeError('high_watermark must be at least {}: {}'.format(cls.MIN_WATERMARK, high))
+        if not 0 <= low < high:
+            raise RuntimeError('low_watermark must be from 0 to less than high_watermark: {}'.format(low))
+        return high, low
+
+    @staticmethod
+    def _prepare_float(val, def_: float) -> float:
+        try:
+            val = float(val)
+        except (TypeError, ValueError):
+            return def_
+        return val if val > 0 else def_
+
     def _prepare_process(self, force_process, threads):
         return self._prepare_bool(force_process, threads > 1)
 
@@ -654,19 +2116,10 @@ class TTS(MultiTTS):
         return threads
 
     @staticmethod
-    def _get_cmd(quiet, stream, lame, opus, flac):
-        base_cmd = {
-            'mp3': [[lame or 'lame', '-t', '-hv', '--silent', '-', '-'], 'lame'],
-            'opus': [[opus or 'opusenc', '--ignorelength', '--quiet', '--discard-comments', '-', '-'], 'opus-tools'],
-            'flac': [[flac or 'flac', '--ignore-chunk-sizes', '--totally-silent', '--best', '--stdout', '-'], 'flac'],
-        }
-        cmd = {}
-
-        for key, val in base_cmd.items():
-            if shutil.which(val[0][0]):
-                cmd[key] = val[0]
-                if not stream:
-                    cmd[key].pop(1)
-            elif not quiet:
-                print('Disable {} support - {} not found. Use apt install {}'.format(key, val[0][0], val[1]))
-        return cmd
+    def _prepare_paths(envs: dict) -> dict:
+        paths = {}
+        for key, format_ in (('lame_path', 'mp3'), ('opus_path', 'opus'), ('flac_path', 'flac')):
+            path = envs.pop(key, None)
+            if path:
+                paths[format_] = path
+        return paths
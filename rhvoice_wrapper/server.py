@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+HTTP server streaming audio by chunked responses, asyncio without dependencies.
+    python3 -m rhvoice_wrapper.server --port 8080 --threads 4
+Endpoints:
+    GET or POST /say - text, voice, format, sample_rate and rate, pitch, volume (0..100, default 50)
+    from query, form or JSON body. Content-Type of response is MIME type of format;
+    GET /health - pool state as JSON, status 503 until engines are ready;
+    GET /metrics - Prometheus text, if metrics enabled.
+Connections are keep-alive, not more requests than engines are synthesized at the same time.
+Other TTS options are taken from environment, as TTS does.
+"""
+
+import argparse
+import asyncio
+import json
+from collections import namedtuple
+from urllib.parse import parse_qsl, urlsplit
+
+from rhvoice_wrapper import AsyncTTS, resampler
+from rhvoice_wrapper.cache import AudioCache
+from rhvoice_wrapper.rhvoice_wrapper import DEFAULT_CHUNK_SIZE, DEFAULT_FORMAT
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    411: 'Length Required', 413: 'Payload Too Large', 431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout',
+}
+# Names of synthesis params for rate, pitch and volume from 0 to 100
+PARAMS = {'rate': 'absolute_rate', 'pitch': 'absolute_pitch', 'volume': 'absolute_volume'}
+
+_Request = namedtuple('_Request', ('method', 'path', 'params', 'keep_alive', 'chunked'))
+
+
+class _HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or REASONS[status])
+        self.status = status
+
+
+class Server:
+    """
+    HTTP front-end for AsyncTTS, must be started in a running event loop.
+    limit - requests synthesized at the same time, others wait. Default engines count.
+    timeout - seconds for a request, from waiting the limit until the last chunk. Stream is broken after it.
+    keep_alive - seconds of waiting the next request in a connection.
+    """
+    MAX_BODY = 1024 * 1024
+    MAX_HEADER = 64 * 1024
+
+    def __init__(self, tts: AsyncTTS, host='127.0.0.1', port=8080, limit=None, timeout=60.0, keep_alive=15.0,
+                 buff=DEFAULT_CHUNK_SIZE):
+        self._tts = tts
+        self._host, self._port = host, port
+        self._limit = limit or tts.thread_count
+        self._semaphore = asyncio.Semaphore(self._limit)
+        self._active = 0
+        self._timeout = timeout
+        self._keep_alive = keep_alive
+        self._buff = buff
+        self._server = None
+        # Handlers of open connections, cancelled by close
+        self._connections = set()
+        self._routes = {'/say': self._say, '/health': self._health, '/metrics': self._metrics}
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._connect, self._host, self._port, limit=self.MAX_HEADER)
+        return self
+
+    @property
+    def port(self) -> int:
+        """Listening port, it is known after start if port is 0."""
+        return self._server.sockets[0].getsockname()[1] if self._server else self._port
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for task in self._connections:
+            task.cancel()
+        if self._connections:
+            await asyncio.wait(self._connections)
+
+    def _connect(self, reader, writer):
+        task = asyncio.ensure_future(self._handle(reader, writer))
+        self._connections.add(task)
+        task.add_done_callback(self._connections.discard)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self._keep_alive)
+                except asyncio.TimeoutError:
+                    break
+                except _HTTPError as e:
+                    await self._send(writer, e.status, str(e).encode(), 'text/plain', False)
+                    break
+                if request is None:
+                    break
+                if not await self._dispatch(request, writer):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader) -> _Request or None:
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise _HTTPError(400)
+            # Client closed keep-alive connection
+            return None
+        except asyncio.LimitOverrunError:
+            raise _HTTPError(431)
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            raise _HTTPError(400)
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                key, _, value = line.partition(':')
+                headers[key.strip().lower()] = value.strip()
+        if 'transfer-encoding' in headers:
+            raise _HTTPError(411)
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise _HTTPError(400)
+        if length > self.MAX_BODY:
+            raise _HTTPError(413)
+        body = await reader.readexactly(length) if length > 0 else b''
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        params.update(self._parse_body(body, headers.get('content-type', '')))
+        connection = headers.get('connection', '').lower()
+        http11 = version == 'HTTP/1.1'
+        keep_alive = connection != 'close' if http11 else connection == 'keep-alive'
+        return _Request(method.upper(), url.path, params, keep_alive, http11)
+
+    @staticmethod
+    def _parse_body(body: bytes, content_type: str) -> dict:
+        if not body:
+            return {}
+        try:
+            if content_type.startswith('application/json'):
+                data = json.loads(body.decode())
+                if not isinstance(data, dict):
+                    raise ValueError('must be object')
+                return data
+            return dict(parse_qsl(body.decode()))
+        except ValueError as e:
+            raise _HTTPError(400, 'Wrong body: {}'.format(e))
+
+    async def _dispatch(self, request: _Request, writer) -> bool:
+        # Returned True if connection may be used again
+        handler = self._routes.get(request.path)
+        try:
+            if handler is None:
+                raise _HTTPError(404)
+            if request.method not in ('GET', 'POST') or (request.method == 'POST' and request.path != '/say'):
+                raise _HTTPError(405)
+            return await handler(request, writer)
+        except _HTTPError as e:
+            await self._send(writer, e.status, str(e).encode(), 'text/plain', request.keep_alive)
+            return request.keep_alive
+
+    async def _send(self, writer, status, body: bytes, content_type, keep_alive):
+        writer.write(self._head(status, content_type, keep_alive, {'Content-Length': len(body)}) + body)
+        await writer.drain()
+
+    @staticmethod
+    def _head(status, content_type, keep_alive, headers) -> bytes:
+        lines = ['HTTP/1.1 {} {}'.format(status, REASONS[status]), 'Content-Type: {}'.format(content_type)]
+        lines.extend('{}: {}'.format(key, value) for key, value in headers.items())
+        lines.append('Connection: {}'.format('keep-alive' if keep_alive else 'close'))
+        return '\r\n'.join(lines + ['', '']).encode('latin-1')
+
+    def _say_args(self, params: dict) -> tuple:
+        text = params.get('text')
+        if not text or not isinstance(text, str):
+            raise _HTTPError(400, 'Text is empty')
+        format_ = params.get('format') or DEFAULT_FORMAT
+        if format_ not in self._tts.formats:
+            raise _HTTPError(400, 'Unsupported format: {}'.format(format_))
+        sets = {}
+        try:
+            for key, param in PARAMS.items():
+                if key in params:
+                    value = float(params[key])
+                    if not 0 <= value <= 100:
+                        raise ValueError('{} must be from 0 to 100'.format(key))
+                    sets[param] = (value - 50) / 50
+            if params.get('sample_rate'):
+                sets['sample_rate'] = int(params['sample_rate'])
+                resampler.check_rate(sets['sample_rate'])
+        except (TypeError, ValueError, RuntimeError) as e:
+            raise _HTTPError(400, str(e))
+        return text, params.get('voice') or None, format_, sets
+
+    async def _say(self, request: _Request, writer) -> bool:
+        text, voice, format_, sets = self._say_args(request.params)
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self._timeout
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self._timeout)
+        except asyncio.TimeoutError:
+            raise _HTTPError(503, 'Still busy')
+        self._active += 1
+        try:
+            try:
+                say = self._tts.say(text, voice, format_, self._buff, sets)
+                gen = await say.__aenter__()
+            except RuntimeError as e:
+                raise _HTTPError(503, str(e))
+            try:
+                return await self._stream(request, writer, gen, format_, deadline)
+            finally:
+                await say.__aexit__()
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+
+    async def _stream(self, request: _Request, writer, gen, format_, deadline) -> bool:
+        loop = asyncio.get_event_loop()
+        headers = {'Transfer-Encoding': 'chunked'} if request.chunked else {}
+        keep_alive = request.keep_alive and request.chunked
+        started = False
+        while True:
+            try:
+                chunk = await asyncio.wait_for(gen.__anext__(), max(0.0, deadline - loop.time()))
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                if not started:
+                    raise _HTTPError(504)
+                # Status is sent, client sees a broken stream
+                return False
+            except RuntimeError as e:
+                if not started:
+                    raise _HTTPError(500, str(e))
+                return False
+            if not started:
+                started = True
+                # noinspection PyUnresolvedReferences
+                writer.write(self._head(200, self._tts.formats_info[format_].mime, keep_alive, headers))
+            writer.write(b'%x\r\n%b\r\n' % (len(chunk), chunk) if request.chunked else chunk)
+            await writer.drain()
+        if not started:
+            writer.write(self._head(200, self._tts.formats_info[format_].mime, keep_alive, headers))
+        if request.chunked:
+            writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        return keep_alive
+
+    async def _health(self, request: _Request, writer) -> bool:
+        future = self._tts.ready_future
+        ready = future.done() and future.exception() is None
+        info = {
+            'status': 'ok' if ready else 'starting',
+            'threads': self._tts.thread_count,
+            'pool_size': self._tts.pool_size,
+            'limit': self._limit,
+            'active': self._active,
+            'queue': self._tts.queue_info,
+            'formats': sorted(self._tts.formats),
+        }
+        if ready:
+            info['voices'] = list(self._tts.voices)
+        body = json.dumps(info).encode()
+        await self._send(writer, 200 if ready else 503, body, 'application/json', request.keep_alive)
+        return request.keep_alive
+
+    async def _metrics(self, request: _Request, writer) -> bool:
+        text = self._tts.metrics_text()
+        if not text:
+            raise _HTTPError(404, 'Metrics disabled')
+        await self._send(writer, 200, text.encode(), 'text/plain; version=0.0.4', request.keep_alive)
+        return request.keep_alive
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='RHVoice wrapper HTTP server')
+    parser.add_argument('--host', default='127.0.0.1', help='Default 127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080, help='Default 8080')
+    parser.add_argument('--threads', type=int, default=None, help='Engines count. Default THREADED or 1')
+    parser.add_argument('--lib-path', default=None, help='RHVoice library, stub - without synthesis')
+    parser.add_argument('--limit', type=int, default=None, help='Requests at the same time. Default engines count')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds for a request. Default 60')
+    parser.add_argument('--keep-alive', type=float, default=15.0, help='Seconds of idle connection. Default 15')
+    parser.add_argument('--buff', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Chunk size. Default {}'.format(DEFAULT_CHUNK_SIZE))
+    parser.add_argument('--cache', type=int, default=0, help='Audio cache in memory, MiB. Default 0 - disabled')
+    parser.add_argument('--cache-path', default=None, help='Folder for disk audio cache')
+    parser.add_argument('--metrics', action='store_true', help='Enable /metrics')
+    args = parser.parse_args(args)
+
+    kwargs = {key: value for key, value in (('threads', args.threads), ('lib_path', args.lib_path)) if value}
+    if args.metrics:
+        kwargs['metrics'] = True
+    cache = None
+    if args.cache or args.cache_path:
+        cache = AudioCache(memory_size=args.cache * 1024 * 1024, path=args.cache_path)
+    tts = AsyncTTS(cache=cache, **kwargs)
+    loop = asyncio.get_event_loop()
+    server = Server(
+        tts, args.host, args.port, limit=args.limit, timeout=args.timeout, keep_alive=args.keep_alive, buff=args.buff
+    )
+    try:
+        loop.run_until_complete(server.start())
+        print('Listening on http://{}:{}'.format(args.host, server.port))
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.close())
+        tts.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import os
+import struct
+import time
+from ctypes import addressof, c_char, c_uint64, c_void_p, cast, memmove
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+# Doorbell based on a nonblocking pipe and shared memory addressing, posix only.
+SUPPORTED = shared_memory is not None and os.name == 'posix'
+
+
+class SharedMemoryPipe:
+    """
+    Lock-free single-producer/single-consumer ring buffer in shared memory.
+    The worker process writes records, the client reads them.
+    Records is [length: uint32][payload], never wrapped - a tail that does not fit is skipped.
+    Producer writes one byte to the doorbell pipe after each record, blocked consumer waiting for it.
+    """
+    CAPACITY = 1024 * 1024
+
+    _LEN = struct.Struct('I')
+    _WRITE_OFFSET = 0
+    _READ_OFFSET = 64  # Different cache lines
+    _DATA_OFFSET = 128
+    _WRAP = 0xFFFFFFFF
+
+    def __init__(self, capacity=CAPACITY, abort=None, low=None):
+        """
+        :param int capacity: Size of ring in bytes, high watermark.
+        :param abort: Callable, if it return True producer drop data instead waiting free space.
+        Slow consumer never cost data, producer waits until it reads or abort.
+        :param int or None low: Low watermark, producer waiting free space continues when unread data is less.
+        Default - when a record fits.
+        """
+        self._capacity = capacity
+        self._low = capacity if low is None else low
+        self._max_record = capacity // 4
+        self._shm = shared_memory.SharedMemory(create=True, size=self._DATA_OFFSET + capacity)
+        self._owner = os.getpid()
+        self._doorbell = multiprocessing.Pipe(False)
+        os.set_blocking(self._doorbell[1].fileno(), False)
+        self.abort = abort
+        self._pending = None
+        self._reserved = 0
+        # Bytes put by producer since clear
+        self.written = 0
+        self._attach()
+        self._set_pos(self._WRITE_OFFSET, 0)
+        self._set_pos(self._READ_OFFSET, 0)
+
+    def _attach(self):
+        self._buf = self._shm.buf
+        self._data = self._buf[self._DATA_OFFSET:self._DATA_OFFSET + self._capacity]
+        # Mapping lives until close, the address stays valid without holding an export
+        self._address = addressof(c_char.from_buffer(self._data))
+        # struct.pack_into zeroes the target before packing, positions must be a single store
+        header = addressof(c_char.from_buffer(self._buf))
+        self._positions = {
+            offset: c_uint64.from_address(header + offset) for offset in (self._WRITE_OFFSET, self._READ_OFFSET)
+        }
+        self._read_fd = self._doorbell[0].fileno()
+        self._write_fd = self._doorbell[1].fileno()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('_buf', '_data', '_positions'):
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    def _get_pos(self, offset) -> int:
+        return self._positions[offset].value
+
+    def _set_pos(self, offset, value):
+        self._positions[offset].value = value
+
+    # Producer
+
+    def put(self, data):
+        size = len(data)
+        if size > self._max_record:
+            view = memoryview(data).cast('B')
+            for start in range(0, size, self._max_record):
+                self.put(view[start:start + self._max_record])
+            return
+        self.written += size
+        phys = self._reserve(size)
+        if phys is not None:
+            self._data[phys:phys + size] = data
+            self._commit()
+
+    write = put
+
+    def put_samples(self, samples, size):
+        """Copy size bytes from a ctypes pointer directly to the ring."""
+        address = cast(samples, c_void_p).value
+        self.written += size
+        for start in range(0, size, self._max_record):
+            part = min(size - start, self._max_record)
+            phys = self._reserve(part)
+            if phys is None:
+                return
+            memmove(self._address + phys, address + start, part)
+            self._commit()
+
+    def _reserve(self, size):
+        # Return offset for payload or None if data must be dropped
+        need = self._LEN.size + size
+        write = self._get_pos(self._WRITE_OFFSET)
+        phys = write % self._capacity
+        skip = self._capacity - phys if phys + need > self._capacity else 0
+        if not self._wait_space(write, skip + need):
+            return None
+        if skip:
+            if skip >= self._LEN.size:
+                self._LEN.pack_into(self._data, phys, self._WRAP)
+            write += skip
+            phys = 0
+        self._LEN.pack_into(self._data, phys, size)
+        self._reserved = write + need
+        return phys + self._LEN.size
+
+    def _commit(self):
+        self._set_pos(self._WRITE_OFFSET, self._reserved)
+        self._ring()
+
+    def _wait_space(self, write, need) -> bool:
+        read = self._get_pos(self._READ_OFFSET)
+        if self._capacity - (write - read) >= need:
+            return True
+        sleep = 0.0005
+        while True:
+            if self.abort is not None and self.abort():
+                return False
+            time.sleep(sleep)
+            sleep = min(sleep * 2, 0.02)
+            read = self._get_pos(self._READ_OFFSET)
+            if self._capacity - (write - read) >= need and write - read <= self._low:
+                return True
+
+    def _ring(self):
+        try:
+            os.write(self._write_fd, b'\0')
+        except BlockingIOError:
+            # Doorbell already full of wakeups
+            pass
+
+    def notify(self):
+        self._ring()
+
+    def clear(self):
+        # Called by producer before generation, when consumer doesn't read.
+        self._set_pos(self._READ_OFFSET, self._get_pos(self._WRITE_OFFSET))
+        self.written = 0
+
+    def close(self):
+        pass
+
+    def flush(self):
+        pass
+
+    @staticmethod
+    def tell():
+        return 0
+
+    # Consumer
+
+    def _next_record(self):
+        read = self._get_pos(self._READ_OFFSET)
+        while read != self._get_pos(self._WRITE_OFFSET):
+            phys = read % self._capacity
+            if phys + self._LEN.size > self._capacity:
+                read += self._capacity - phys
+                continue
+            size = self._LEN.unpack_from(self._data, phys)[0]
+            if size == self._WRAP:
+                read += self._capacity - phys
+                continue
+            start = phys + self._LEN.size
+            return read, start, size
+        return read, None, 0
+
+    def _release(self):
+        if self._pending:
+            # Producer may reset read position between generations, don't turn it back
+            if self._get_pos(self._READ_OFFSET) == self._pending[0]:
+                self._set_pos(self._READ_OFFSET, self._pending[1])
+            self._pending = None
+
+    def get_view(self, copy=False, block=True, timeout=None):
+        """
+        Return next record as memoryview, valid until next read. b'' - end of stream.
+        If block is False and ring is empty, or nothing came in timeout seconds, return None.
+        """
+        self._release()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            read, start, size = self._next_record()
+            if start is not None:
+                break
+            # Skipped tails must be released too
+            self._set_pos(self._READ_OFFSET, read)
+            if not block:
+                return None
+            if deadline is not None and not self._doorbell[0].poll(max(0.0, deadline - time.monotonic())):
+                return None
+            self.drain()
+        if not size:
+            data = b''
+            self._set_pos(self._READ_OFFSET, read + self._LEN.size)
+        elif copy:
+            data = bytes(self._data[start:start + size])
+            self._set_pos(self._READ_OFFSET, read + self._LEN.size + size)
+        else:
+            data = self._data[start:start + size]
+            self._set_pos(self._READ_OFFSET, read)
+            self._pending = (read, read + self._LEN.size + size)
+        return data
+
+    def get(self) -> bytes:
+        return self.get_view(True)
+
+    def get_nowait(self):
+        return self.get_view(True, False)
+
+    def fileno(self) -> int:
+        """Descriptor became readable after new records, for event loops."""
+        return self._read_fd
+
+    def drain(self):
+        """Wait for doorbell and remove all wakeups from it."""
+        os.read(self._read_fd, 65536)
+
+    def qsize(self) -> int:
+        return self._get_pos(self._WRITE_OFFSET) - self._get_pos(self._READ_OFFSET)
+
+    def destroy(self):
+        """Release views and memory in this process, owner also removes it. Call it in each process."""
+        if self._data is None:
+            return
+        self._pending = None
+        self._data.release()
+        self._buf, self._data, self._positions = None, None, None
+        try:
+            self._shm.close()
+        except BufferError:
+            # Someone still hold a view, memory will be freed with it
+            pass
+        if self._owner != os.getpid():
+            return
+        self._shm.unlink()
+        for conn in self._doorbell:
+            conn.close()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Pure Python replacement of libRHVoice, for measuring wrapper overhead and tests without RHVoice and voices data.
+Selected by lib_path 'stub' or with options 'stub:rate=24000,samples=300,per_char=150,delay=0'.
+    rate - sample rate;
+    samples - samples per play_speech callback;
+    per_char - samples per char of text, scaled by rate params;
+    delay - seconds of sleep per callback, simulation of synthesis time.
+Generates deterministic PCM, same text and params give same audio.
+Boundary callbacks are called for sentences (ended by .!?) and words, at samples of their first and last char.
+"""
+
+import re
+import time
+from ctypes import c_short
+
+from rhvoice_wrapper.rhvoice_bindings import RHVoice_voice_info, RHVoice_voice_gender
+
+STUB = 'stub'
+VERSION = b'1.14.0'
+# name, language, gender, country
+VOICES = (
+    ('Anna', 'Russian', RHVoice_voice_gender.female, 'RU'),
+    ('Aleksandr', 'Russian', RHVoice_voice_gender.male, 'RU'),
+    ('Slt', 'English', RHVoice_voice_gender.female, 'US'),
+)
+PROFILES = ('Anna', 'Aleksandr', 'Slt', 'Anna+Slt')
+OPTIONS = {'rate': (int, 24000), 'samples': (int, 300), 'per_char': (int, 150), 'delay': (float, 0.0)}
+
+
+def is_stub(lib_path) -> bool:
+    return isinstance(lib_path, str) and (lib_path == STUB or lib_path.startswith(STUB + ':'))
+
+
+def parse_options(lib_path: str) -> dict:
+    result = {key: default for key, (_, default) in OPTIONS.items()}
+    _, _, options = lib_path.partition(':')
+    for option in options.split(','):
+        if not option:
+            continue
+        key, _, value = option.partition('=')
+        if key not in OPTIONS:
+            raise RuntimeError('Unknown stub option: {}'.format(key))
+        try:
+            result[key] = OPTIONS[key][0](value)
+        except ValueError:
+            raise RuntimeError('Wrong stub option {}: {}'.format(key, value))
+    if result['rate'] <= 0 or result['samples'] <= 0 or result['per_char'] < 0:
+        raise RuntimeError('Stub options must be positive: {}'.format(lib_path))
+    return result
+
+
+class _Engine:
+    def __init__(self, params):
+        self.callbacks = params.callbacks
+
+
+class _Message:
+    def __init__(self, engine, text, size, speed):
+        self.engine = engine
+        self.text = text
+        self.size = size
+        self.speed = speed
+
+
+class StubLibrary:
+    """Same functions as ctypes library, without C."""
+    def __init__(self, lib_path=STUB):
+        self._options = parse_options(lib_path)
+        # Set by loader
+        self.api = None
+        samples = self._options['samples']
+        # Saw, one buffer for all callbacks
+        self._buffer = (c_short * samples)(*[(x * 331) % 16000 - 8000 for x in range(samples)])
+
+    @staticmethod
+    def RHVoice_get_version() -> bytes:
+        return VERSION
+
+    @staticmethod
+    def RHVoice_new_tts_engine(params):
+        # noinspection PyProtectedMember
+        return _Engine(params._obj)
+
+    @staticmethod
+    def RHVoice_delete_tts_engine(_):
+        pass
+
+    @staticmethod
+    def RHVoice_get_number_of_voices(_) -> int:
+        return len(VOICES)
+
+    def RHVoice_get_voices(self, _) -> list:
+        info = RHVoice_voice_info(self.api or (1, 2, 0))
+        fields = [name for name, _ in info._fields_]
+        result = []
+        for name, language, gender, country in VOICES:
+            values = {'name': name.encode(), 'language': language.encode(), 'gender': gender,
+                      'country': country.encode()}
+            result.append(info(**{key: values[key] for key in fields}))
+        return result
+
+    @staticmethod
+    def RHVoice_get_number_of_voice_profiles(_) -> int:
+        return len(PROFILES)
+
+    @staticmethod
+    def RHVoice_get_voice_profiles(_) -> list:
+        return [profile.encode() for profile in PROFILES]
+
+    @staticmethod
+    def RHVoice_are_languages_compatible(*_) -> int:
+        return 1
+
+    @staticmethod
+    def RHVoice_new_message(engine, text, size, __, params, ___):
+        # noinspection PyProtectedMember
+        params = params._obj
+        speed = max(0.1, (1 + params.absolute_rate) * params.relative_rate)
+        return _Message(engine, text[:size].decode(errors='replace'), size, speed)
+
+    def _events(self, message) -> list:
+        # (sample, order, callback name, position, length), positions in chars
+        callbacks = message.engine.callbacks
+        text, per_char = message.text, self._options['per_char'] / message.speed
+
+        def at(pos):
+            return int(len(text[:pos].encode()) * per_char)
+        result = []
+        for sentence in re.finditer(r'[^.!?]*[.!?]+|[^.!?]+$', text):
+            words = list(re.finditer(r'\S+', sentence.group()))
+            if not words:
+                continue
+            start, end = sentence.start() + words[0].start(), sentence.start() + words[-1].end()
+            result.append((at(start), 0, 'sentence_starts', start, end - start))
+            for word in words:
+                result.append((at(sentence.start() + word.start()), 1, 'word_starts', sentence.start() + word.start(),
+                               len(word.group())))
+            result.append((at(end), -1, 'sentence_ends', start, end - start))
+        return [event for event in sorted(result) if getattr(callbacks, event[2], None)]
+
+    def RHVoice_speak(self, message) -> int:
+        total = int(message.size * self._options['per_char'] / message.speed)
+        if not total:
+            return 1
+        callbacks = message.engine.callbacks
+        if not callbacks.set_sample_rate(self._options['rate'], None):
+            return 0
+        samples, delay = self._options['samples'], self._options['delay']
+        events = self._events(message)
+        done = 0
+        while done < total:
+            while events and events[0][0] <= done:
+                _, _, name, position, length = events.pop(0)
+                if not getattr(callbacks, name)(position, length, None):
+                    return 0
+            # Audio is cut at events, saw continues from same place
+            offset = done % samples
+            size = min(samples - offset, total - done, *(event[0] - done for event in events[:1]))
+            if delay and not offset:
+                time.sleep(delay)
+            if not callbacks.play_speech((c_short * size).from_buffer(self._buffer, offset * 2), size, None):
+                return 0
+            done += size
+        for _, _, name, position, length in events:
+            if not getattr(callbacks, name)(position, length, None):
+                return 0
+        if getattr(callbacks, 'done', None):
+            callbacks.done(None)
+        return 1
+
+    @staticmethod
+    def RHVoice_delete_message(_):
+        pass
@@ -0,0 +1,48 @@
+import json
+import os
+import tempfile
+import unittest
+
+from rhvoice_wrapper import benchmarks
+
+
+class BenchmarksTest(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([benchmarks.percentile(values, p) for p in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual(benchmarks.percentile([7], 99), 7)
+        self.assertIsNone(benchmarks.percentile([], 50))
+
+    def test_json(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            benchmarks.main([
+                '--threads', '1,2', '--modes', 'thread,process', '--stream', 'yes,no', '--formats', 'wav,pcm,xyz',
+                '--lengths', 'short', '--buffs', '1024,4096', '--duration', '0.1', '--json', path, '--lib-path', 'stub',
+            ])
+            with open(path) as fp:
+                data = json.load(fp)
+        finally:
+            os.unlink(path)
+        self.assertIn('cpu_count', data['system'])
+        results = data['results']
+        # threads * modes * (2 buffs in stream mode + 1 without) * formats
+        self.assertEqual(len(results), 2 * 2 * 3 * 3)
+        for case in results:
+            if case['format'] == 'xyz':
+                self.assertIn('error', case)
+                continue
+            self.assertGreater(case['phrases'], 0)
+            self.assertTrue(case['sizes_stable'])
+            self.assertGreater(case['realtime_factor'], 0)
+            self.assertLessEqual(case['first_chunk_p50'], case['first_chunk_p99'])
+            workers = 'process' if case['mode'] == 'thread' else str(case['threads'] - 1)
+            rss = case['workers'][workers]['rss']
+            # None without psutil and /proc
+            if rss is not None:
+                self.assertGreater(rss, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from rhvoice_wrapper.cache import AudioCache, MetadataCache
+
+
+class AudioCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _objects_count(self):
+        return len(os.listdir(os.path.join(self.path, 'objects')))
+
+    def test_key(self):
+        params = {'voice_profile': 'Anna', 'absolute_rate': 0}
+        key = AudioCache.make_key(' Hello  world\n', 'wav', params, '1.0.0')
+        self.assertEqual(key, AudioCache.make_key('Hello world', 'wav', dict(reversed(params.items())), '1.0.0'))
+        self.assertNotEqual(key, AudioCache.make_key('Hello world', 'mp3', params, '1.0.0'))
+        self.assertNotEqual(key, AudioCache.make_key('Hello world', 'wav', params, '1.0.1'))
+        self.assertNotEqual(key, AudioCache.make_key('Hello world', 'wav', {'voice_profile': 'Elena'}, '1.0.0'))
+
+    def test_memory_lru(self):
+        cache = AudioCache(memory_size=250)
+        cache.put('a', b'a' * 100)
+        cache.put('b', b'b' * 100)
+        self.assertEqual(cache.get('a'), b'a' * 100)
+        cache.put('c', b'c' * 100)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'a' * 100)
+        info = cache.info
+        self.assertEqual((info['memory_hits'], info['misses'], info['memory_evictions']), (2, 1, 1))
+        self.assertEqual(info['memory_used'], 200)
+
+    def test_disk(self):
+        cache = AudioCache(memory_size=0, path=self.path)
+        cache.put('a', b'audio')
+        cache.put('b', b'audio')
+        # Same content saved once
+        self.assertEqual(self._objects_count(), 1)
+        cache = AudioCache(memory_size=100, path=self.path)
+        self.assertEqual(cache.info['disk_used'], 5)
+        self.assertEqual(cache.get('b'), b'audio')
+        self.assertEqual(cache.get('b'), b'audio')
+        info = cache.info
+        self.assertEqual((info['disk_hits'], info['memory_hits']), (1, 1))
+
+    def test_disk_eviction(self):
+        cache = AudioCache(memory_size=0, path=self.path, disk_size=250)
+        for number in range(3):
+            cache.put(str(number), bytes([number]) * 100)
+        self.assertEqual(cache.info['disk_evictions'], 1)
+        self.assertEqual(self._objects_count(), 2)
+        self.assertIsNone(cache.get('0'))
+        self.assertEqual(cache.get('2'), bytes([2]) * 100)
+        self.assertEqual(len(os.listdir(os.path.join(self.path, 'keys'))), 2)
+
+
+class MetadataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_key(self):
+        lib = os.path.join(self.path, 'libRHVoice.so')
+        with open(lib, 'wb') as fp:
+            fp.write(b'lib')
+        key = MetadataCache.make_key(lib, self.path, [], self.path)
+        self.assertEqual(key, MetadataCache.make_key(lib, self.path, [], self.path))
+        self.assertNotEqual(key, MetadataCache.make_key(lib, self.path, [self.path], self.path))
+        os.utime(lib, ns=(0, 0))
+        self.assertNotEqual(key, MetadataCache.make_key(lib, self.path, [], self.path))
+
+    def test_get_put(self):
+        cache = MetadataCache(self.path)
+        info = {'voices': {'anna': {'no': 0}}, 'voice_profiles': ('Anna',), 'api': '1.2.2', 'version': '1.2.3'}
+        self.assertIsNone(cache.get('key'))
+        cache.put('key', info)
+        self.assertEqual(cache.get('key'), info)
+        cache.put('key', {'voices': {}})
+        self.assertIsNone(cache.get('key'))
+
+
+if __name__ == '__main__':
+    unittest.main()
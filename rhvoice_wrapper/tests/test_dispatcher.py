@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from rhvoice_wrapper.dispatcher import Dispatcher, IdleQueue
+
+
+class DispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = Dispatcher()
+
+    def _start_waiter(self, results, number):
+        def target():
+            results[number] = self.dispatcher.get(5)
+        thread = threading.Thread(target=target)
+        thread.start()
+        # Waiting until it in queue
+        while self.dispatcher.info['pending'] < number + 1:
+            time.sleep(0.001)
+        return thread
+
+    def test_idle_first(self):
+        self.dispatcher.put(0)
+        self.dispatcher.put(1)
+        # Last idle first
+        self.assertEqual(self.dispatcher.get(0), 1)
+        self.assertEqual(self.dispatcher.get(0), 0)
+        self.assertEqual(self.dispatcher.info['idle'], 0)
+
+    def test_reap(self):
+        self.dispatcher.put(0)
+        self.dispatcher.put(1)
+        self.assertIsNone(self.dispatcher.reap(10))
+        time.sleep(0.01)
+        self.assertEqual(self.dispatcher.reap(0.01), 0)
+        self.assertEqual(self.dispatcher.get(0), 1)
+        self.assertIsNone(self.dispatcher.reap(0))
+
+    def test_on_wait(self):
+        calls = []
+        dispatcher = Dispatcher(on_wait=lambda: calls.append(dispatcher.oldest_wait()))
+        dispatcher.put(0)
+        dispatcher.get(0)
+        self.assertEqual(calls, [])
+        with self.assertRaises(RuntimeError):
+            dispatcher.get(0.01)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(dispatcher.oldest_wait(), 0)
+
+    def test_fifo(self):
+        results = {}
+        threads = [self._start_waiter(results, number) for number in range(3)]
+        for index in (10, 11, 12):
+            self.dispatcher.put(index)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {0: 10, 1: 11, 2: 12})
+        info = self.dispatcher.info
+        self.assertEqual(info['pending'], 0)
+        self.assertEqual(info['dispatched'], 3)
+        self.assertGreater(info['wait_max'], 0)
+
+    def test_timeout(self):
+        with self.assertRaises(RuntimeError):
+            self.dispatcher.get(0.01)
+        info = self.dispatcher.info
+        self.assertEqual(info['pending'], 0)
+        self.assertEqual(info['timeouts'], 1)
+        self.dispatcher.put(7)
+        self.assertEqual(self.dispatcher.info['idle'], 1)
+
+    def test_idle_queue(self):
+        idle = IdleQueue()
+        dispatcher = Dispatcher(idle)
+        idle.put(5)
+        while not dispatcher.info['idle']:
+            time.sleep(0.001)
+        self.assertEqual(dispatcher.get(0), 5)
+        dispatcher.stop()
+
+    def test_async(self):
+        async def run():
+            loop = asyncio.get_event_loop()
+            first = self.dispatcher.get_async(loop)
+            cancelled = self.dispatcher.get_async(loop)
+            last = self.dispatcher.get_async(loop)
+            cancelled.cancel()
+            await asyncio.sleep(0)
+            self.dispatcher.put(1)
+            self.dispatcher.put(2)
+            return await first, await last
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(run()), (1, 2))
+        finally:
+            loop.close()
+        self.assertEqual(self.dispatcher.info['pending'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
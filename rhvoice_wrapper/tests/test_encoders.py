@@ -0,0 +1,100 @@
+import math
+import struct
+import unittest
+from ctypes import c_short
+
+from rhvoice_wrapper import encoders
+
+
+@unittest.skipUnless(encoders.lame(), 'libmp3lame not found')
+class LameEncoderTest(unittest.TestCase):
+    def test_encode(self):
+        rate = 24000
+        samples = (c_short * rate)(*[int(10000 * math.sin(x / 10)) for x in range(rate)])
+        encoder = encoders.LameEncoder(rate)
+        try:
+            data = b''
+            # Parts as from engine callback
+            for start in range(0, rate, 300):
+                data += encoder.encode((c_short * 300).from_buffer(samples, start * 2), 300)
+            data += encoder.flush()
+        finally:
+            encoder.close()
+        self.assertGreater(len(data), 0)
+        # MPEG frame sync
+        self.assertEqual(data[0], 0xFF)
+        self.assertEqual(data[1] & 0xE0, 0xE0)
+
+    def test_formats(self):
+        self.assertIn('mp3', encoders.resolve())
+
+
+class TelephonyEncoderTest(unittest.TestCase):
+    def _encode(self, format_, values, rate=8000):
+        encoder = encoders.get_format(format_).encoder(rate)
+        try:
+            data = encoder.encode((c_short * len(values))(*values), len(values)) + encoder.flush()
+            return encoder.finish(data)
+        finally:
+            encoder.close()
+
+    def test_s16be(self):
+        self.assertEqual(self._encode('s16be', [1, -2, 0x1234]), b'\x00\x01\xff\xfe\x12\x34')
+
+    @unittest.skipUnless('ulaw' in encoders.resolve(), 'numpy not found')
+    def test_g711(self):
+        self.assertEqual(encoders.get_format('ulaw').default_rate, 8000)
+        self.assertIsNone(encoders.get_format('pcm').default_rate)
+        # G.711 silence, clipping and sign
+        self.assertEqual(self._encode('ulaw', [0, 32767, -32768, 1000, -1000]), bytes([0xFF, 0x80, 0x00, 0xCE, 0x4E]))
+        self.assertEqual(self._encode('alaw', [0, 32767, -32768, 1000, -1000]), bytes([0xD5, 0xAA, 0x2A, 0xFA, 0x7A]))
+
+    @unittest.skipUnless('ulaw_wav' in encoders.resolve(), 'numpy not found')
+    def test_wav(self):
+        encoder = encoders.get_format('alaw_wav').encoder(8000)
+        try:
+            # Header even without samples
+            stream = encoder.flush()
+        finally:
+            encoder.close()
+        self.assertEqual(len(stream), encoders.G711Encoder.HEADER_SIZE)
+        self.assertEqual(struct.unpack_from('<I', stream, 54)[0], encoders.G711Encoder.STREAM_LENGTH)
+        data = self._encode('ulaw_wav', [0] * 100, 16000)
+        self.assertEqual(len(data), 58 + 100)
+        self.assertEqual(data[:4] + data[8:16], b'RIFFWAVEfmt ')
+        # format, channels, rate, byte rate, align, bits
+        self.assertEqual(struct.unpack_from('<HHIIHH', data, 20), (7, 1, 16000, 16000, 1, 8))
+        self.assertEqual(struct.unpack_from('<I', data, 4)[0], 50 + 100)
+        self.assertEqual(struct.unpack_from('<I', data, 46)[0], 100)
+        self.assertEqual(struct.unpack_from('<I', data, 54)[0], 100)
+        self.assertEqual(data[58:], b'\xff' * 100)
+
+
+class RegistryTest(unittest.TestCase):
+    def test_resolve(self):
+        format_ = encoders.Format('test', 'audio/test', ['cat', '-u'], ['-s'], header='wav')
+        self.assertEqual(format_.resolve(True).command, ['cat', '-s', '-u'])
+        self.assertEqual(format_.resolve(False).command, ['cat', '-u'])
+        self.assertIsNone(format_.resolve(True, '/not/found/cat'))
+        # Encoder first, command if encoder not available
+        format_ = encoders.Format('test', 'audio/test', ['cat'], encoder=encoders.S16BEEncoder, header='wav')
+        self.assertEqual((format_.resolve().command, format_.resolve().header), (None, None))
+        format_.check = lambda: False
+        self.assertEqual((format_.resolve().command, format_.resolve().encoder), (['cat'], None))
+        with self.assertRaises(RuntimeError):
+            encoders.Format('test', 'audio/test', header='ogg')
+
+    def test_register(self):
+        self.assertEqual(encoders.get_format('mp3').mime, 'audio/mpeg')
+        with self.assertRaises(RuntimeError):
+            encoders.register(encoders.Format('wav', 'audio/x-wav'))
+        encoders.register(encoders.Format('test', 'audio/test'))
+        try:
+            self.assertIn('test', encoders.resolve())
+        finally:
+            encoders.unregister('test')
+        self.assertNotIn('test', encoders.registered())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from ctypes import c_double
+
+from rhvoice_wrapper.metrics import Metrics, STATS_SIZE, to_prometheus
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.labels = ('anna', 'mp3')
+
+    def test_histogram(self):
+        for value in (0.002, 0.02, 100):
+            self.metrics.observe('queue_wait_seconds', self.labels, value)
+        data = self.metrics.snapshot({})['histograms']['queue_wait_seconds'][self.labels]
+        self.assertEqual(data['count'], 3)
+        self.assertAlmostEqual(data['sum'], 100.022)
+        self.assertEqual((data['buckets'][0.001], data['buckets'][0.005], data['buckets'][30]), (0, 1, 2))
+        self.assertEqual(data['buckets'][float('inf')], 3)
+
+    def test_collect(self):
+        stats = (c_double * STATS_SIZE)()
+        self.metrics.reset(0)
+        # Nothing generated yet
+        self.metrics.collect(0, stats, self.labels)
+        stats[1:STATS_SIZE] = [2.0, 0.5, 0.1, 0.2, 0.8]
+        stats[0] = 1
+        self.metrics.collect(0, stats, self.labels)
+        self.metrics.collect(0, stats, self.labels)
+        result = self.metrics.snapshot({})
+        self.assertEqual(result['histograms']['realtime_factor'][self.labels]['sum'], 4.0)
+        self.assertEqual(result['histograms']['drain_seconds'][self.labels]['count'], 1)
+        self.assertEqual(result['counters']['audio_seconds_total'][self.labels], 2.0)
+        # New worker in same slot, busy time continues
+        self.metrics.reset(0)
+        stats = (c_double * STATS_SIZE)()
+        stats[5], stats[0] = 0.4, 1
+        self.metrics.collect(0, stats, self.labels)
+        self.assertAlmostEqual(self.metrics.snapshot({})['workers'][0]['busy_seconds'], 1.2)
+
+    def test_prometheus(self):
+        self.metrics.observe('encoder_seconds', ('an"na', 'mp3'), 0.01)
+        self.metrics.inc('requests_total', self.labels)
+        text = to_prometheus(self.metrics.snapshot({'queue_pending': 3}))
+        self.assertIn('rhvoice_encoder_seconds_bucket{voice="an\\"na",format="mp3",le="+Inf"} 1\n', text)
+        self.assertIn('rhvoice_encoder_seconds_count{voice="an\\"na",format="mp3"} 1\n', text)
+        self.assertIn('rhvoice_requests_total{voice="anna",format="mp3"} 1\n', text)
+        self.assertIn('# TYPE rhvoice_queue_pending gauge\nrhvoice_queue_pending 3\n', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import struct
+import unittest
+
+from rhvoice_wrapper import postprocess
+
+
+def _pack(samples) -> bytes:
+    return struct.pack('<{}h'.format(len(samples)), *samples)
+
+
+def _unpack(data) -> list:
+    return list(struct.unpack('<{}h'.format(len(data) // 2), data))
+
+
+def _run(stages, data, rate=1000, part=7) -> list:
+    pipeline = postprocess.Pipeline(postprocess.parse(stages), rate)
+    result = b''.join(pipeline.process(data[start:start + part * 2]) for start in range(0, len(data), part * 2))
+    return _unpack(result + pipeline.flush())
+
+
+@unittest.skipUnless(postprocess.SUPPORTED, 'numpy not found')
+class PostprocessTest(unittest.TestCase):
+    def test_parse(self):
+        stages = postprocess.parse('trim:padding=0; gain:db=-6')
+        self.assertEqual(stages[0], ('trim', {'threshold': -45.0, 'padding': 0.0, 'lookahead': 1.0}))
+        self.assertEqual(stages[1], ('gain', {'db': -6.0}))
+        self.assertEqual(postprocess.parse(stages), stages)
+        self.assertEqual(postprocess.parse(None), ())
+        for wrong in ('echo', 'gain:volume=1', 'gain:db=loud', 'normalize:mode=lufs', 'trim:padding=-1',
+                      5, [('gain', 'x')], [('gain',)], [(['gain'], {})]):
+            with self.assertRaises(RuntimeError):
+                postprocess.parse(wrong)
+
+    def test_trim(self):
+        # 10 ms padding at 1 kHz
+        data = _pack([0] * 50 + [1000] * 20 + [0] * 30 + [1000] * 20 + [0] * 50)
+        result = _run('trim:padding=0.01', data)
+        self.assertEqual(result, [0] * 10 + [1000] * 20 + [0] * 30 + [1000] * 20 + [0] * 10)
+        self.assertEqual(_run('trim:padding=0.01', data, part=1000), result)
+        self.assertEqual(_run('trim', _pack([0] * 100)), [])
+
+    def test_trim_lookahead(self):
+        # Pause longer than lookahead is shortened
+        data = _pack([1000] * 10 + [0] * 100 + [1000] * 10 + [0] * 100)
+        result = _run('trim:padding=0,lookahead=0.02', data)
+        self.assertEqual(result, [1000] * 10 + [0] * 20 + [1000] * 10)
+
+    def test_normalize(self):
+        data = _pack([1000, -2000] * 100)
+        result = _run('normalize:target=-6.0206', data)
+        self.assertAlmostEqual(max(abs(x) for x in result), 16384, delta=1)
+        result = _run('normalize:mode=rms,target=-20,lookahead=0.05', data)
+        rms = (sum(x * x for x in result) / len(result)) ** 0.5
+        self.assertAlmostEqual(rms, 32767 * 0.1, delta=5)
+
+    def test_limiter(self):
+        # Louder part after lookahead don't clip
+        data = _pack([1000] * 100 + [8000] * 100)
+        result = _run('normalize:lookahead=0.05', data)
+        self.assertLessEqual(max(result), 32767)
+        self.assertEqual(result[-1], 32767)
+
+    def test_gain(self):
+        self.assertEqual(_run('gain:db=-6.0206', _pack([1000, -1000, 30000])), [500, -500, 15000])
+        self.assertEqual(_run('gain:db=20', _pack([30000, -30000])), [32767, -32768])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import threading
+import time
+import unittest
+
+# noinspection PyProtectedMember
+from rhvoice_wrapper.rhvoice_wrapper import _Rechunker, _StreamPipe, _iter_splitting
+
+
+class RechunkerTest(unittest.TestCase):
+    def test_exact(self):
+        rechunker = _Rechunker(4)
+        chunks = []
+        for data in (b'a', b'bcdefghij', b'', b'k', b'lmnopqrstu'):
+            chunks += rechunker.feed(data)
+        self.assertEqual(chunks, [b'abcd', b'efgh', b'ijkl', b'mnop', b'qrst'])
+        self.assertEqual(rechunker.pending, 1)
+        self.assertEqual(rechunker.flush(), b'u')
+        self.assertEqual(rechunker.pending, 0)
+
+    def test_memoryview(self):
+        rechunker = _Rechunker(3)
+        self.assertEqual(rechunker.feed(memoryview(b'abcdefg')[1:]), [b'bcd', b'efg'])
+
+    def test_splitting(self):
+        pipe = _StreamPipe()
+        for data in (b'x' * 10, b'y' * 7, b''):
+            pipe.put(data)
+        self.assertEqual(list(_iter_splitting(pipe.get_view, 5)), [b'xxxxx', b'xxxxx', b'yyyyy', b'yy'])
+
+    def test_max_latency(self):
+        pipe = _StreamPipe()
+
+        def producer():
+            pipe.put(b'abc')
+            time.sleep(0.3)
+            pipe.put(b'defgh')
+            pipe.put(b'')
+        thread = threading.Thread(target=producer)
+        thread.start()
+        started = time.monotonic()
+        gen = _iter_splitting(pipe.get_view, 4, max_latency=0.05)
+        # Held data isn't waiting for a full chunk
+        self.assertEqual(next(gen), b'abc')
+        self.assertLess(time.monotonic() - started, 0.25)
+        self.assertEqual(list(gen), [b'defg', b'h'])
+        thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
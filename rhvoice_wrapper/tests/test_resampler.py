@@ -0,0 +1,52 @@
+import math
+import struct
+import unittest
+
+from rhvoice_wrapper import resampler
+
+
+def _sine(rate, count, freq=440):
+    return struct.pack('<{}h'.format(count), *[int(10000 * math.sin(2 * math.pi * freq * x / rate)) for x in range(count)])
+
+
+@unittest.skipUnless(resampler.SUPPORTED, 'numpy not found')
+class ResamplerTest(unittest.TestCase):
+    def _resample(self, src, dst, data, part):
+        r = resampler.Resampler(src, dst)
+        result = b''.join(r.process(data[start:start + part]) for start in range(0, len(data), part))
+        return result + r.flush()
+
+    def test_length_and_chunks(self):
+        data = _sine(24000, 24000)
+        for dst in (8000, 16000, 22050, 48000):
+            result = self._resample(24000, dst, data, 600)
+            self.assertEqual(len(result), dst * 2)
+            # Filter state between calls, result don't depend on chunks
+            self.assertEqual(result, self._resample(24000, dst, data, 2 * 157))
+
+    def test_sine(self):
+        result = self._resample(24000, 8000, _sine(24000, 24000), 600)
+        expected = _sine(8000, 8000)
+        count = len(result) // 2
+        # Without edges, signal starts from zeros
+        diff = max(
+            abs(a - b) for a, b in zip(struct.unpack('<{}h'.format(count), result)[100:-100],
+                                       struct.unpack('<{}h'.format(count), expected)[100:-100])
+        )
+        self.assertLess(diff, 10)
+
+    def test_alias(self):
+        # Over new Nyquist frequency
+        result = self._resample(24000, 8000, _sine(24000, 24000, 6000), 600)
+        count = len(result) // 2
+        self.assertLess(max(abs(x) for x in struct.unpack('<{}h'.format(count), result)[100:-100]), 10)
+
+    def test_check_rate(self):
+        resampler.check_rate(8000)
+        for rate in (100, 8000.0, '8000', True):
+            with self.assertRaises(RuntimeError):
+                resampler.check_rate(rate)
+
+
+if __name__ == '__main__':
+    unittest.main()
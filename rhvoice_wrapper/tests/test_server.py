@@ -0,0 +1,90 @@
+import asyncio
+import http.client
+import json
+import unittest
+
+from rhvoice_wrapper import AsyncTTS
+from rhvoice_wrapper.server import Server
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.tts = AsyncTTS(threads=1, lib_path='stub:delay=0.001', quiet=True)
+
+    def tearDown(self):
+        self.tts.join()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def _run(self, client, **kwargs):
+        # Blocking client in a thread, server in the loop
+        async def main():
+            server = await Server(self.tts, port=0, **kwargs).start()
+            try:
+                return await self.loop.run_in_executor(None, client, server.port)
+            finally:
+                await server.close()
+        return self.loop.run_until_complete(main())
+
+    @staticmethod
+    def _request(connection, method, url, body=None, headers=None):
+        connection.request(method, url, body, headers or {})
+        response = connection.getresponse()
+        return response, response.read()
+
+    def test_say(self):
+        def client(port):
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            try:
+                response, data = self._request(connection, 'GET', '/say?text=Hello&format=pcm')
+                self.assertEqual(response.status, 200)
+                self.assertEqual(response.getheader('Content-Type'), 'audio/x-raw')
+                self.assertEqual(response.getheader('Transfer-Encoding'), 'chunked')
+                self.assertEqual(len(data), 1500)
+                # Same connection
+                body = json.dumps({'text': 'Hello', 'format': 'wav', 'rate': 100})
+                response, data = self._request(
+                    connection, 'POST', '/say', body, {'Content-Type': 'application/json'}
+                )
+                self.assertEqual(response.getheader('Content-Type'), 'audio/wav')
+                self.assertEqual(len(data), 44 + 750)
+                response, data = self._request(connection, 'GET', '/say?text=Hello&format=wma')
+                self.assertEqual(response.status, 400)
+                self.assertEqual(data, b'Unsupported format: wma')
+                for url, status in (('/say?text=Hello&rate=200', 400), ('/say', 400), ('/voices', 404)):
+                    self.assertEqual(self._request(connection, 'GET', url)[0].status, status)
+                response, data = self._request(connection, 'GET', '/health')
+                self.assertEqual(response.status, 200)
+                info = json.loads(data.decode())
+                self.assertEqual((info['status'], info['limit'], info['active']), ('ok', 1, 0))
+                self.assertIn('anna', info['voices'])
+                self.assertEqual(self._request(connection, 'GET', '/metrics')[0].status, 404)
+            finally:
+                connection.close()
+        self._run(client)
+
+    def test_timeout(self):
+        def client(port):
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            try:
+                # About 7 seconds of synthesis, stream is broken
+                connection.request('GET', '/say?text={}&format=pcm'.format('Hello+world.+' * 500))
+                response = connection.getresponse()
+                self.assertEqual(response.status, 200)
+                with self.assertRaises(http.client.IncompleteRead):
+                    response.read()
+            finally:
+                connection.close()
+            # Worker is free
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            try:
+                self.assertEqual(len(self._request(connection, 'GET', '/say?text=Hello&format=pcm')[1]), 1500)
+            finally:
+                connection.close()
+        self._run(client, timeout=0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import multiprocessing
+import threading
+import time
+import unittest
+from ctypes import addressof, c_short, string_at
+
+from rhvoice_wrapper import shm_pipe
+
+
+def _producer(pipe, sizes):
+    for number, size in enumerate(sizes):
+        pipe.put(bytes([number % 256]) * size)
+    pipe.put(b'')
+
+
+@unittest.skipUnless(shm_pipe.SUPPORTED, 'shared memory pipe not supported')
+class SharedMemoryPipe(unittest.TestCase):
+    def setUp(self):
+        self.pipe = shm_pipe.SharedMemoryPipe(capacity=4096)
+
+    def tearDown(self):
+        self.pipe.destroy()
+
+    def _read_all(self, view):
+        result = []
+        while True:
+            chunk = self.pipe.get_view() if view else self.pipe.get()
+            if not chunk:
+                return result
+            result.append(bytes(chunk))
+
+    def _check_process(self, view):
+        # Many laps over ring, odd sizes for wraps and records more than max record
+        sizes = [1, 7, 100, 1000, 1023, 2000, 3, 4093, 5000] * 20
+        process = multiprocessing.Process(target=_producer, args=(self.pipe, sizes))
+        process.start()
+        try:
+            data = b''.join(self._read_all(view))
+        finally:
+            process.join()
+        expected = b''.join(bytes([number % 256]) * size for number, size in enumerate(sizes))
+        self.assertEqual(data, expected)
+        self.assertEqual(self.pipe.qsize(), 0)
+
+    def test_process_copy(self):
+        self._check_process(False)
+
+    def test_process_view(self):
+        self._check_process(True)
+
+    def test_put_samples(self):
+        samples = (c_short * 3000)(*range(3000))
+        self.pipe.put_samples(samples, 2000)
+        self.assertEqual(self.pipe.get(), string_at(samples, 1024))
+        self.assertEqual(self.pipe.get(), string_at(addressof(samples) + 1024, 976))
+
+    def test_clear(self):
+        self.pipe.put(b'old data')
+        self.pipe.put(b'')
+        self.assertGreater(self.pipe.qsize(), 0)
+        self.pipe.clear()
+        self.assertEqual(self.pipe.qsize(), 0)
+        self.pipe.put(b'new data')
+        self.assertEqual(self.pipe.get(), b'new data')
+
+    def test_abort_when_full(self):
+        self.pipe.abort = lambda: True
+        for number in range(5):
+            self.pipe.put(bytes([number]) * 1000)
+        self.assertEqual(self.pipe.qsize(), 4 * 1004)
+        for number in range(4):
+            self.assertEqual(self.pipe.get(), bytes([number]) * 1000)
+        self.assertEqual(self.pipe.qsize(), 0)
+
+    def test_low_watermark(self):
+        self.pipe.destroy()
+        self.pipe = shm_pipe.SharedMemoryPipe(capacity=4096, low=2100)
+        producer = threading.Thread(target=_producer, args=(self.pipe, [1000] * 5))
+        producer.start()
+        try:
+            time.sleep(0.1)
+            self.assertEqual(self.pipe.qsize(), 4 * 1004)
+            self.pipe.get()
+            # Free space for a record, but unread data more than low
+            time.sleep(0.1)
+            self.assertEqual(self.pipe.qsize(), 3 * 1004)
+            self.pipe.get()
+            # Last record is put after a skipped tail of ring
+            time.sleep(0.1)
+            self.assertGreater(self.pipe.qsize(), 3 * 1004)
+        finally:
+            self.assertEqual(len(self._read_all(False)), 3)
+            producer.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,390 @@
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from rhvoice_wrapper import (
+    TTS, Event, WorkerCrashError, encoders, postprocess, resampler, rhvoice_bindings, rhvoice_proxy
+)
+from rhvoice_wrapper.cache import AudioCache
+from rhvoice_wrapper.rhvoice_wrapper import _ParallelSay
+from rhvoice_wrapper.stub_engine import parse_options
+
+
+class _CountedEngine(rhvoice_proxy.Engine):
+    created = 0
+
+    def __init__(self, *args, **kwargs):
+        _CountedEngine.created += 1
+        super().__init__(*args, **kwargs)
+
+
+class StubEngineTest(unittest.TestCase):
+    def test_options(self):
+        self.assertEqual(parse_options('stub')['rate'], 24000)
+        options = parse_options('stub:rate=8000,samples=10,delay=0.5')
+        self.assertEqual((options['rate'], options['samples'], options['delay']), (8000, 10, 0.5))
+        for wrong in ('stub:speed=1', 'stub:rate=x', 'stub:samples=0'):
+            with self.assertRaises(RuntimeError):
+                parse_options(wrong)
+
+    def _check(self, tts):
+        try:
+            self.assertIn('anna', tts.voices)
+            self.assertIn('Anna+Slt', tts.voice_profiles)
+            data = tts.get('Hello world', voice='slt', format_='wav')
+            self.assertEqual(struct.unpack_from('<I', data, 24)[0], 16000)
+            # 11 chars * 150 samples per char * 2 bytes
+            self.assertEqual(len(data), 44 + 3300)
+            self.assertEqual(data, tts.get('Hello world', voice='slt', format_='wav'))
+            self.assertEqual(len(tts.get('Hello world', format_='pcm', sets={'absolute_rate': 1})), 1650)
+            with tts.say('Hello world', format_='pcm', buff=1000) as gen:
+                self.assertEqual([len(chunk) for chunk in gen], [1000, 1000, 1000, 300])
+        finally:
+            tts.join()
+
+    def test_threads(self):
+        self._check(TTS(threads=1, lib_path='stub:rate=16000,samples=100', quiet=True))
+
+    def test_processes(self):
+        self._check(TTS(threads=2, force_process=True, lib_path='stub:rate=16000', quiet=True))
+
+    def test_lazy(self):
+        tts = TTS(threads=2, lib_path='stub:delay=0.001', lazy=True, quiet=True)
+        try:
+            self.assertTrue(tts.wait_ready(10))
+            self.assertTrue(tts.ready_future.done())
+            self.assertEqual(tts.voices, ('anna', 'aleksandr', 'slt'))
+            self.assertEqual(len(tts.get('Hello', format_='pcm')), 1500)
+        finally:
+            tts.join()
+
+    def test_metadata_cache(self):
+        path = tempfile.mkdtemp()
+        try:
+            tts = TTS(threads=1, lib_path='stub', metadata_cache=path, quiet=True)
+            api = tts.api_version
+            tts.join()
+            self.assertEqual(len(os.listdir(path)), 1)
+            with mock.patch.object(rhvoice_proxy, 'Engine', _CountedEngine):
+                tts = TTS(threads=1, lib_path='stub', metadata_cache=path, quiet=True)
+                try:
+                    self.assertEqual(tts.voice_profiles, ('Anna', 'Aleksandr', 'Slt', 'Anna+Slt'))
+                    self.assertEqual(tts.api_version, api)
+                    self.assertEqual(len(tts.get('Hello', format_='pcm')), 1500)
+                finally:
+                    tts.join()
+                # Only worker, without library loading in TTS
+                self.assertEqual(_CountedEngine.created, 1)
+            shutil.rmtree(path)
+            # Library file not found, nothing cached
+            with mock.patch.object(rhvoice_bindings, 'library_location', return_value=None):
+                TTS(threads=1, lib_path='stub', metadata_cache=path, quiet=True).join()
+            self.assertFalse(os.path.exists(path) and os.listdir(path))
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    @unittest.skipUnless(resampler.SUPPORTED, 'numpy not found')
+    def test_sample_rate(self):
+        for process in (False, True):
+            tts = TTS(threads=1, lib_path='stub', force_process=process, quiet=True)
+            try:
+                # 750 samples in 24 kHz
+                self.assertEqual(len(tts.get('Hello', format_='pcm', sample_rate=8000)), 500)
+                data = tts.get('Hello', sample_rate=48000)
+                self.assertEqual(struct.unpack_from('<I', data, 24)[0], 48000)
+                self.assertEqual(len(data), 44 + 3000)
+                with self.assertRaises(RuntimeError):
+                    tts.get('Hello', sample_rate=10)
+                self.assertEqual(len(tts.get('Hello', format_='pcm')), 1500)
+            finally:
+                tts.join()
+
+    @unittest.skipUnless(postprocess.SUPPORTED, 'numpy not found')
+    def test_postprocess(self):
+        tts = TTS(threads=2, lib_path='stub', postprocess='gain:db=-6.0206', quiet=True)
+        try:
+            def peak(**kwargs):
+                data = tts.get('Hello', format_='pcm', **kwargs)
+                return max(abs(x) for x in struct.unpack('<{}h'.format(len(data) // 2), data))
+            raw = peak(sets={'postprocess': None})
+            self.assertEqual(peak(), raw // 2)
+            self.assertAlmostEqual(peak(sets={'postprocess': 'normalize:target=0'}), 32767, delta=1)
+            # Segments are raw, stages once for whole audio
+            data = tts.get('Hello. ' * 40, format_='pcm', parallel=True)
+            self.assertEqual(max(abs(x) for x in struct.unpack('<{}h'.format(len(data) // 2), data)), peak())
+            with self.assertRaises(RuntimeError):
+                tts.get('Hello', sets={'postprocess': 'echo'})
+            self.assertEqual(peak(), raw // 2)
+        finally:
+            tts.join()
+
+    @unittest.skipUnless('ulaw' in encoders.resolve(), 'numpy not found')
+    def test_telephony(self):
+        for process, stream in ((False, True), (True, False)):
+            tts = TTS(threads=1, lib_path='stub', force_process=process, stream=stream, quiet=True)
+            try:
+                # 750 samples in 24 kHz, G.711 default is 8 kHz
+                self.assertEqual(len(tts.get('Hello', format_='ulaw')), 250)
+                self.assertEqual(len(tts.get('Hello', format_='alaw', sample_rate=16000)), 500)
+                data = tts.get('Hello', format_='alaw_wav')
+                self.assertEqual(len(data), 58 + 250)
+                self.assertEqual(struct.unpack_from('<I', data, 24)[0], 8000)
+                # Exact length only if all data known
+                length = 0xFFFFFFF if stream else 250
+                self.assertEqual(struct.unpack_from('<I', data, 54)[0], length)
+                pcm = tts.get('Hello', format_='pcm')
+                self.assertEqual(tts.get('Hello', format_='s16be'), bytes(pcm[i ^ 1] for i in range(len(pcm))))
+            finally:
+                tts.join()
+
+    def test_registry(self):
+        # Raw samples through external command, not streamable in-process encoder
+        encoders.register(encoders.Format('cat', 'audio/x-raw', ['cat']))
+        encoders.register(encoders.Format('be', 'audio/L16', encoder=encoders.S16BEEncoder, stream=False))
+        try:
+            for process, stream in ((False, True), (True, False)):
+                tts = TTS(threads=1, lib_path='stub', force_process=process, stream=stream, quiet=True)
+                try:
+                    self.assertEqual(tts.formats_info['be'].mime, 'audio/L16')
+                    pcm = tts.get('Hello', format_='pcm')
+                    self.assertEqual(tts.get('Hello', format_='cat'), pcm)
+                    self.assertEqual(tts.get('Hello', format_='be'), tts.get('Hello', format_='s16be'))
+                    with tts.say('Hello', format_='be', buff=1000) as gen:
+                        self.assertEqual([len(chunk) for chunk in gen], [1000, 500])
+                finally:
+                    tts.join()
+        finally:
+            encoders.unregister('cat')
+            encoders.unregister('be')
+
+    def test_events(self):
+        text = 'Hello world. Second one!'
+        for process in (False, True):
+            tts = TTS(threads=1, lib_path='stub', force_process=process, quiet=True)
+            try:
+                with tts.say(text, format_='pcm', buff=1000, events=True) as gen:
+                    items = list(gen)
+                events = [item for item in items if isinstance(item, Event)]
+                self.assertEqual([event.kind for event in events], [
+                    'sentence_starts', 'word_starts', 'word_starts', 'sentence_ends',
+                    'sentence_starts', 'word_starts', 'word_starts', 'sentence_ends', 'done',
+                ])
+                self.assertEqual([text[event.position:event.position + event.length] for event in events[:3]],
+                                 ['Hello world.', 'Hello', 'world.'])
+                # 150 samples per char, sentence ends after 12 chars
+                self.assertEqual(events[3].offset, 1800)
+                self.assertEqual(events[-1].offset, 3600)
+                # Each event after audio before it, chunk is cut at sentence end
+                size = 0
+                for item in items:
+                    if isinstance(item, Event):
+                        self.assertLessEqual(item.offset * 2 - size, 0 if item.kind in ('sentence_ends', 'done') else 1000)
+                    else:
+                        size += len(item)
+                self.assertEqual(size, 7200)
+                self.assertEqual(len(items[items.index(events[3]) - 1]), 600)
+            finally:
+                tts.join()
+
+    def test_cancel(self):
+        # About 7 seconds of synthesis
+        text = 'Hello world. ' * 200
+        for process in (False, True):
+            tts = TTS(threads=1, lib_path='stub:delay=0.005', force_process=process, cache=AudioCache(), quiet=True)
+            try:
+                started = time.monotonic()
+                # Encoder process is stopped too, if mp3 is here
+                with tts.say(text, format_='mp3' if 'mp3' in tts.formats else 'wav') as gen:
+                    threading.Timer(0.1, gen.cancel).start()
+                    list(gen)
+                self.assertTrue(gen.cancelled)
+                # Worker is free, next request isn't waiting the text
+                self.assertEqual(len(tts.get('Hello', format_='pcm')), 1500)
+                with tts.say(text, format_='pcm', buff=1000) as gen:
+                    next(gen)
+                self.assertEqual(len(tts.get('Hello', format_='wav')), 1544)
+                self.assertLess(time.monotonic() - started, 3)
+                # Cancelled audio isn't cached
+                self.assertEqual(tts.cache.info['memory_items'], 2)
+            finally:
+                tts.join()
+
+    def test_worker_crash(self):
+        # About 1.3 seconds of synthesis
+        text = 'Hello world. ' * 20
+        tts = TTS(threads=1, lib_path='stub:delay=0.005', force_process=True, quiet=True)
+        try:
+            # noinspection PyProtectedMember
+            threading.Timer(0.3, tts._workers[0].terminate).start()
+            # Repeated on respawned worker
+            self.assertEqual(len(tts.get(text, format_='pcm')), 78000)
+            with self.assertRaises(WorkerCrashError):
+                with tts.say(text, format_='pcm', buff=1000) as gen:
+                    next(gen)
+                    # noinspection PyProtectedMember
+                    tts._workers[0].terminate()
+                    list(gen)
+            self.assertEqual(len(tts.get('Hello', format_='pcm')), 1500)
+        finally:
+            tts.join()
+
+    def test_cache_modes(self):
+        cache = AudioCache()
+        stream = TTS(threads=1, lib_path='stub', cache=cache, quiet=True)
+        blocked = TTS(threads=1, lib_path='stub', stream=False, cache=cache, quiet=True)
+        try:
+            first = stream.get('Hello', format_='wav')
+            # Blocked wav has real size in header
+            self.assertNotEqual(blocked.get('Hello', format_='wav')[:44], first[:44])
+            self.assertEqual(cache.info['memory_items'], 2)
+            self.assertEqual(stream.get('Hello', format_='wav'), first)
+            # noinspection PyProtectedMember
+            self.assertIsNone(stream._cache_key('Hello', None, 'wav', ['x']))
+        finally:
+            stream.join()
+            blocked.join()
+
+    def test_parallel_crash(self):
+        # About a second of synthesis in 5 segments
+        text = 'Hello world. ' * 35
+        tts = TTS(threads=2, lib_path='stub:delay=0.005', force_process=True, cache=AudioCache(), quiet=True)
+        try:
+            # noinspection PyProtectedMember
+            workers = list(tts._workers)
+            threading.Timer(0.3, lambda: [worker.terminate() for worker in workers]).start()
+            with self.assertRaises(WorkerCrashError):
+                tts.get(text, format_='pcm', parallel=True)
+            # Not complete audio isn't cached
+            self.assertEqual(tts.cache.info['memory_items'], 0)
+            with mock.patch.object(_ParallelSay, '_generate', side_effect=RuntimeError('Still busy')):
+                with self.assertRaises(RuntimeError):
+                    tts.get(text, format_='pcm', parallel=True)
+            self.assertEqual(tts.cache.info['memory_items'], 0)
+            self.assertEqual(len(tts.get(text, format_='pcm', parallel=True)), 135000)
+        finally:
+            tts.join()
+
+    def test_wrong_sets(self):
+        tts = TTS(threads=1, lib_path='stub', quiet=True)
+        try:
+            for sets in (['x'], {'postprocess': 5}, {'postprocess': [('gain', 'x')]}, {'sample_rate': 10}):
+                with self.assertRaises(RuntimeError):
+                    tts.get('Hello', format_='pcm', sets=sets)
+            # Worker is free
+            self.assertEqual(len(tts.get('Hello', format_='pcm')), 1500)
+        finally:
+            tts.join()
+
+    def test_params_cache(self):
+        tts = TTS(threads=1, lib_path='stub', quiet=True)
+        try:
+            # noinspection PyProtectedMember
+            cache = tts._workers[0]._params_cache
+            for _ in range(3):
+                self.assertEqual(len(tts.get('Hello', format_='pcm', sets={'absolute_rate': 1})), 750)
+            self.assertEqual(len(cache), 1)
+            params = next(iter(cache.values()))
+            tts.get('Hello', format_='pcm', sets={'absolute_rate': 1, 'postprocess': None})
+            self.assertIs(next(iter(cache.values())), params)
+            # Wrong sets generated with default params
+            self.assertEqual(len(tts.get('Hello', format_='pcm', sets={'absolute_rate': 10})), 1500)
+            tts.set_params(absolute_rate=1)
+            self.assertEqual(len(tts.get('Hello', format_='pcm', sets={'absolute_pitch': 1})), 750)
+            self.assertEqual(len(cache), 1)
+        finally:
+            tts.join()
+
+    def test_watermarks(self):
+        tts = TTS(threads=1, lib_path='stub', high_watermark=8192, quiet=True)
+        try:
+            # noinspection PyProtectedMember
+            pipe = tts._workers[0]._worker._stream
+            unread, size = [], 0
+            with tts.say('Hello world. ' * 20, format_='pcm', buff=1000) as gen:
+                for chunk in gen:
+                    size += len(chunk)
+                    # noinspection PyProtectedMember
+                    unread.append(pipe._unread())
+                    time.sleep(0.002)
+            self.assertEqual(size, 78000)
+            # Engine waits slow reader, one chunk may be over
+            self.assertLessEqual(max(unread), 8192 + 1000)
+        finally:
+            tts.join()
+        for high, low in ((1000, None), (8192, 8192), ('big', None)):
+            with self.assertRaises(RuntimeError):
+                TTS(threads=1, lib_path='stub', high_watermark=high, low_watermark=low, quiet=True)
+
+    def test_paused_reader(self):
+        for process in (False, True):
+            tts = TTS(threads=1, lib_path='stub', force_process=process, high_watermark=8192, quiet=True)
+            try:
+                with tts.say('Hello world. ' * 20, format_='pcm', buff=1000) as gen:
+                    size = len(next(gen))
+                    # Longer than any timeout, engine is waiting
+                    time.sleep(3.5)
+                    size += sum(len(chunk) for chunk in gen)
+                self.assertEqual(size, 78000)
+            finally:
+                tts.join()
+
+    def test_spawn(self):
+        # Worker objects are pickled, child releases shared memory at exit
+        script = (
+            'import multiprocessing, sys\n'
+            'multiprocessing.set_start_method("spawn")\n'
+            'from rhvoice_wrapper import TTS\n'
+            'if __name__ == "__main__":\n'
+            '    tts = TTS(threads=1, lib_path="stub", force_process=True, stream=sys.argv[1] == "1", quiet=True)\n'
+            '    print(len(tts.get("Hello", format_="pcm")))\n'
+            '    tts.join()\n'
+        )
+        for stream in ('1', '0'):
+            result = subprocess.run(
+                [sys.executable, '-c', script, stream], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60,
+                env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+            )
+            self.assertEqual((result.stdout.strip(), result.stderr), (b'1500', b''))
+
+    def test_without_numpy(self):
+        # Default install, numpy formats are disabled with message
+        script = (
+            'import sys\n'
+            'sys.modules["numpy"] = None\n'
+            'from rhvoice_wrapper import TTS\n'
+            'tts = TTS(threads=1, lib_path="stub")\n'
+            'print(len(tts.get("Hello", format_="pcm")), "ulaw" in tts.formats)\n'
+            'tts.join()\n'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+        )
+        self.assertEqual(result.stderr, b'')
+        self.assertIn(b'Disable ulaw support - requires numpy.', result.stdout)
+        self.assertEqual(result.stdout.splitlines()[-1], b'1500 False')
+
+    def test_chunks(self):
+        for process, stream in ((False, True), (True, True), (True, False)):
+            tts = TTS(threads=1, lib_path='stub', force_process=process, stream=stream, quiet=True)
+            try:
+                for format_ in sorted(tts.formats):
+                    with tts.say('Hello world ' * 10, format_=format_, buff=1000) as gen:
+                        chunks = list(gen)
+                    self.assertEqual({len(chunk) for chunk in chunks[:-1]}, {1000})
+                    # mp3 is optional, wav is always here
+                    if format_ in ('wav', 'mp3'):
+                        self.assertEqual(b''.join(chunks), tts.get('Hello world ' * 10, format_=format_))
+            finally:
+                tts.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,6 +34,17 @@ class SynthesisParams(unittest.TestCase):
         self.assertNotEqual(dict_standard, dict_ne1)
         self.assertNotEqual(dict_standard, dict_ne2)
 
+    def _test_key(self, api: tuple):
+        sets = {'absolute_volume': rhvoice_proxy.SynthesisParams.MIN_BASE, 'voice_profile': ['anna', 'slt'], 'x': 1}
+        param = rhvoice_proxy.SynthesisParams(api, {'relative_rate': 2})
+        key = rhvoice_proxy.SynthesisParams.make_key(sets)
+        self.assertEqual(key, rhvoice_proxy.SynthesisParams.make_key(dict(reversed(list(sets.items())))))
+        self.assertEqual(hash(key), hash(rhvoice_proxy.SynthesisParams.make_key(sets)))
+        self.assertDictEqual(param.copy_with_key(key).to_dict(), param.copy_with(sets).to_dict())
+        self.assertEqual(param.copy_with_key(key).get_param('relative_rate'), 2)
+        with self.assertRaises(RuntimeError):
+            rhvoice_proxy.SynthesisParams.make_key({'absolute_rate': 10})
+
     def _test_api_diff(self, api1: tuple, api2: tuple):
         dict1 = rhvoice_proxy.SynthesisParams(api1).to_dict()
         dict2 = rhvoice_proxy.SynthesisParams(api2).to_dict()
@@ -51,12 +62,17 @@ def _make():
             # noinspection PyProtectedMember
             SynthesisParams._test_api(self, api)
 
+        def fun_key(self):
+            # noinspection PyProtectedMember
+            SynthesisParams._test_key(self, api)
+
         def fun_field(self):
             # noinspection PyProtectedMember
             SynthesisParams._test_fields(self, api)
         version = str_ver(api)
         setattr(SynthesisParams, 'test_fields_{}'.format(version), fun_field)
         setattr(SynthesisParams, 'test_api_{}'.format(version), fun_api)
+        setattr(SynthesisParams, 'test_key_{}'.format(version), fun_key)
 
     api_start = rhvoice_bindings.ADAPTED[0]
     api_end = rhvoice_bindings.ADAPTED[-1]
@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 
+import asyncio
 import threading
 import time
 import traceback
 import unittest
 
-from rhvoice_wrapper import TTS
+from rhvoice_wrapper import TTS, AsyncTTS
 from rhvoice_wrapper import rhvoice_proxy
 from rhvoice_wrapper.tests.debug_callback import WaveWriteFpCallback
 
@@ -202,6 +203,43 @@ class Monolithic(unittest.TestCase):
     def step_086_processes_flac(self):
         self._test_format('flac')
 
+    def step_087_processes_parallel(self):
+        text = ' '.join([self.MSG.format(number) + '.' for number in range(10)])
+        self.assertGreater(len(self.tts.get(text, voice=self.voice, format_='pcm', parallel=True)), 0)
+        data = self.tts.get(text, voice=self.voice, format_='wav', parallel=True)
+        self.assertEqual(data[:4], b'RIFF')
+        # One header for all segments
+        self.assertEqual(data.count(b'RIFF'), 1)
+        size = say_size(self.tts.say, text=text, voice=self.voice, format_='wav', buff=1000, parallel=True)
+        self.assertEqual(size, len(data))
+
+    def step_088_processes_batch(self):
+        texts = [self.MSG.format(number % 3) for number in range(12)]
+        items = [(text, self.voice, 'wav') for text in texts]
+        result = list(self.tts.get_many(items))
+        self.assertEqual([item for item, _ in result], items)
+        sizes = {item[0]: len(data) for item, data in result}
+        self.assertEqual(len(sizes), 3)
+        unordered = list(self.tts.get_many(items, ordered=False, max_in_flight=2))
+        self.assertEqual(sorted(item for item, _ in unordered), sorted(items))
+        for item, data in unordered:
+            self.assertEqual(len(data), sizes[item[0]])
+
+    def step_089_processes_respawn(self):
+        # noinspection PyProtectedMember
+        old = list(self.tts._workers)
+        # SIGTERM on posix, TerminateProcess on windows
+        old[0].terminate()
+        end = time.perf_counter() + 10
+        # noinspection PyProtectedMember
+        while self.tts._workers[0] is old[0] and time.perf_counter() < end:
+            time.sleep(0.05)
+        # noinspection PyProtectedMember
+        self.assertIsNot(self.tts._workers[0], old[0])
+        self.assertEqual(self.tts.pool_size, len(old))
+        sizes = [x.size for x in [ThChecker(self.tts.say, {'text': self.MSG, 'voice': self.voice}) for _ in old * 2]]
+        self.assertEqual(sizes, [self.wav_size] * len(sizes))
+
     def _test_format(self, format_):
         if format_ not in self.tts.formats:
             return print('skip ', end='')
@@ -264,8 +302,76 @@ class Monolithic(unittest.TestCase):
 
         self.tts.join()
 
-        self.assertEqual(len(get1_data), 1)
-        self.assertEqual(len(get1_data[0]), self.wav_size)
+        # Big chunk from worker split by buff
+        self.assertEqual(len(get1_data), -(-self.wav_size // 12))
+        self.assertEqual({len(x) for x in get1_data[:-1]}, {12})
+        self.assertEqual(sum(len(x) for x in get1_data), self.wav_size)
+
+    def step_13_async(self):
+        async def say_size_async(buff):
+            size = 0
+            async with self.tts.say(text=self.MSG, voice=self.voice, format_='wav', buff=buff) as gen:
+                async for chunk in gen:
+                    self.assertLessEqual(len(chunk), buff)
+                    size += len(chunk)
+            return size
+
+        async def run():
+            sizes = await asyncio.gather(*[say_size_async(buff) for buff in (1000, 4096, 15000) * 3])
+            data = await self.tts.get(text=self.MSG, voice=self.voice, format_='wav')
+            return sizes, data
+
+        self.tts = AsyncTTS(threads=3, quiet=True)
+        loop = asyncio.new_event_loop()
+        try:
+            sizes, data = loop.run_until_complete(run())
+        finally:
+            loop.close()
+            self.tts.join()
+
+        self.assertEqual(sizes, [self.wav_size] * 9)
+        self.assertEqual(len(data), self.wav_size)
+
+    def step_14_elastic(self):
+        self.tts = TTS(threads=3, min_threads=1, idle_timeout=0.5, spawn_wait=0.01, quiet=True)
+        try:
+            self.assertEqual(self.tts.pool_size, 1)
+            kwargs = {'text': self.MSG * 20, 'voice': self.voice, 'format_': 'wav', 'buff': None}
+            sizes = [x.size for x in [ThChecker(self.tts.say, kwargs) for _ in range(6)]]
+            self.assertEqual(len(set(sizes)), 1)
+            self.assertGreater(self.tts.pool_size, 1)
+            end = time.perf_counter() + 10
+            while self.tts.pool_size > 1 and time.perf_counter() < end:
+                time.sleep(0.1)
+            self.assertEqual(self.tts.pool_size, 1)
+            self.assertEqual(len(self.tts.get(self.MSG, voice=self.voice)), self.wav_size)
+        finally:
+            self.tts.join()
+
+    def step_15_metrics(self):
+        self.tts = TTS(threads=2, quiet=True, metrics=True)
+        try:
+            for format_ in ('wav', 'pcm'):
+                self.tts.get(self.MSG, voice=self.voice, format_=format_)
+            with self.tts.say(self.MSG, voice=self.voice, format_='wav') as gen:
+                self.assertGreater(len(list(gen)), 0)
+            # Engine stats written before worker is free
+            end = time.perf_counter() + 10
+            while self.tts.queue_info['idle'] < 2 and time.perf_counter() < end:
+                time.sleep(0.01)
+            result = self.tts.metrics()
+            labels = (self.voice, 'wav')
+            self.assertEqual(result['counters']['requests_total'][labels], 2)
+            self.assertEqual(result['histograms']['first_chunk_seconds'][labels]['count'], 2)
+            self.assertEqual(result['histograms']['start_latency_seconds'][(self.voice, 'pcm')]['count'], 1)
+            self.assertEqual(result['histograms']['realtime_factor'][labels]['count'], 2)
+            self.assertGreater(result['counters']['audio_seconds_total'][labels], 0)
+            self.assertEqual(result['gauges']['pool_size'], 2)
+            text = self.tts.metrics_text()
+            self.assertIn('rhvoice_requests_total{{voice="{}",format="wav"}} 2'.format(self.voice), text)
+            self.assertIn('# TYPE rhvoice_first_chunk_seconds histogram', text)
+        finally:
+            self.tts.join()
 
     def _steps(self):
         for name in sorted(dir(self)):
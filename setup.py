@@ -49,6 +49,13 @@ setup(
     python_requires='>=3.6',
     extras_require={
         'rhvoice': ['rhvoice-wrapper-bin'],
+        'numpy': ['numpy'],
+    },
+    entry_points={
+        'console_scripts': [
+            'rhvoice-wrapper-benchmarks=rhvoice_wrapper.benchmarks:main',
+            'rhvoice-wrapper-server=rhvoice_wrapper.server:main',
+        ],
     },
     classifiers=[
         'Intended Audience :: Developers',